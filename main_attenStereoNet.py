@@ -23,11 +23,16 @@ import torch.optim as optim
 import cv2
 
 from torch.autograd import Variable
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, RandomSampler
 import torch.nn.functional as F
 
 from src.loaddata.data import get_training_set, load_test_data, test_transform
-from src.loaddata.dataset import get_virtual_kitti2_filelist
+from src.loaddata.batch_transform import BatchInputTransform
+from src.loaddata.prefetcher import DataPrefetcher
+from src.loaddata.read_ahead import ReadAheadSampler
+from src.loaddata.dataset import get_virtual_kitti2_filelist, get_sample_files
+from src.loaddata.manifest import Manifest
+from src.loaddata.vkt2_cache import load_vkt2_disparity
 
 from torch.utils.tensorboard import SummaryWriter
 
@@ -41,6 +46,9 @@ from src.dispColor import colormap_jet_batch_image,KT15FalseColorDisp,KT15LogCol
 import numpy as np
 import src.pfmutil as pfm
 from src.modules.embednetwork import get_embed_losses
+from src.modules.pac_autotune import pac_autotuner
+from src.modules.activation_checkpoint import set_activation_checkpointing
+from src.modules.mixed_precision import set_autocast, make_grad_scaler
 import time
 import json
 from datetime import datetime
@@ -81,8 +89,10 @@ class attenStereoNet(object):
         self.virtual_kitti2 = args.virtual_kitti2
         self.checkpoint_dir = args.checkpoint_dir
         self.log_summary_step = args.log_summary_step
-        self.isTestingMode = (str(args.mode).lower() == 'test')
+        self.isTestingMode = (str(args.mode).lower() in ['test', 'precision_report'])
         self.is_semantic = (str(args.is_semantic).lower() == 'true')
+        # the embedding loss without the im2col tensors (see get_embed_losses_fused());
+        self.embed_loss_fused = (str(args.embed_loss_fused).lower() == 'true')
         self.cost_filter_grad = (str(args.cost_filter_grad).lower() == 'true')
         self.is_quarter_size_cost_volume_gcnet = str(args.is_quarter_size_cost_volume_gcnet).lower() == 'true'
         # newly added for lr schedule, especially for DFN+PSM;
@@ -148,6 +158,10 @@ class attenStereoNet(object):
         
         if not self.isTestingMode: # training mode
             print('===> Loading datasets')
+            self.uint8_inputs = str(args.uint8_inputs).lower() == 'true'
+            if self.uint8_inputs:
+                # workers emit uint8 crops, normalized on the training device;
+                self.batch_transform = BatchInputTransform(not self.is_data_augment, self.is_data_augment)
             train_set = get_training_set(args.data_path, args.training_list, 
                     [args.crop_height, args.crop_width], 
                     args.kitti2012, args.kitti2015, args.virtual_kitti2,
@@ -155,12 +169,25 @@ class attenStereoNet(object):
                     self.is_semantic, 
                     #self.is_kt12_gray
                     self.kt12_image_mode,
-                    self.is_data_augment
+                    self.is_data_augment,
+                    args.shard_dir if args.shard_dir else None,
+                    str(args.crop_first).lower() == 'true',
+                    self.uint8_inputs,
+                    str(args.in_ram).lower() == 'true',
+                    args.io_threads,
+                    args.train_manifest if args.train_manifest else None
                     )
             
+            self.is_prefetch = str(args.is_prefetch).lower() == 'true'
+            if args.read_ahead > 0:
+                # read the files of the next samples into the page cache, in the sampler order;
+                train_sampler = ReadAheadSampler(RandomSampler(train_set), train_set, args.read_ahead)
+            else:
+                train_sampler = None
             self.training_data_loader = DataLoader(dataset=train_set, 
                     num_workers=args.threads, batch_size=args.batchSize, 
-                    shuffle=True, drop_last=True)
+                    shuffle=train_sampler is None, sampler=train_sampler, drop_last=True,
+                    pin_memory = self.is_prefetch and self.cuda)
             
             self.train_loader_len = len(self.training_data_loader)
             self.criterion = MyLoss2(thresh=3, alpha=2)
@@ -176,6 +203,9 @@ class attenStereoNet(object):
                 'is_kendall_version': str(args.is_kendall_version).lower() == 'true',
                 'is_quarter_size_cost_volume_gcnet': self.is_quarter_size_cost_volume_gcnet,
             }
+        elif self.model_name.find('DispNetC') != -1:
+            # disparities per chunk of the 1-D correlation, 0 for all at once;
+            my_kwargs = {'corr_disp_chunk': args.corr_disp_chunk}
         else:
             my_kwargs = {}
         
@@ -193,7 +223,8 @@ class attenStereoNet(object):
                 'crop_img_w': args.crop_width,
                 'isDFN': self.is_dfn,
                 'dilation': args.dilation,
-                'cost_filter_grad': self.cost_filter_grad
+                'cost_filter_grad': self.cost_filter_grad,
+                'dfn_backend': str(args.dfn_backend).lower(),
                 })
             
         elif self.model_name in ['ASN-SGA-PSM', 'ASN-SGA-DispNetC', 'ASN-SGA-GCNet']:
@@ -257,7 +288,8 @@ class attenStereoNet(object):
                     'pac_out_channels': self.pac_out_channels,
                     'dilation': args.dilation,
                     'cost_filter_grad': self.cost_filter_grad,
-                    'native_impl': str(args.pac_native_imple).lower() == 'true'
+                    'native_impl': 'auto' if str(args.pac_native_imple).lower() == 'auto' else (
+                        str(args.pac_native_imple).lower() == 'true'),
                 })
         
         else: # embedding bilateral filtering (EBF);
@@ -275,12 +307,37 @@ class attenStereoNet(object):
                     'isEmbed': self.is_embed,
                     'dilation': args.dilation,
                     'cost_filter_grad': self.cost_filter_grad,
+                    'bilateral_backend': str(args.bilateral_backend).lower(),
                 })
         
         #----------------
         # get the model
         #----------------
         self.model = AttenStereoNet(**my_kwargs)
+        if hasattr(self.model, 'cost_filter'):
+            # the cost volume slices filtered per call (see src/modules/cost_volume_filter.py);
+            self.model.cost_filter.slices_per_call = args.cost_filter_slices
+            self.model.cost_filter.memory_budget_mb = args.cost_filter_budget_mb
+        if getattr(self.model, 'embednet', None) is not None:
+            # avgConv at the resolution of each map (see embed_net.fuse_lowres());
+            self.model.embednet.lowres_fusion = str(args.embed_lowres_fusion).lower() == 'true'
+        # the winners of --pac_native_imple=auto (see src/modules/pac_autotune.py);
+        pac_autotuner.cache_path = args.pac_autotune_cache
+        if getattr(self.model, 'bifilter', None) is not None:
+            # the guide dimensions of the permutohedral lattice backend (see src/modules/permutohedral.py);
+            self.model.bifilter.lattice_guide_dims = args.lattice_guide_dims
+        # recompute the 3D cost aggregation blocks in backward (see src/modules/activation_checkpoint.py);
+        num_blocks = set_activation_checkpointing(self.model, str(args.activation_checkpoint).lower())
+        if num_blocks > 0:
+            print ('[***] activation checkpointing ({}): {} blocks'.format(args.activation_checkpoint, num_blocks))
+        # the forward under autocast, the numerically sensitive parts in fp32 (see src/modules/mixed_precision.py);
+        self.precision = str(args.precision).lower()
+        set_autocast(self.model, self.precision, 'cuda' if self.cuda else 'cpu')
+        # the loss scaling of the fp16 training, None otherwise;
+        self.grad_scaler = None if self.isTestingMode else make_grad_scaler(self.precision, 'cuda' if self.cuda else 'cpu')
+        if self.precision != 'fp32':
+            print ('[***] mixed precision: {} autocast{}'.format(self.precision,
+                ', with gradient scaling' if self.grad_scaler is not None else ''))
         
         print('[***]Number of {} parameters: {}'.format(
             self.model_name,
@@ -376,6 +433,8 @@ class attenStereoNet(object):
                 self.model.load_state_dict(checkpoint['state_dict'], strict=False)
                 if not self.isTestingMode and hasattr(checkpoint, 'optimizer'):
                     self.optimizer.load_state_dict(checkpoint['optimizer'])
+                if self.grad_scaler is not None and checkpoint.get('grad_scaler') is not None:
+                    self.grad_scaler.load_state_dict(checkpoint['grad_scaler'])
             else:
                 print("=> no checkpoint found at {}".format(args.resume))
         
@@ -577,26 +636,41 @@ class attenStereoNet(object):
         log_running_err2 = 0.0
         
         
-        for iteration, batch_data in enumerate(self.training_data_loader):
+        if self.is_prefetch:
+            # copy the next batch to the device while the current step is running;
+            train_loader = DataPrefetcher(self.training_data_loader, 'cuda' if self.cuda else 'cpu')
+        else:
+            train_loader = self.training_data_loader
+        epoch_data_time = 0.0
+        end = time.time()
+        for iteration, batch_data in enumerate(train_loader):
             start = time.time()
+            # time waiting for the batch, i.e., the input stall of this step;
+            data_time = start - end
+            epoch_data_time += data_time
             #print (" [***] iteration = %d" % iteration)
-            input1 = batch_data[0].float() # False by default;
-            #print ("[???] input1 require_grad = ", input1.requires_grad) # False
-            input2 = batch_data[1].float()
-            target = batch_data[2].float()
-            
-            left_rgb = batch_data[3].float()
-            #right_rgb = batch_data[4].float()
-            semantic_label=batch_data[5].float()
-            
-            # from GANet
-            #input1, input2, target = Variable(batch_data[0], requires_grad=True), Variable(batch_data[1], requires_grad=True), Variable(batch_data[2], requires_grad=False)
-            
-            if self.cuda:
-                input1 = input1.cuda()
-                input2 = input2.cuda()
-                target = target.cuda()
-                semantic_label = semantic_label.cuda()
+            if self.uint8_inputs:
+                # normalization and photometric augmentation of the whole batch on the device;
+                input1, input2, target, left_rgb, _, semantic_label = self.batch_transform(
+                    batch_data, 'cuda' if self.cuda else 'cpu')
+            else:
+                input1 = batch_data[0].float() # False by default;
+                #print ("[???] input1 require_grad = ", input1.requires_grad) # False
+                input2 = batch_data[1].float()
+                target = batch_data[2].float()
+                
+                left_rgb = batch_data[3].float()
+                #right_rgb = batch_data[4].float()
+                semantic_label=batch_data[5].float()
+                
+                # from GANet
+                #input1, input2, target = Variable(batch_data[0], requires_grad=True), Variable(batch_data[1], requires_grad=True), Variable(batch_data[2], requires_grad=False)
+                
+                if self.cuda:
+                    input1 = input1.cuda()
+                    input2 = input2.cuda()
+                    target = target.cuda()
+                    semantic_label = semantic_label.cuda()
 
             target = torch.squeeze(target,1)
             #mask = target < self.max_disp
@@ -622,7 +696,7 @@ class attenStereoNet(object):
                     if self.is_semantic:
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//3, semantic_label.size()[3]//3], 
                                 mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
 
 
@@ -641,7 +715,7 @@ class attenStereoNet(object):
                         embed = pac_guide_fea
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//3, semantic_label.size()[3]//3], 
                                 mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                     
                 elif self.model_name == 'ASN-Embed-GANet11':
@@ -662,7 +736,7 @@ class attenStereoNet(object):
                     if self.is_semantic:
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//3, semantic_label.size()[3]//3], 
                                 mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name in ['ASN-Embed-PSM']:
@@ -675,7 +749,7 @@ class attenStereoNet(object):
                     if self.is_semantic:
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name in ['ASN-Embed-GCNet']:
@@ -692,7 +766,7 @@ class attenStereoNet(object):
                         semantic_label = F.interpolate(semantic_label, 
                             [semantic_label.size()[2]//tmp_scale, semantic_label.size()[3]//tmp_scale], 
                              mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name == 'ASN-PAC-GCNet':
@@ -710,7 +784,7 @@ class attenStereoNet(object):
                         embed = pac_guide_fea
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//tmp_scale, semantic_label.size()[3]//tmp_scale], 
                                 mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name == 'ASN-SGA-GCNet':
@@ -728,7 +802,7 @@ class attenStereoNet(object):
                         embed = g_in
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//tmp_scale, semantic_label.size()[3]//tmp_scale], 
                                 mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name in ['ASN-DFN-GCNet']:
@@ -752,7 +826,7 @@ class attenStereoNet(object):
                     if self.is_semantic:
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
 
                 elif self.model_name in ['ASN-DFN-DispNetC']:
@@ -798,7 +872,7 @@ class attenStereoNet(object):
                         embed = g_in
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name in ['ASN-SGA-DispNetC']:
@@ -815,7 +889,7 @@ class attenStereoNet(object):
                         embed = g_in
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 
                 elif self.model_name in ['ASN-PAC-DispNetC']:
@@ -832,7 +906,7 @@ class attenStereoNet(object):
                         embed = pac_guide_fea
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
 
                 elif self.model_name in ['ASN-PAC-PSM']:
@@ -847,16 +921,23 @@ class attenStereoNet(object):
                         embed = pac_guide_fea
                         semantic_label = F.interpolate(semantic_label, [semantic_label.size()[2]//4, 
                             semantic_label.size()[3]//4], mode='bilinear', align_corners=False)
-                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None)
+                        embed_loss, _, _, _ = get_embed_losses(embed, semantic_label, args_dict = None, fused = self.embed_loss_fused)
                         loss += self.args.embed_loss_weight * embed_loss
                 else:
                     raise Exception("No suitable model found ...")
                     
-                loss.backward()
-                #print ('[???] finished DFN-GANet-Deep 1 Iteration , loss backward = ', loss.get_device())
+                if self.grad_scaler is not None:
+                    # fp16: the loss scaled up against the underflow of the grads, which are
+                    # unscaled (and the step skipped if inf/nan) by the scaler;
+                    self.grad_scaler.scale(loss).backward()
+                    self.grad_scaler.step(self.optimizer)
+                    self.grad_scaler.update()
+                else:
+                    loss.backward()
+                    #print ('[???] finished DFN-GANet-Deep 1 Iteration , loss backward = ', loss.get_device())
 
-                self.optimizer.step()
-                #print ('[???] finished DFN-GANet-Deep 1 Iteration , optimizer.step() = ', loss.get_device())
+                    self.optimizer.step()
+                    #print ('[???] finished DFN-GANet-Deep 1 Iteration , optimizer.step() = ', loss.get_device())
                 
                 # MAE error
                 if  (self.model_name.find('GCNet') != -1): # GCNet
@@ -865,10 +946,10 @@ class attenStereoNet(object):
                     
                     # epoch - 1: here argument `epoch` is starting from 1, instead of 0 (zer0);
                     train_global_step = (epoch-1)*self.train_loader_len + iteration
-                    message_info = "===> Epoch[{}]({}/{}): Step {}, Loss: {:.3f} - LossEmbed: {:.2f}; EPE: {:.2f}; {:.2f} s/step".format(
+                    message_info = "===> Epoch[{}]({}/{}): Step {}, Loss: {:.3f} - LossEmbed: {:.2f}; EPE: {:.2f}; {:.2f} s/step; data {:.3f} s".format(
                                 epoch, iteration, self.train_loader_len, train_global_step,
                                 loss.item(),  embed_loss.item() if self.is_semantic else -1.0,
-                                error2.item(), time.time() - start )
+                                error2.item(), time.time() - start, data_time)
                     #sys.stdout.flush()
                     # save summary for tensorboard visualization
                     log_running_err2 += error2.item()
@@ -891,11 +972,11 @@ class attenStereoNet(object):
                 
                     # epoch - 1: here argument `epoch` is starting from 1, instead of 0 (zer0);
                     train_global_step = (epoch-1)*self.train_loader_len + iteration      
-                    message_info = "===> Epoch[{}]({}/{}): Step {}, Loss: {:.3f} - Loss0/1/2/embed: ({:.2f} {:.2f} {:.2f} {:.2f}); EPE: ({:.2f} {:.2f} {:.2f}); {:.2f} s/step".format(
+                    message_info = "===> Epoch[{}]({}/{}): Step {}, Loss: {:.3f} - Loss0/1/2/embed: ({:.2f} {:.2f} {:.2f} {:.2f}); EPE: ({:.2f} {:.2f} {:.2f}); {:.2f} s/step; data {:.3f} s".format(
                             epoch, iteration, self.train_loader_len, train_global_step,
                             loss.item(), loss0.item(), loss1.item(), loss2.item(), 
                             embed_loss.item() if self.is_semantic else -1.0,
-                            error0.item(), error1.item(), error2.item(), time.time() -start)
+                            error0.item(), error1.item(), error2.item(), time.time() -start, data_time)
                     #sys.stdout.flush()
 
                 #----------------------
@@ -962,7 +1043,8 @@ class attenStereoNet(object):
                     log_running_err0 = 0.0
                     log_running_err1 = 0.0
                     log_running_err2 = 0.0
-
+            
+            end = time.time()
         
         # end of data_loader
         # save the checkpoints
@@ -972,6 +1054,8 @@ class attenStereoNet(object):
         avg_err2 = epoch_error2/valid_iteration
         print("===> Epoch {} Complete: Avg. Loss: {:.4f}, Avg. EPE Error: ({:.4f} {:.4f} {:.4f})".format(
                   epoch, avg_loss, avg_err0, avg_err1, avg_err2 ))
+        print("===> Epoch {} data wait: {:.1f} s in total, {:.3f} s/step".format(
+                  epoch, epoch_data_time, epoch_data_time / max(1, iteration + 1)))
         
 
         is_best = False
@@ -984,6 +1068,8 @@ class attenStereoNet(object):
                         'err1': avg_err1, 
                         'err2': avg_err2,
                     }
+        if self.grad_scaler is not None:
+            model_state_dict['grad_scaler'] = self.grad_scaler.state_dict()
         #if nEpochs > 500:
         if nEpochs > 900:
             save_epo_step = 50
@@ -1039,6 +1125,7 @@ class attenStereoNet(object):
     #---- Test ----- -----
     #---------------------
     def test(self):
+        """ return: the average EPE, bad-1.0 and bad-3.0 errors over the test list """
         self.model.eval()
         file_path = self.args.data_path
         file_list_txt = self.args.test_list
@@ -1050,6 +1137,12 @@ class attenStereoNet(object):
         else:
             filelist = [l.rstrip() for l in f.readlines() if not l.rstrip().startswith('#')]
 
+        manifest = None
+        if self.args.test_manifest:
+            # resolved paths of the list, validated before testing;
+            manifest = Manifest(self.args.test_manifest, file_path)
+            manifest.validate()
+        
         crop_width = self.args.crop_width
         crop_height = self.args.crop_height
         batch_in_image = str(self.args.batch_in_image).lower() == 'true'
@@ -1068,6 +1161,7 @@ class attenStereoNet(object):
         err_list = []
         rate1_list = []
         rate3_list = []
+        dispGT = None
 
         
         if self.virtual_kitti2:
@@ -1083,13 +1177,18 @@ class attenStereoNet(object):
 
         for index in range(len(filelist)):
             current_file = filelist[index]
+            if manifest is not None:
+                files = manifest.get_files(manifest.index_of(current_file))
+            else:
+                files = get_sample_files(file_path, current_file, self.kitti2012, self.kitti2015, self.virtual_kitti2, 
+                    is_semantic = False)
+            leftname, rightname = files['left'], files['right']
+            
             if self.kitti2015:
                 data_type_str= "kt15" 
-                leftname = pjoin(file_path, 'image_0/' + current_file)
                 if index < 1:
                     print ("limg: {}".format(leftname))
-                rightname = pjoin(file_path, 'image_1/' + current_file)
-                dispname = pjoin(file_path, 'disp_occ_0_pfm/' + current_file[0:-4] + '.pfm')
+                dispname = files['disp_left']
                 dispGT=pfm.readPFM(dispname)
                 dispGT[dispGT == np.inf] = .0
                 savename = pjoin(self.args.resultDir, current_file[0:-4] + '.pfm')
@@ -1097,9 +1196,7 @@ class attenStereoNet(object):
             elif self.kitti2012:
                 data_type_str= "kt12" 
                 #leftname = pjoin(file_path, 'image_0/' + current_file)
-                leftname =  pjoin(file_path, 'colored_0/' + current_file)
-                rightname = pjoin(file_path, 'colored_1/' + current_file)
-                dispname = pjoin(file_path, 'disp_occ_pfm/' + current_file[0:-4] + '.pfm')
+                dispname = files['disp_left']
                 dispGT=pfm.readPFM(dispname)
                 dispGT[dispGT == np.inf] = .0
                 savename = pjoin(self.args.resultDir, current_file[0:-4] + '.pfm')
@@ -1110,31 +1207,17 @@ class attenStereoNet(object):
                 data_type_str= "virtual_kt2" 
                 A = current_file 
                 # e.g., /media/ccjData2/datasets/Virtual-KITTI-V2/vkitti_2.0.3_rgb/Scene01/15-deg-left/frames/rgb/Camera_0/rgb_00001.jpg
-                leftname = pjoin(file_path, "vkitti_2.0.3_rgb/" + A) 
-                rightname = pjoin(file_path, "vkitti_2.0.3_rgb/" + A[:-22] + 'Camera_1/' + A[-13:])
-                #load depth GT and change it to disparity GT: 
-                depth_png_filename = pjoin(file_path, "vkitti_2.0.3_depth/" + A[:-26] + 'depth/Camera_0/depth_' + A[-9:-4] + ".png")
-                #print ("imgl = ", leftname, ", imgr = ", rightname, ", depth_left = ", depth_png_filename)
-                #NOTE: The depth map in centimeters can be directly loaded
-                depth_left = cv2.imread(depth_png_filename, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
-                height, width = depth_left.shape[:2]
-                # Intrinsi: f_x = f_y = 725.0087 
-                # offset(i.e., distance between stereo views): B = 0.532725 m = 53.2725 cm
-                B = 53.2725 # in centimeters;
-                f = 725.0087 # in pixels
-                # set zero as a invalid disparity value;
-                dispGT = np.zeros([height, width], 'float32')
-                mask = depth_left > 0
-                dispGT[mask] = f*B/ depth_left[mask] # d = fB/z
+                #load depth GT and change it to disparity GT, or load the cached disparity GT;
+                dispGT = load_vkt2_disparity(file_path, A)
                 #pfm.show(dispGT, title='dispGT')
                 savename = pjoin(self.args.resultDir, '%04d.pfm'%(index))
 
 
             else:
                 data_type_str= "scene_flow" 
-                A = current_file
-                leftname = pjoin(file_path, A)
-                rightname = pjoin(file_path, A[:-13] + 'right/' + A[len(A)-8:]) 
+                dispname = files['disp_left']
+                dispGT=pfm.readPFM(dispname)
+                dispGT[dispGT == np.inf] = .0
                 savename = pjoin(self.args.resultDir, '%04d.pfm'%(index))
 
             #print ("[???] crop_height = %d, crop_width = %d" % (crop_height, crop_width))
@@ -1304,6 +1387,42 @@ class attenStereoNet(object):
                     # or 'w' and 'wt' since text mode is the default.
                     json.dump(mysave_dict_avg_err, f_json, indent = 4)
                 print ("[***] Saving vkt2 errors to json file ", json_file)
+        else:
+            raise ValueError("no ground truth disparity read for the test list {} ({} files)".format(
+                file_list_txt, len(filelist)))
+        return avg_err, avg_rate1, avg_rate3
+    
+    def precision_report(self):
+        """ test() in fp32 and with the autocast of --precision, with the same checkpoint and test list:
+            the EPE and bad-1/bad-3 errors of both, and their differences;
+            the results of each run in resultDir/fp32 and resultDir/<precision>;
+        """
+        resultDir = self.args.resultDir
+        device_type = 'cuda' if self.cuda else 'cpu'
+        metrics = {}
+        for precision in ['fp32', self.precision]:
+            if precision in metrics:
+                continue
+            print ("[***] precision report: testing in {} ...".format(precision))
+            set_autocast(self.model, precision, device_type)
+            self.args.resultDir = pjoin(resultDir, precision)
+            since = time.time()
+            metrics[precision] = self.test() + (time.time() - since,)
+        self.args.resultDir = resultDir
+        set_autocast(self.model, self.precision, device_type)
+        
+        csv_file = pjoin(resultDir, 'precision-report.csv')
+        with open(csv_file, 'w') as fwrite:
+            fwrite.write('precision,epe,bad-1.0,bad-3.0,time(s)\n')
+            for precision, (err, rate1, rate3, sec) in metrics.items():
+                print ("===> {}: AVG EPE Error: {:.4f}, AVG Bad-1.0 Error: {:.4f}, AVG Bad-3.0 Error: {:.4f}, test time {:.1f} s".format(
+                    precision, err, rate1, rate3, sec))
+                fwrite.write('{},{:.4f},{:.4f},{:.4f},{:.1f}\n'.format(precision, err, rate1, rate3, sec))
+        if self.precision != 'fp32':
+            err, rate1, rate3 = [a - b for a, b in zip(metrics[self.precision][:3], metrics['fp32'][:3])]
+            print ("===> {} - fp32: EPE {:+.4f}, Bad-1.0 {:+.4f}, Bad-3.0 {:+.4f} ({:+.3f}%)".format(
+                self.precision, err, rate1, rate3, rate3*100.0))
+        print ("write ", csv_file, "\n")
 
 def get_epe_rate2(disp, prediction, max_disp = 192, threshold = 1.0, threshold2 = 3.0):
     mask = np.logical_and(disp >= 0.001, disp <= max_disp)
@@ -1451,6 +1570,7 @@ def main(args):
                 'err0': avg_err0, 
                 'err1': avg_err1, 
                 'err2': avg_err2,
+                'grad_scaler': myAttenStereoNet.grad_scaler.state_dict() if myAttenStereoNet.grad_scaler is not None else None,
             }, 
 
             is_best = False)
@@ -1459,6 +1579,9 @@ def main(args):
     if args.mode == 'test': 
         print('strat testing !!!')
         myAttenStereoNet.test()
+    if args.mode == 'precision_report':
+        print('strat the precision report !!!')
+        myAttenStereoNet.precision_report()
     if args.mode == 'inferencetime':
         print('strat computing GPU Inference Time !!!')
         myAttenStereoNet.computeInferenceTime(
@@ -1512,7 +1635,7 @@ if __name__ == '__main__':
     parser.add_argument('--model_name', type=str, default='ASN-Embed-SGA', help="model name")
     parser.add_argument('--train_logdir', dest='train_logdir',  default='./logs/tmp', help='log dir')
     """Arguments related to run mode"""
-    parser.add_argument('--mode', dest='mode', type = str, default='train', help='train, test')
+    parser.add_argument('--mode', dest='mode', type = str, default='train', help='train, test, inferencetime, or precision_report (test in fp32 and in --precision, and compare the EPE and bad-3)')
     parser.add_argument('--sigma_s', dest='bilateral_sigma_s', type=float, default= 0.7, help='bilateral_sigma_s')
     parser.add_argument('--sigma_v', dest='bilateral_sigma_v', type=float, default= 0.1, help='bilateral_sigma_v')
     parser.add_argument('--is_embed', type=str, default= 'true', help='flag to use embedding or not')
@@ -1521,6 +1644,7 @@ if __name__ == '__main__':
     parser.add_argument('--resultDir', type=str, default= "./results")
     """ arguments related to weights to combine different loss items"""
     parser.add_argument('--embed_loss_weight', type=float, default= 0.6, help='weight for embedding loss')
+    parser.add_argument('--embed_loss_fused', type=str, default= 'false', help='compute the embedding loss from shifted views of the embedding, without its im2col tensors (same loss, less memory)')
     # enable torch.set_grad_enabled() Ture or False for cost volume filtering via embedding;
     parser.add_argument('--cost_filter_grad', type=str, default= "true", help='flag to torch.set_grad_enabled(True) to cost volume filtering or not')
     parser.add_argument('--dilation', type=int, default= 1, help='im2col dilation')
@@ -1529,7 +1653,7 @@ if __name__ == '__main__':
     parser.add_argument('--dfn_kernel_size', dest='dfn_kernel_size', type=int, default= 9, help='dyn filter size')
     """ pixel-adaptive convolution (pac) network """
     parser.add_argument('--is_pac', type=str, default= 'true', help='flag to use pac network or not')
-    parser.add_argument('--pac_native_imple', type=str, default= 'true', help='flag to implement of PAC in fiter version or native version')
+    parser.add_argument('--pac_native_imple', type=str, default= 'true', help='flag to implement of PAC in fiter version or native version, or auto to pick the fastest one per shape')
     parser.add_argument('--pac_kernel_size', dest='pac_kernel_size', type=int, default= 9, help='pac kernel filter size')
     """ for SGA module"""
     parser.add_argument('--is_sga_guide_from_img', type=str, default= 'true', help='flag to use  sga guide from input img')
@@ -1567,6 +1691,27 @@ if __name__ == '__main__':
     #parser.add_argument('--is_kt12_gray', type=str, default= "false", help='flag to load kt2012 gray images or not')
     parser.add_argument('--kt12_image_mode', type=str, default= "rgb", help='flag to load kt2012 gray images, rgb, or gray2rgb')
     parser.add_argument('--is_data_augment', type=str, default= "false", help='flag to use data_augment, including random scale crop, color change etc')
+    
+    """ added for reading training samples from packed shards, see src/loaddata/shard_pack.py """
+    parser.add_argument('--shard_dir', type=str, default= "", help='dir of the packed shards of the training list, empty to load the raw files')
+    parser.add_argument('--crop_first', type=str, default= "false", help='flag to draw the random crop before normalizing, to only process the cropped region')
+    parser.add_argument('--uint8_inputs', type=str, default= "false", help='flag to load uint8 crops, and to normalize/augment them in batch on the training device')
+    parser.add_argument('--in_ram', type=str, default= "false", help='flag to decode the training list once into shared memory, e.g., for KITTI 2012/2015')
+    parser.add_argument('--io_threads', type=int, default=0, help='threads to read the files of each sample concurrently, 0 for sequential reads')
+    parser.add_argument('--read_ahead', type=int, default=0, help='number of the next samples (in the sampler order) whose files are read ahead, 0 to disable')
+    parser.add_argument('--train_manifest', type=str, default= "", help='manifest of the training list (see src/loaddata/manifest.py), validated before training')
+    parser.add_argument('--test_manifest', type=str, default= "", help='manifest of the testing list, validated before testing')
+    parser.add_argument('--corr_disp_chunk', type=int, default=0, help='number of disparities computed at once by the 1-D (filtered) correlation of DispNetC, to cap its transient forward memory (the tensors saved for backward do not depend on it); 0 for all at once')
+    parser.add_argument('--cost_filter_slices', type=int, default=0, help='number of cost volume slices filtered per call by the DAF filters, -1 for all the D slices at once (D times the transient memory of one slice, e.g., about 18 GB for the im2col of ASN-Embed-PSM at 384x1248), 0 to derive it from --cost_filter_budget_mb')
+    parser.add_argument('--cost_filter_budget_mb', type=float, default=0, help='memory budget (MB) of each call of the cost volume filtering; if 0 (and --cost_filter_slices=0, the default), one slice per call, the peak memory of the per-slice loop')
+    parser.add_argument('--bilateral_backend', type=str, default= "im2col", help='embedding bilateral filter of the ASN-Embed models: im2col (unfolds the k*k neighbors), shift (shift-and-accumulate, O(F) instead of O(F*k*k) memory), or lattice (permutohedral lattice, cost independent of sigma_s)')
+    parser.add_argument('--lattice_guide_dims', type=int, default=4, help='for --bilateral_backend=lattice, number of PCA components of the embedding used as the guide, 0 for all')
+    parser.add_argument('--pac_autotune_cache', type=str, default= '', help='for --pac_native_imple=auto, json file caching the fastest PAC implementation per shape, empty for no disk cache')
+    parser.add_argument('--dfn_backend', type=str, default= "im2col", help='dynamic filter layer of the ASN-DFN models: im2col (unfolds the k*k neighbors), or shift (shift-and-accumulate with recompute in backward, O(C) instead of O(C*k*k) memory)')
+    parser.add_argument('--activation_checkpoint', type=str, default= "none", help='activation checkpointing of the 3D cost aggregation (PSMNet hourglasses, GCNet conv3d blocks, GANet CostAggregation): none, hourglass (one segment per hourglass / top-level block), or block (one segment per block inside them); less memory for about one extra forward of these blocks')
+    parser.add_argument('--precision', type=str, default= "fp32", help='training and inference precision: fp32, fp16 (autocast and gradient scaling, CUDA), or bf16 (autocast, CUDA or CPU); the bilateral weights, softmax and disparity regression, losses and GANet SGA/LGA stay in fp32')
+    parser.add_argument('--embed_lowres_fusion', type=str, default= 'false', help='embedding network: apply the 1x1 fusion conv to each intermediate map at its own resolution, instead of to their full-resolution concatenation (same weights and outputs, less memory)')
+    parser.add_argument('--is_prefetch', type=str, default= "false", help='flag to prefetch the next batch (pinned memory, side cuda stream, or a background thread on cpu)')
 
     args = parser.parse_args()
     print('[***] args = ', args)
@@ -102,6 +102,109 @@ class Corr1d_V2(nn.Module):
 
 
 
+# corr1d without the loop over D, added by CCJ;
+def _corr1d_tiles(x, y, k0, k1):
+    """ the operands of the disparities [k0, k1) as batched matrix products:
+        with c = k1 - k0, the width is split into tiles of c pixels, and the tile t of x,
+        xs[:,:,:,t,a] = x[..., t*c + a], a in [0, c), meets the window 
+        ys[:,:,:,t,u] = y[..., t*c + u - (k1-1)], u in [0, 2c-1), of y;
+        then disparity k0 + j of pixel t*c + a is at u = a - j + c - 1;
+    """
+    N, C, H, W = x.size()
+    c = k1 - k0
+    nT = (W + c - 1) // c
+    xs = F.pad(x, (0, nT*c - W)).view(N, C, H, nT, c)
+    ys = F.pad(y, (k1 - 1, nT*c - W)).unfold(3, 2*c - 1, c)[:, :, :, :nT]
+    return xs, ys
+
+
+def _corr1d_band(m):
+    """ m in [N,H,nT,c,2c-1] (contiguous), return the view band[..., a, i] = m[..., a, a + i],
+        in [N,H,nT,c,c], i.e., i = c - 1 - j for disparity k0 + j;
+    """
+    N, H, nT, c, _ = m.size()
+    s = m.stride()
+    return m.as_strided((N, H, nT, c, c), (s[0], s[1], s[2], 2*c, 1), m.storage_offset())
+
+
+class Correlation1DFunction(torch.autograd.Function):
+    """ corr[:, k, :, w] = sum_c x[:, c, :, w] * y[:, c, :, w-k], zero for w < k;
+        i.e., the same output as correlation1D_map_V1 and Corr1d_V2 (kernel_size = stride = 1);
+        each chunk of c disparities is one batched matrix product [c, C] x [C, 2c-1] 
+        over all the tiles of c pixels (see _corr1d_tiles), so the peak memory is 
+        about (2c-1) x [N,H,W] besides the features, and not D x [N,C,H,W];
+        backward saves x and y only, and recomputes the products of each chunk,
+        instead of storing the D products as autograd does for the loop versions;
+    """
+    @staticmethod
+    def forward(ctx, x, y, D, chunk):
+        N, C, H, W = x.size()
+        chunk = D if chunk <= 0 else min(chunk, D)
+        corr = x.new_empty((N, D, H, W))
+        for k0 in range(0, D, chunk):
+            k1 = min(k0 + chunk, D)
+            c = k1 - k0
+            xs, ys = _corr1d_tiles(x, y, k0, k1)
+            m = torch.einsum('nchta,nchtu->nhtau', xs, ys).contiguous()
+            # [N,H,nT,c(a),c(i)] -> [N,c(j),H,nT*c(w)]
+            band = _corr1d_band(m).flip(4).permute(0, 4, 1, 2, 3).reshape(N, c, H, -1)
+            corr[:, k0:k1] = band[..., :W]
+        ctx.save_for_backward(x, y)
+        ctx.D, ctx.chunk = D, chunk
+        return corr
+
+    @staticmethod
+    def backward(ctx, grad):
+        x, y = ctx.saved_tensors
+        D, chunk = ctx.D, ctx.chunk
+        N, C, H, W = x.size()
+        grad_x = torch.zeros_like(x) if ctx.needs_input_grad[0] else None
+        grad_y = torch.zeros_like(y) if ctx.needs_input_grad[1] else None
+        for k0 in range(0, D, chunk):
+            k1 = min(k0 + chunk, D)
+            c = k1 - k0
+            xs, ys = _corr1d_tiles(x, y, k0, k1)
+            nT = xs.size(3)
+            # scatter the gradient of the chunk into the band of the matrix product;
+            g = F.pad(grad[:, k0:k1], (0, nT*c - W)).view(N, c, H, nT, c)
+            gm = grad.new_zeros((N, H, nT, c, 2*c - 1))
+            _corr1d_band(gm).copy_(g.permute(0, 2, 3, 4, 1).flip(4))
+            if grad_x is not None:
+                gx = torch.einsum('nhtau,nchtu->nchta', gm, ys)
+                grad_x += gx.reshape(N, C, H, -1)[..., :W]
+            if grad_y is not None:
+                gy = torch.einsum('nhtau,nchta->nchtu', gm, xs)
+                # overlap-add the windows, which start every c pixels, back to the padded y;
+                gy_pad = grad.new_zeros((N, C, H, max((nT + 1)*c, k1 - 1 + W)))
+                gy_pad[..., :nT*c] += gy[..., :c].reshape(N, C, H, -1)
+                gy_pad[..., c:(nT + 1)*c] += F.pad(gy[..., c:], (0, 1)).reshape(N, C, H, -1)
+                grad_y += gy_pad[..., k1 - 1: k1 - 1 + W]
+        return grad_x, grad_y, None, None
+
+
+class correlation1D_map_V3(nn.Module):
+    def __init__(self, maxdisp, disp_chunk = 0):
+        """
+        args:
+            maxdisp: disparity range D
+            disp_chunk: number of disparities computed at once, to cap the peak memory;
+                        0 for all the D disparities;
+        """
+        super(correlation1D_map_V3, self).__init__()
+        self.maxdisp = maxdisp
+        self.disp_chunk = disp_chunk
+
+    def forward(self, x, y):
+        """
+        args:
+            x: left feature, in [N,C,H,W]
+            y: right feature, in [N,C,H,W]
+        return:
+            corr: correlation map in size [N,D,H,W]
+        """
+        return Correlation1DFunction.apply(x, y, self.maxdisp, self.disp_chunk)
+
+
 """ NO BatchNorm Version """
 def downsample_conv(in_planes, out_planes, kernel_size = 3):
     return nn.Sequential(
@@ -255,7 +358,9 @@ class DispNet(nn.Module):
     def __init__(self, is_corr = True, maxdisp_corr = 40, 
             corr_func_type = 'correlation1D_map_V1',
             is_bn = True,
-            is_relu = True):
+            is_relu = True,
+            corr_disp_chunk = 0 # used by correlation1D_map_V3;
+            ):
         super(DispNet, self).__init__()
         """ 
         DispNetS: DispNet Simple, with is_corr = False
@@ -275,6 +380,8 @@ class DispNet(nn.Module):
                 self.corr_func = correlation1D_map_V1(maxdisp_corr)
             elif str(corr_func_type).lower() == 'corr1d_v2':
                 self.corr_func = Corr1d_V2(D=maxdisp_corr)
+            elif str(corr_func_type).lower() == 'correlation1d_map_v3':
+                self.corr_func = correlation1D_map_V3(maxdisp_corr, corr_disp_chunk)
             else:
                 raise Exception("No suitable corr1D() found ...")
 
@@ -464,3 +571,24 @@ def scale_pyramid(img, num_scales=6, is_value_scaled = False):
                     mode='bilinear', 
                     align_corners = True))
     return scaled_imgs
+
+
+def benchmark_corr1d(N = 2, C = 128, H = 64, W = 128, D = 48, disp_chunks = (0, 16, 8), 
+        repeat = 5, device = 'cpu'):
+    """ compare correlation1D_map_V3 against correlation1D_map_V1 and Corr1d_V2:
+        time of forward + backward, and the peak memory (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from src.modules.cost_volume_filter import time_forward_backward
+    x = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    y = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    funcs = [('correlation1D_map_V1', correlation1D_map_V1(D)), ('Corr1d_V2', Corr1d_V2(D = D))]
+    funcs += [('correlation1D_map_V3(chunk={})'.format(c), correlation1D_map_V3(D, c)) for c in disp_chunks]
+    for name, func in funcs:
+        ms, mem = time_forward_backward(lambda: func(x, y), repeat, device)
+        print ("{:>32s}: {:.2f} ms (forward + backward), {}".format(name, ms, mem))
+
+
+if __name__ == "__main__":
+    benchmark_corr1d(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_corr1d(device = 'cuda')
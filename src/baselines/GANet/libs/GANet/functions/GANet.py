@@ -1,6 +1,10 @@
 import torch
 from torch.autograd import Function
-from ..build.lib import GANet
+try:
+    from ..build.lib import GANet
+except ImportError:
+    # built without CUDA, see GANet_cpu.py for the CPU backend;
+    GANet = None
 from torch.autograd import Variable
 #import GANet
 		
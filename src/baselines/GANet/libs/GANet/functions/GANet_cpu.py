@@ -0,0 +1,216 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: GANet_cpu.py
+# @brief: CPU backend of the SGA and LGA operators: vectorized PyTorch references and the C++/OpenMP extension;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+The SGA (semi-global guided aggregation) and LGA (local guided aggregation)
+layers of GANet only had the CUDA kernels of src/GANet_kernel.cu. Here:
+    - sga_reference() / lga_reference(): plain PyTorch, differentiated by autograd,
+      vectorized over everything but the scan steps (SGA) and the filter taps (LGA);
+    - SgaCpuFunction / LgaCpuFunction: src/GANet_cpu.cpp, built as the extension
+      'GANet_cpu' by setup.py (with or without CUDA), parallelized by OpenMP over
+      the scanlines (SGA) and the rows of each channel (LGA);
+    - sga_cpu() / lga_cpu() / lga3d_cpu(): the extension if it is built, otherwise the references;
+modules/GANet.py dispatches to them for the CPU tensors.
+
+The gradients of the extension are exact, also at the first position of each
+scanline, where the CUDA backward omits the terms of the weights g1, ..., g4
+(i.e., the CPU and CUDA gradients of SGA differ there).
+
+Check and benchmark:
+    python3.7 -m src.baselines.GANet.libs.GANet.functions.GANet_cpu
+"""
+
+import time
+import torch
+from torch.autograd import Function
+
+try:
+    from ..build.lib import GANet_cpu
+except ImportError:
+    GANet_cpu = None
+
+
+def _sga_scan(x, g):
+    """ one direction, scanning along dim 3 (i.e., top to bottom, as sga_down_forward())
+        args:
+            x: cost volume, in [N,C,D,L,M]
+            g: guidance, in [N,C,5,L,M]
+        return:
+            the aggregation, in [N,C,D,L,M]
+    """
+    agg = [x[:, :, :, 0]*g[:, :, :, 0].sum(dim = 2, keepdim = True)]
+    for t in range(1, x.size(3)):
+        p = agg[-1]
+        xt = x[:, :, :, t]
+        gt = g[:, :, :, t]
+        # the neighbors d-1 and d+1 out of [0, D) are replaced by x[t][d];
+        p_lower = torch.cat([xt[:, :, :1], p[:, :, :-1]], dim = 2)
+        p_upper = torch.cat([p[:, :, 1:], xt[:, :, -1:]], dim = 2)
+        p_max = p.max(dim = 2, keepdim = True)[0]
+        agg.append(gt[:, :, 0:1]*xt + gt[:, :, 1:2]*p + gt[:, :, 2:3]*p_lower
+                   + gt[:, :, 3:4]*p_upper + gt[:, :, 4:5]*p_max)
+    return torch.stack(agg, dim = 3)
+
+
+def sga_reference(x, g0, g1, g2, g3):
+    """ semi-global guided aggregation, as SgaFunction
+        args:
+            x: cost volume, in [N,C,D,H,W]
+            g0, g1, g2, g3: guidance of the directions down, up, right and left, in [N,C,5,H,W]
+        return:
+            the maximum over the 4 directions, in [N,C,D,H,W]
+    """
+    out = _sga_scan(x, g0)
+    up = _sga_scan(x.flip(3), g1.flip(3)).flip(3)
+    right = _sga_scan(x.transpose(3, 4), g2.transpose(3, 4)).transpose(3, 4)
+    left = _sga_scan(x.transpose(3, 4).flip(3), g3.transpose(3, 4).flip(3)).flip(3).transpose(3, 4)
+    # on ties, the first direction wins, as Max() of the CUDA version;
+    for agg in (up, right, left):
+        out = torch.where(agg > out, agg, out)
+    return out
+
+
+def lga_reference(x, filters, radius = 2):
+    """ local guided aggregation, as LgaFunction
+        args:
+            x: in [N,C,H,W]
+            filters: in [N,3*w*w,H,W], w = 2*radius + 1, over the neighbors (c-1..c+1, h-r..h+r, w-r..w+r);
+        return:
+            in [N,C,H,W]; the neighbors out of the volume are replaced by x itself;
+    """
+    N, C, H, W = x.size()
+    ws = 2*radius + 1
+    x_pad = torch.nn.functional.pad(x, (radius, radius, radius, radius, 1, 1))
+    inside = torch.nn.functional.pad(x.new_ones(1, C, H, W), (radius, radius, radius, radius, 1, 1)) > 0
+    out = 0
+    for tap in range(3*ws*ws):
+        dc, r, s = tap // (ws*ws), tap // ws % ws, tap % ws
+        neighbor = x_pad[:, dc:dc + C, r:r + H, s:s + W]
+        neighbor = torch.where(inside[:, dc:dc + C, r:r + H, s:s + W], neighbor, x)
+        out = out + filters[:, tap:tap + 1]*neighbor
+    return out
+
+
+class SgaCpuFunction(Function):
+    @staticmethod
+    def forward(ctx, input, g0, g1, g2, g3):
+        input, g0, g1, g2, g3 = [t.contiguous() for t in (input, g0, g1, g2, g3)]
+        output = torch.empty_like(input)
+        mask = torch.empty(input.size(), dtype = torch.uint8)
+        GANet_cpu.sga_cpu_forward(input, g0, g1, g2, g3, output, mask)
+        # the aggregations are recomputed in backward, one scanline at a time;
+        ctx.save_for_backward(input, g0, g1, g2, g3, mask)
+        return output
+
+    @staticmethod
+    def backward(ctx, gradOutput):
+        input, g0, g1, g2, g3, mask = ctx.saved_tensors
+        gradInput = torch.zeros_like(input)
+        grads = [torch.zeros_like(g) for g in (g0, g1, g2, g3)]
+        GANet_cpu.sga_cpu_backward(input, g0, g1, g2, g3, mask, gradOutput.contiguous(),
+                                   gradInput, *grads)
+        return (gradInput, *grads)
+
+
+class LgaCpuFunction(Function):
+    @staticmethod
+    def forward(ctx, input, filters, radius = 2):
+        input, filters = input.contiguous(), filters.contiguous()
+        output = torch.empty_like(input)
+        GANet_cpu.lga_cpu_forward(input, filters, output, radius)
+        ctx.radius = radius
+        ctx.save_for_backward(input, filters)
+        return output
+
+    @staticmethod
+    def backward(ctx, gradOutput):
+        input, filters = ctx.saved_tensors
+        gradInput = torch.zeros_like(input)
+        gradFilters = torch.zeros_like(filters)
+        GANet_cpu.lga_cpu_backward(input, filters, gradOutput.contiguous(), gradInput, gradFilters, ctx.radius)
+        return gradInput, gradFilters, None
+
+
+def sga_cpu(input, g0, g1, g2, g3, use_extension = True):
+    if use_extension and GANet_cpu is not None:
+        return SgaCpuFunction.apply(input, g0, g1, g2, g3)
+    return sga_reference(input, g0, g1, g2, g3)
+
+
+def lga_cpu(input, filters, radius = 2, passes = 1, use_extension = True):
+    """ LGA, LGA2 and LGA3: the same filters applied 1, 2 or 3 times, input in [N,C,H,W] """
+    for _ in range(passes):
+        if use_extension and GANet_cpu is not None:
+            input = LgaCpuFunction.apply(input, filters, radius)
+        else:
+            input = lga_reference(input, filters, radius)
+    return input
+
+
+def lga3d_cpu(input, filters, radius = 2, passes = 1, use_extension = True):
+    """ LGA3D, LGA3D2 and LGA3D3: input in [N,C,D,H,W], filters in [N,C,3*w*w,H,W],
+        i.e., the 2D version over [N*C,D,H,W], the disparities as the channels;
+    """
+    N, C, D, H, W = input.size()
+    out = lga_cpu(input.reshape(N*C, D, H, W), filters.reshape(N*C, -1, H, W), radius, passes,
+                  use_extension)
+    return out.view(N, C, D, H, W)
+
+
+def check_sga_lga_cpu(N = 1, C = 2, D = 5, H = 4, W = 6, radius = 1):
+    """ the extension against the references, and torch.autograd.gradcheck of both, in double """
+    torch.manual_seed(0)
+    fsize = 3*(2*radius + 1)**2
+    x = torch.randn(N, C, D, H, W, dtype = torch.float64, requires_grad = True)
+    gs = [torch.rand(N, C, 5, H, W, dtype = torch.float64, requires_grad = True) for _ in range(4)]
+    x2 = torch.randn(N, C*D, H, W, dtype = torch.float64, requires_grad = True)
+    f2 = torch.randn(N, fsize, H, W, dtype = torch.float64, requires_grad = True)
+    f3 = torch.randn(N, C, fsize, H, W, dtype = torch.float64, requires_grad = True)
+    cases = [
+        ('sga', lambda e: lambda *a: sga_cpu(*a, use_extension = e), [x] + gs),
+        ('lga', lambda e: lambda *a: lga_cpu(*a, radius = radius, use_extension = e), [x2, f2]),
+        ('lga3', lambda e: lambda *a: lga_cpu(*a, radius = radius, passes = 3, use_extension = e), [x2, f2]),
+        ('lga3d2', lambda e: lambda *a: lga3d_cpu(*a, radius = radius, passes = 2, use_extension = e), [x, f3]),
+        ]
+    for name, func, inputs in cases:
+        assert torch.autograd.gradcheck(func(False), inputs), name
+        if GANet_cpu is None:
+            print ("[***] {}: reference gradcheck ok, no extension built".format(name))
+            continue
+        assert torch.autograd.gradcheck(func(True), inputs), name
+        ref = func(False)(*inputs)
+        out = func(True)(*inputs)
+        grad = torch.randn_like(ref)
+        grads_ref = torch.autograd.grad(ref, inputs, grad)
+        grads = torch.autograd.grad(out, inputs, grad)
+        print ("[***] {}: gradcheck ok, extension vs. reference max abs diff {:.2e} (forward), {:.2e} (backward)".format(
+            name, (out - ref).abs().max().item(), max((a - b).abs().max().item() for a, b in zip(grads, grads_ref))))
+
+
+def benchmark_sga_lga_cpu(N = 1, C = 8, D = 48, H = 64, W = 128, radius = 2, repeat = 3):
+    """ forward + backward of SGA and LGA3D on the CPU: the PyTorch references vs. the extension """
+    fsize = 3*(2*radius + 1)**2
+    x = torch.randn(N, C, D, H, W, requires_grad = True)
+    gs = [torch.rand(N, C, 5, H, W, requires_grad = True) for _ in range(4)]
+    f3 = torch.randn(N, C, fsize, H, W, requires_grad = True)
+    runs = [
+        ('sga', lambda e: sga_cpu(x, *gs, use_extension = e)),
+        ('lga3d', lambda e: lga3d_cpu(x, f3, radius, use_extension = e)),
+        ]
+    for name, func in runs:
+        for use_extension in ([False, True] if GANet_cpu is not None else [False]):
+            since = time.time()
+            for _ in range(repeat):
+                func(use_extension).sum().backward()
+            print ("[{}] {:>9s}: {:.2f} ms (forward + backward), {} threads".format(
+                name, 'extension' if use_extension else 'reference',
+                (time.time() - since) / repeat * 1000, torch.get_num_threads()))
+
+
+if __name__ == "__main__":
+    check_sga_lga_cpu()
+    benchmark_sga_lga_cpu()
@@ -13,6 +13,9 @@ from ..functions.GANet import Lga3dFunction
 from ..functions.GANet import Lga3d2Function
 from ..functions.GANet import Lga3d3Function
 from ..functions.GANet import MyLoss2Function
+from ..functions.GANet_cpu import sga_cpu, lga_cpu, lga3d_cpu
+# the CUDA kernels and GANet_cpu only take float / double, i.e., fp32 under autocast;
+from src.modules.mixed_precision import keep_fp32
 
 
 
@@ -45,6 +48,7 @@ class MyLoss2(Module):
         super(MyLoss2, self).__init__()
         self.thresh = thresh
         self.alpha = alpha
+    @keep_fp32
     def forward(self, input1, input2):
         #result = MyLoss2Function(self.thresh, self.alpha)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
@@ -56,6 +60,7 @@ class MyLoss(Module):
         super(MyLoss, self).__init__()
         self.upper_thresh = 5
         self.lower_thresh = 1
+    @keep_fp32
     def forward(self, input1, input2):
         #result = MyLossFunction(self.upper_thresh, self.lower_thresh)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
@@ -68,6 +73,7 @@ class SGA(Module):
     def __init__(self):
         super(SGA, self).__init__()
 
+    @keep_fp32
     def forward(self, input, g0, g1, g2, g3):
         """
         > see: Difference between apply an call for an autograd function, 
@@ -80,6 +86,9 @@ class SGA(Module):
         """
         #result = SgaFunction()(input, g0, g1, g2, g3)
         #added by CCJ on 20191010;
+        # the CUDA kernels, or the CPU backend (see functions/GANet_cpu.py);
+        if not input.is_cuda:
+            return sga_cpu(input, g0, g1, g2, g3)
         result = SgaFunction.apply(input, g0, g1, g2, g3)
         # or: you can do call Function.apply method, and alias this as 'sga'
         #sga = SgaFunction.apply
@@ -93,9 +102,12 @@ class LGA3D3(Module):
         super(LGA3D3, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
         #result = Lga3d3Function(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
+        if not input1.is_cuda:
+            return lga3d_cpu(input1, input2, self.radius, passes = 3)
         result = Lga3d3Function.apply(input1, input2,self.radius)
         return result
 
@@ -104,9 +116,12 @@ class LGA3D2(Module):
         super(LGA3D2, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
         #result = Lga3d2Function(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
+        if not input1.is_cuda:
+            return lga3d_cpu(input1, input2, self.radius, passes = 2)
         result = Lga3d2Function.apply(input1, input2,self.radius)
         return result
 
@@ -115,9 +130,12 @@ class LGA3D(Module):
         super(LGA3D, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
         #result = Lga3dFunction(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
+        if not input1.is_cuda:
+            return lga3d_cpu(input1, input2, self.radius)
         result = Lga3dFunction.apply(input1, input2, self.radius)
         return result		
 		
@@ -126,9 +144,11 @@ class LGA3(Module):
         super(LGA3, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
-        result = Lga3Function(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
+        if not input1.is_cuda:
+            return lga_cpu(input1, input2, self.radius, passes = 3)
         result = Lga3Function.apply(input1, input2,self.radius)
         return result
 
@@ -137,9 +157,12 @@ class LGA2(Module):
         super(LGA2, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
         #result = Lga2Function(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
+        if not input1.is_cuda:
+            return lga_cpu(input1, input2, self.radius, passes = 2)
         result = Lga2Function.apply(input1, input2, self.radius)
         return result
 class LGA(Module):
@@ -147,11 +170,14 @@ class LGA(Module):
         super(LGA, self).__init__()
         self.radius = radius
 
+    @keep_fp32
     def forward(self, input1, input2):
         #result = LgaFunction(self.radius)(input1, input2)
         #added by CCJ: updated for applying "new style" static functions via ".apply"
         #NOTE: radius = 2, means window size = 5;
         # see the "GANet_kernel.cu" file for : around line 1147: wsize = 2 * radius + 1
+        if not input1.is_cuda:
+            return lga_cpu(input1, input2, self.radius)
         result = LgaFunction.apply(input1, input2,self.radius)
         return result
 
@@ -191,6 +217,7 @@ class DisparityRegression(Module):
         self.maxdisp = maxdisp + 1
 #        self.disp = Variable(torch.Tensor(np.reshape(np.array(range(self.maxdisp)),[1,self.maxdisp,1,1])).cuda(), requires_grad=False)
 
+    @keep_fp32
     def forward(self, x):
         """
            args:
@@ -198,9 +225,7 @@ class DisparityRegression(Module):
         """
         assert(x.is_contiguous() == True)
         with torch.cuda.device_of(x):
-            disp = Variable(torch.Tensor(
-                np.reshape(np.array(range(self.maxdisp)),[1, self.maxdisp, 1, 1])
-                ).cuda(), requires_grad=False)
+            disp = torch.arange(self.maxdisp, dtype = x.dtype, device = x.device).view(1, self.maxdisp, 1, 1)
             disp = disp.repeat(x.size()[0], 1, x.size()[2], x.size()[3])
             out = torch.sum(x * disp, 1)  # disparity, in size [N,H,W]
         return out
\ No newline at end of file
@@ -1,15 +1,23 @@
 from setuptools import setup
-from torch.utils.cpp_extension import CppExtension, BuildExtension, CUDAExtension
+from torch.utils.cpp_extension import CppExtension, BuildExtension, CUDAExtension, CUDA_HOME
 
 
-setup(
-    name='GANet',
-    ext_modules=[
+# the CPU backend is always built, the CUDA one if CUDA is available;
+ext_modules = [
+    CppExtension('GANet_cpu', [
+        'src/GANet_cpu.cpp',
+    ], extra_compile_args=['-O3', '-fopenmp'], extra_link_args=['-fopenmp'])
+]
+if CUDA_HOME is not None:
+    ext_modules.append(
         CUDAExtension('GANet', [
             'src/GANet_cuda.cpp',
             'src/GANet_kernel.cu',
-        ])
-    ],
+        ]))
+
+setup(
+    name='GANet',
+    ext_modules=ext_modules,
     cmdclass={
         'build_ext': BuildExtension
     })
@@ -0,0 +1,457 @@
+// CPU (OpenMP) version of the SGA and LGA operators of GANet_kernel.cu;
+// the semi-global aggregation is parallelized over the scanlines (of all the
+// samples and channels), the local guided aggregation over the rows of each
+// channel; both forward and backward;
+// the backward is the exact gradient of the forward, including at the start
+// of each scanline, where the CUDA kernels omit the terms of the weights 1-4;
+#include <torch/extension.h>
+#include <vector>
+#include <algorithm>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+// aggregation along one scanline, in the scan order t = 0, ..., L-1, see sga_down_forward():
+//   A[0][d] = x[0][d] * (g0 + g1 + g2 + g3 + g4)
+//   A[t][d] = g0 x[t][d] + g1 A[t-1][d] + g2 A[t-1][d-1] + g3 A[t-1][d+1] + g4 max_d' A[t-1][d']
+// where A[t-1][-1] and A[t-1][D] are replaced by x[t][d];
+// x: stride ts between the positions, ds between the disparities;
+// g: stride gts between the positions, gws between the 5 weights;
+// agg: [L, D], argmax: [L] (first maximum, as the CUDA kernel);
+template <typename scalar_t>
+static void sga_scan_forward (const scalar_t * x, const scalar_t * g,
+			      const int L, const int D, const int64_t ts,
+			      const int64_t ds, const int64_t gts,
+			      const int64_t gws, scalar_t * agg, int *argmax)
+{
+  for (int t = 0; t < L; t++)
+    {
+      const scalar_t *xt = x + t * ts;
+      const scalar_t *gt = g + t * gts;
+      const scalar_t g0 = gt[0], g1 = gt[gws], g2 = gt[2 * gws],
+	g3 = gt[3 * gws], g4 = gt[4 * gws];
+      scalar_t *a = agg + (int64_t) t *D;
+      if (t == 0)
+	{
+	  const scalar_t s = g0 + g1 + g2 + g3 + g4;
+	  for (int d = 0; d < D; d++)
+	    a[d] = xt[d * ds] * s;
+	}
+      else
+	{
+	  const scalar_t *p = a - D;
+	  const scalar_t pmax = p[argmax[t - 1]];
+	  for (int d = 0; d < D; d++)
+	    {
+	      const scalar_t xv = xt[d * ds];
+	      a[d] = g0 * xv + g1 * p[d]
+		+ g2 * (d > 0 ? p[d - 1] : xv)
+		+ g3 * (d + 1 < D ? p[d + 1] : xv) + g4 * pmax;
+	    }
+	}
+      int k = 0;
+      for (int d = 1; d < D; d++)
+	if (a[k] < a[d])
+	  k = d;
+      argmax[t] = k;
+    }
+}
+
+// backward of sga_scan_forward(), with G: [L, D], the gradient of the output
+// of this direction (i.e., where it won the maximum), overwritten;
+template <typename scalar_t>
+static void sga_scan_backward (const scalar_t * x, const scalar_t * g,
+			       const int L, const int D, const int64_t ts,
+			       const int64_t ds, const int64_t gts,
+			       const int64_t gws, const scalar_t * agg,
+			       const int *argmax, scalar_t * G,
+			       scalar_t * grad_x, scalar_t * grad_g)
+{
+  for (int t = L - 1; t >= 0; t--)
+    {
+      const scalar_t *xt = x + t * ts;
+      const scalar_t *gt = g + t * gts;
+      scalar_t *gxt = grad_x + t * ts;
+      scalar_t *ggt = grad_g + t * gts;
+      const scalar_t g0 = gt[0], g1 = gt[gws], g2 = gt[2 * gws],
+	g3 = gt[3 * gws], g4 = gt[4 * gws];
+      const scalar_t *Gt = G + (int64_t) t *D;
+      if (t == 0)
+	{
+	  const scalar_t s = g0 + g1 + g2 + g3 + g4;
+	  scalar_t sx = 0;
+	  for (int d = 0; d < D; d++)
+	    {
+	      gxt[d * ds] += Gt[d] * s;
+	      sx += Gt[d] * xt[d * ds];
+	    }
+	  for (int i = 0; i < 5; i++)
+	    ggt[i * gws] += sx;
+	  continue;
+	}
+      const scalar_t *p = agg + (int64_t) (t - 1) * D;
+      scalar_t *Gp = G + (int64_t) (t - 1) * D;
+      const int k = argmax[t - 1];
+      scalar_t s0 = 0, s1 = 0, s2 = 0, s3 = 0, gsum = 0;
+      for (int d = 0; d < D; d++)
+	{
+	  const scalar_t gv = Gt[d];
+	  const scalar_t xv = xt[d * ds];
+	  scalar_t gx = g0 * gv;
+	  s0 += gv * xv;
+	  s1 += gv * p[d];
+	  Gp[d] += g1 * gv;
+	  if (d > 0)
+	    {
+	      s2 += gv * p[d - 1];
+	      Gp[d - 1] += g2 * gv;
+	    }
+	  else
+	    {
+	      s2 += gv * xv;
+	      gx += g2 * gv;
+	    }
+	  if (d + 1 < D)
+	    {
+	      s3 += gv * p[d + 1];
+	      Gp[d + 1] += g3 * gv;
+	    }
+	  else
+	    {
+	      s3 += gv * xv;
+	      gx += g3 * gv;
+	    }
+	  gsum += gv;
+	  gxt[d * ds] += gx;
+	}
+      Gp[k] += g4 * gsum;
+      ggt[0] += s0;
+      ggt[gws] += s1;
+      ggt[2 * gws] += s2;
+      ggt[3 * gws] += s3;
+      ggt[4 * gws] += gsum * p[k];
+    }
+}
+
+// the layout of the scanlines of one direction: 0 down (top to bottom), 1 up,
+// 2 right (left to right), 3 left, as sga_{down,up,right,left}_forward();
+struct ScanLayout
+{
+  int64_t count, L, ts;
+  int64_t x_offset (int64_t s, int D, int H, int W, int dir) const
+  {
+    const int64_t HW = (int64_t) H * W;
+    if (dir < 2)
+      {
+	// s = nc * W + w;
+	return s / W * D * HW + s % W + (dir == 1 ? (int64_t) (H - 1) * W : 0);
+      }
+    // s = nc * H + h;
+    return s / H * D * HW + s % H * W + (dir == 3 ? W - 1 : 0);
+  }
+  int64_t g_offset (int64_t s, int H, int W, int dir) const
+  {
+    return x_offset (s, 5, H, W, dir);
+  }
+};
+
+static ScanLayout
+get_scan_layout (int64_t NC, int H, int W, int dir)
+{
+  ScanLayout layout;
+  if (dir < 2)
+    {
+      layout.count = NC * W;
+      layout.L = H;
+      layout.ts = dir == 0 ? W : -W;
+    }
+  else
+    {
+      layout.count = NC * H;
+      layout.L = W;
+      layout.ts = dir == 2 ? 1 : -1;
+    }
+  return layout;
+}
+
+template <typename scalar_t>
+static void sga_forward_impl (const at::Tensor & input,
+			      const std::vector < at::Tensor > &guidance,
+			      at::Tensor & output, at::Tensor & mask)
+{
+  const int64_t NC = input.size (0) * input.size (1);
+  const int D = input.size (2), H = input.size (3), W = input.size (4);
+  const int64_t ds = (int64_t) H * W;
+  const scalar_t *x = input.data_ptr < scalar_t > ();
+  scalar_t *out = output.data_ptr < scalar_t > ();
+  uint8_t *m = mask.data_ptr < uint8_t > ();
+  for (int dir = 0; dir < 4; dir++)
+    {
+      const scalar_t *g = guidance[dir].data_ptr < scalar_t > ();
+      const ScanLayout layout = get_scan_layout (NC, H, W, dir);
+      const int L = layout.L;
+#pragma omp parallel
+      {
+	std::vector < scalar_t > agg ((size_t) L * D);
+	std::vector < int >argmax (L);
+#pragma omp for schedule(static)
+	for (int64_t s = 0; s < layout.count; s++)
+	  {
+	    const int64_t xo = layout.x_offset (s, D, H, W, dir);
+	    sga_scan_forward (x + xo, g + layout.g_offset (s, H, W, dir), L,
+			      D, layout.ts, ds, layout.ts, ds, agg.data (),
+			      argmax.data ());
+	    // the maximum over the 4 directions, the first one on ties, as Max();
+	    for (int t = 0; t < L; t++)
+	      for (int d = 0; d < D; d++)
+		{
+		  const int64_t i = xo + t * layout.ts + d * ds;
+		  const scalar_t a = agg[(size_t) t * D + d];
+		  if (dir == 0 || out[i] < a)
+		    {
+		      out[i] = a;
+		      m[i] = dir;
+		    }
+		}
+	  }
+      }
+    }
+}
+
+template <typename scalar_t>
+static void sga_backward_impl (const at::Tensor & input,
+			       const std::vector < at::Tensor > &guidance,
+			       const at::Tensor & mask,
+			       const at::Tensor & gradOutput,
+			       at::Tensor & gradInput,
+			       std::vector < at::Tensor > &gradGuidance)
+{
+  const int64_t NC = input.size (0) * input.size (1);
+  const int D = input.size (2), H = input.size (3), W = input.size (4);
+  const int64_t ds = (int64_t) H * W;
+  const scalar_t *x = input.data_ptr < scalar_t > ();
+  const scalar_t *go = gradOutput.data_ptr < scalar_t > ();
+  const uint8_t *m = mask.data_ptr < uint8_t > ();
+  scalar_t *gx = gradInput.data_ptr < scalar_t > ();
+  for (int dir = 0; dir < 4; dir++)
+    {
+      const scalar_t *g = guidance[dir].data_ptr < scalar_t > ();
+      scalar_t *gg = gradGuidance[dir].data_ptr < scalar_t > ();
+      const ScanLayout layout = get_scan_layout (NC, H, W, dir);
+      const int L = layout.L;
+#pragma omp parallel
+      {
+	std::vector < scalar_t > agg ((size_t) L * D), G ((size_t) L * D);
+	std::vector < int >argmax (L);
+#pragma omp for schedule(static)
+	for (int64_t s = 0; s < layout.count; s++)
+	  {
+	    const int64_t xo = layout.x_offset (s, D, H, W, dir);
+	    const int64_t go_ = layout.g_offset (s, H, W, dir);
+	    // recomputed, as the CUDA version does, instead of saved;
+	    sga_scan_forward (x + xo, g + go_, L, D, layout.ts, ds, layout.ts,
+			      ds, agg.data (), argmax.data ());
+	    for (int t = 0; t < L; t++)
+	      for (int d = 0; d < D; d++)
+		{
+		  const int64_t i = xo + t * layout.ts + d * ds;
+		  G[(size_t) t * D + d] = m[i] == dir ? go[i] : scalar_t (0);
+		}
+	    sga_scan_backward (x + xo, g + go_, L, D, layout.ts, ds,
+			       layout.ts, ds, agg.data (), argmax.data (),
+			       G.data (), gx + xo, gg + go_);
+	  }
+      }
+    }
+}
+
+void
+sga_cpu_forward (at::Tensor input, at::Tensor guidance_down,
+		 at::Tensor guidance_up, at::Tensor guidance_right,
+		 at::Tensor guidance_left, at::Tensor output, at::Tensor mask)
+{
+  std::vector < at::Tensor > guidance =
+    { guidance_down, guidance_up, guidance_right, guidance_left };
+  AT_DISPATCH_FLOATING_TYPES (input.scalar_type (), "sga_cpu_forward", ([&]
+			      {
+			      sga_forward_impl < scalar_t > (input, guidance, output, mask);
+			      }));
+}
+
+void
+sga_cpu_backward (at::Tensor input, at::Tensor guidance_down,
+		  at::Tensor guidance_up, at::Tensor guidance_right,
+		  at::Tensor guidance_left, at::Tensor mask,
+		  at::Tensor gradOutput, at::Tensor gradInput,
+		  at::Tensor grad_down, at::Tensor grad_up,
+		  at::Tensor grad_right, at::Tensor grad_left)
+{
+  std::vector < at::Tensor > guidance =
+    { guidance_down, guidance_up, guidance_right, guidance_left };
+  std::vector < at::Tensor > gradGuidance =
+    { grad_down, grad_up, grad_right, grad_left };
+  AT_DISPATCH_FLOATING_TYPES (input.scalar_type (), "sga_cpu_backward", ([&]
+			      {
+			      sga_backward_impl < scalar_t > (input, guidance, mask, gradOutput, gradInput, gradGuidance);
+			      }));
+}
+
+// local guided aggregation, see lga_filtering_forward():
+//   out[b][c][h][w] = sum_{dc, r, s} f[b][tap][h][w] * x[b][c+dc][h+r][w+s],
+// with tap = (dc+1)*ws*ws + (r+radius)*ws + s+radius, and x[b][c][h][w]
+// for the neighbors out of the volume; x: [B, C, H, W], f: [B, 3*ws*ws, H, W];
+// all the loops below run tap by tap over a row, with w innermost and contiguous;
+template <typename scalar_t>
+static void lga_forward_impl (const at::Tensor & input,
+			      const at::Tensor & filters, at::Tensor & output,
+			      const int radius)
+{
+  const int B = input.size (0), C = input.size (1), H = input.size (2), W =
+    input.size (3);
+  const int ws = 2 * radius + 1, fsize = 3 * ws * ws;
+  const int64_t HW = (int64_t) H * W;
+  const scalar_t *x = input.data_ptr < scalar_t > ();
+  const scalar_t *f = filters.data_ptr < scalar_t > ();
+  scalar_t *out = output.data_ptr < scalar_t > ();
+#pragma omp parallel for schedule(static)
+  for (int64_t bch = 0; bch < (int64_t) B * C * H; bch++)
+    {
+      const int h = bch % H, c = bch / H % C;
+      const int64_t b = bch / H / C;
+      const scalar_t *xb = x + b * C * HW;
+      const scalar_t *fb = f + b * fsize * HW + (int64_t) h * W;
+      const scalar_t *xrow = xb + (int64_t) c * HW + (int64_t) h * W;
+      scalar_t *orow = out + b * C * HW + (int64_t) c * HW + (int64_t) h * W;
+      for (int w = 0; w < W; w++)
+	orow[w] = 0;
+      for (int dc = -1, tap = 0; dc <= 1; dc++)
+	for (int r = -radius; r <= radius; r++)
+	  for (int s = -radius; s <= radius; s++, tap++)
+	    {
+	      const int cc = c + dc, hh = h + r;
+	      const scalar_t *ft = fb + tap * HW;
+	      int w0 = std::max (0, -s), w1 = std::min (W, W - s);
+	      if (cc < 0 || cc >= C || hh < 0 || hh >= H)
+		w0 = w1 = W;
+	      const scalar_t *nrow =
+		xb + (int64_t) cc * HW + (int64_t) hh * W + s;
+	      for (int w = 0; w < w0; w++)
+		orow[w] += ft[w] * xrow[w];
+	      for (int w = w0; w < w1; w++)
+		orow[w] += ft[w] * nrow[w];
+	      for (int w = std::max (w0, w1); w < W; w++)
+		orow[w] += ft[w] * xrow[w];
+	    }
+    }
+}
+
+template <typename scalar_t>
+static void lga_backward_impl (const at::Tensor & input,
+			       const at::Tensor & filters,
+			       const at::Tensor & gradOutput,
+			       at::Tensor & gradInput,
+			       at::Tensor & gradFilters, const int radius)
+{
+  const int B = input.size (0), C = input.size (1), H = input.size (2), W =
+    input.size (3);
+  const int ws = 2 * radius + 1, fsize = 3 * ws * ws;
+  const int64_t HW = (int64_t) H * W;
+  const scalar_t *x = input.data_ptr < scalar_t > ();
+  const scalar_t *f = filters.data_ptr < scalar_t > ();
+  const scalar_t *go = gradOutput.data_ptr < scalar_t > ();
+  scalar_t *gx = gradInput.data_ptr < scalar_t > ();
+  scalar_t *gf = gradFilters.data_ptr < scalar_t > ();
+
+  // filters: gf[b][tap][h][w] = sum_c go[b][c][h][w] * (the neighbor tap of x[b][c][h][w]);
+#pragma omp parallel for schedule(static)
+  for (int64_t bth = 0; bth < (int64_t) B * fsize * H; bth++)
+    {
+      const int h = bth % H, tap = bth / H % fsize;
+      const int64_t b = bth / H / fsize;
+      const int dc = tap / (ws * ws) - 1, r = tap / ws % ws - radius, s =
+	tap % ws - radius;
+      const int hh = h + r;
+      const scalar_t *xb = x + b * C * HW;
+      const scalar_t *gob = go + b * C * HW;
+      scalar_t *gfrow = gf + (b * fsize + tap) * HW + (int64_t) h * W;
+      for (int c = 0; c < C; c++)
+	{
+	  const int cc = c + dc;
+	  const scalar_t *xrow = xb + (int64_t) c * HW + (int64_t) h * W;
+	  const scalar_t *grow = gob + (int64_t) c * HW + (int64_t) h * W;
+	  int w0 = std::max (0, -s), w1 = std::min (W, W - s);
+	  if (cc < 0 || cc >= C || hh < 0 || hh >= H)
+	    w0 = w1 = W;
+	  const scalar_t *nrow =
+	    xb + (int64_t) cc * HW + (int64_t) hh * W + s;
+	  for (int w = 0; w < w0; w++)
+	    gfrow[w] += grow[w] * xrow[w];
+	  for (int w = w0; w < w1; w++)
+	    gfrow[w] += grow[w] * nrow[w];
+	  for (int w = std::max (w0, w1); w < W; w++)
+	    gfrow[w] += grow[w] * xrow[w];
+	}
+    }
+
+  // input, gathered as lga_data_backward(): the neighbor q = p + o reads x[p] by its tap -o,
+  // and p reads itself by the taps o out of the volume;
+#pragma omp parallel for schedule(static)
+  for (int64_t bch = 0; bch < (int64_t) B * C * H; bch++)
+    {
+      const int h = bch % H, c = bch / H % C;
+      const int64_t b = bch / H / C;
+      const scalar_t *fb = f + b * fsize * HW;
+      const scalar_t *gob = go + b * C * HW;
+      const scalar_t *grow = gob + (int64_t) c * HW + (int64_t) h * W;
+      scalar_t *gxrow = gx + b * C * HW + (int64_t) c * HW + (int64_t) h * W;
+      for (int dc = -1, tap = 0; dc <= 1; dc++)
+	for (int r = -radius; r <= radius; r++)
+	  for (int s = -radius; s <= radius; s++, tap++)
+	    {
+	      const int cc = c + dc, hh = h + r;
+	      const scalar_t *ft = fb + tap * HW + (int64_t) h * W;
+	      int w0 = std::max (0, -s), w1 = std::min (W, W - s);
+	      if (cc < 0 || cc >= C || hh < 0 || hh >= H)
+		w0 = w1 = W;
+	      const int64_t q = (int64_t) cc * HW + (int64_t) hh * W + s;
+	      const scalar_t *gnrow = gob + q;
+	      const scalar_t *fmrow = fb + (fsize - 1 - tap) * HW + q - (int64_t) cc * HW;
+	      for (int w = 0; w < w0; w++)
+		gxrow[w] += grow[w] * ft[w];
+	      for (int w = w0; w < w1; w++)
+		gxrow[w] += gnrow[w] * fmrow[w];
+	      for (int w = std::max (w0, w1); w < W; w++)
+		gxrow[w] += grow[w] * ft[w];
+	    }
+    }
+}
+
+void
+lga_cpu_forward (at::Tensor input, at::Tensor filters, at::Tensor output,
+		 const int radius)
+{
+  AT_DISPATCH_FLOATING_TYPES (input.scalar_type (), "lga_cpu_forward", ([&]
+			      {
+			      lga_forward_impl < scalar_t > (input, filters, output, radius);
+			      }));
+}
+
+void
+lga_cpu_backward (at::Tensor input, at::Tensor filters,
+		  at::Tensor gradOutput, at::Tensor gradInput,
+		  at::Tensor gradFilters, const int radius)
+{
+  AT_DISPATCH_FLOATING_TYPES (input.scalar_type (), "lga_cpu_backward", ([&]
+			      {
+			      lga_backward_impl < scalar_t > (input, filters, gradOutput, gradInput, gradFilters, radius);
+			      }));
+}
+
+
+PYBIND11_MODULE (TORCH_EXTENSION_NAME, GANet_cpu)
+{
+  GANet_cpu.def ("lga_cpu_forward", &lga_cpu_forward, "lga forward (CPU)");
+  GANet_cpu.def ("lga_cpu_backward", &lga_cpu_backward, "lga backward (CPU)");
+  GANet_cpu.def ("sga_cpu_forward", &sga_cpu_forward, "sga forward (CPU)");
+  GANet_cpu.def ("sga_cpu_backward", &sga_cpu_backward, "sga backward (CPU)");
+}
@@ -13,6 +13,7 @@ import numpy as np
 
 #added by CCJ:
 from src.modules.cost_volume import cost_volume_faster
+from src.modules.mixed_precision import keep_fp32
 
 class BasicConv(nn.Module):
 
@@ -197,6 +198,8 @@ class Disp(nn.Module):
 #        self.conv32x1 = BasicConv(32, 1, kernel_size=3)
         self.conv32x1 = nn.Conv3d(32, 1, (3, 3, 3), (1, 1, 1), (1, 1, 1), bias=False)
 
+    # the softmin (and LGA) and the regression in fp32, under autocast;
+    @keep_fp32
     def forward(self, x):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], mode='trilinear', align_corners=False)
         x = torch.squeeze(x, 1)
@@ -222,6 +225,7 @@ class DispAgg(nn.Module):
         x = self.LGA2(x, g)
         return x
 
+    @keep_fp32
     def forward(self, x, lg1, lg2):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], mode='trilinear', align_corners=False)
         x = torch.squeeze(x, 1)
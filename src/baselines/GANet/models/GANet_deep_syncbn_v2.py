@@ -21,6 +21,7 @@ import numpy as np
 
 #added by CCJ:
 from src.modules.cost_volume import cost_volume_faster
+from src.modules.mixed_precision import keep_fp32
 
 class BasicConv(nn.Module):
 
@@ -219,6 +220,8 @@ class Disp(nn.Module):
         self.conv32x1 = nn.Conv3d(32, 1, kernel_size=(3, 3, 3), 
                                 stride=(1, 1, 1), padding=(1, 1, 1), bias=False)
 
+    # the softmin (and LGA) and the regression in fp32, under autocast;
+    @keep_fp32
     def forward(self, x):
         x = F.interpolate(self.conv32x1(x), 
                         #NOTE: 
@@ -263,6 +266,7 @@ class DispAgg(nn.Module):
         x = self.LGA2(x, g)
         return x
 
+    @keep_fp32
     def forward(self, x, lg1, lg2):
         x = F.interpolate(self.conv32x1(x), 
                     #NOTE: 
@@ -17,6 +17,7 @@ import numpy as np
 from .net_init import net_init
 
 from src.modules.cost_volume import cost_volume_faster
+from src.modules.mixed_precision import keep_fp32, softmax_fp32
 
 def convbn(in_planes, out_planes, kernel_size, stride, pad):
     return nn.Sequential(nn.Conv2d(in_planes, out_planes, kernel_size=kernel_size, stride=stride, padding=pad, bias=False),
@@ -218,6 +219,7 @@ class GCNet(nn.Module):
         #print ("[???] out shape = ", out.shape)
         return out
 
+    @keep_fp32
     def disparityregression(self, x, maxdisp = None):
         #with torch.cuda.device_of(x):
         N, D, H, W = x.size()[:]
@@ -269,7 +271,7 @@ class GCNet(nn.Module):
             out = out[:,None,...] # add channel C first, i.e., chang [N,D,H,W] to [N,C=1,D,H,W];
             out = F.interpolate(out, [self.maxdisp, H, W], mode='trilinear', align_corners=True) # in size [N,C=1,D,H,W];
             out = torch.squeeze(out, 1) # in size [N,D,H,W]
-        prob = F.softmax(out, 1)
+        prob = softmax_fp32(out, 1)
         #disp = self.disparityregression(prob, maxdisp=self.maxdisp//img_ds_scale)
         #NOTE: This is right!!! Updated on 04/12/2020;
         disp = self.disparityregression(prob, maxdisp=self.maxdisp)
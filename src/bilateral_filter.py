@@ -330,7 +330,8 @@ def apply_batch_bilateral_filter(
         device, 
         dilation,
         x_in = None, 
-        reg_constant=1e-20 # regularization constant
+        reg_constant=1e-20, # regularization constant
+        backend = 'im2col'
         ):
 
     """ using im2col to change the filtering to element-wise matrix multiplication
@@ -346,12 +347,22 @@ def apply_batch_bilateral_filter(
         reg_constant (float)  optional regularization constant for pathalogical cases
         x_in       (Tensor)   input array, in size [N,C,H,W],
                               if not None, then apply the bilateral filter to it;
+        backend      (str)    'im2col', or 'shift' for the shift-and-accumulate filter 
+                              (see src/modules/bilateral.py), which needs x_in, and returns 
+                              no rg_filter, since it never holds the k*k weights;
 
     Returns:
         result (Tensor) output bilateral filter and/or bilateral-filtered x_in
     """
     
     k = 2*win_width + 1
+    if backend == 'shift':
+        if x_in is None:
+            raise ValueError("the shift backend filters x_in, which should not be None")
+        from src.modules.bilateral import bilateral_filter_shift
+        result, filter_sum = bilateral_filter_shift(embed_in, x_in, sg_filter.reshape(-1).tolist(),
+            k, dilation, sigma_v, reg_constant)
+        return None, result, filter_sum
     N,F,H,W = embed_in.shape[:]
     #print ('embed_in shape = ', embed_in.shape)
     
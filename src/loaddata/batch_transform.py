@@ -0,0 +1,110 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: batch_transform.py
+# @brief: batched normalization and photometric augmentation on the training device;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+With `uint8_inputs`, the DataLoader workers of DatasetFromList only emit
+    left, right:    uint8,   [N, 3, H, W]
+    target:         float32, [N, 1, H, W]
+    semantic_label: uint8,   [N, 1, H, W]
+    stats:          float32, [N, 2, 3, 2] (full-image mean/std)
+i.e., 11 bytes per pixel instead of the 15 float32 channels (60 bytes),
+and BatchInputTransform does the rest on the whole batch after collation,
+on the training device:
+    - per-image mean/std normalization (self_guassian_normalize), or
+    - photometric jitter + ImageNet normalization (is_data_augment);
+    - the [0, 1] RGB copies for tensorboard visualization;
+It returns the same 6 tensors as train_transform() and train_transform_augmentation().
+"""
+
+import torch
+from .dataset import photometric_params
+
+imagenet_mean = [0.485, 0.456, 0.406]
+imagenet_std = [0.229, 0.224, 0.225]
+
+
+class BatchRandomPhotometric(object):
+    """ batched version of RandomPhotometric in dataset.py:
+        each sample draws its own parameters, and its left and right images
+        are augmented in the same way;
+    """
+    def __init__(self,
+                 noise_stddev=0.0,
+                 min_contrast=0.0,
+                 max_contrast=0.0,
+                 brightness_stddev=0.0,
+                 min_color=1.0,
+                 max_color=1.0,
+                 min_gamma=1.0,
+                 max_gamma=1.0):
+        self.noise_stddev = noise_stddev
+        self.min_contrast = min_contrast
+        self.max_contrast = max_contrast
+        self.brightness_stddev = brightness_stddev
+        self.min_color = min_color
+        self.max_color = max_color
+        self.min_gamma = min_gamma
+        self.max_gamma = max_gamma
+
+    def __call__(self, ims):
+        """ ims: list of images in [N, 3, H, W], in [0, 1]; """
+        n = ims[0].size(0)
+        opts = {'device': ims[0].device, 'dtype': ims[0].dtype}
+        def uniform(low, high, size):
+            return torch.rand(size, **opts) * (high - low) + low
+
+        contrast = uniform(self.min_contrast, self.max_contrast, (n, 1, 1, 1))
+        gamma_inv = 1.0 / uniform(self.min_gamma, self.max_gamma, (n, 1, 1, 1))
+        color = uniform(self.min_color, self.max_color, (n, 3, 1, 1))
+        noise = torch.randn((n, 1, 1, 1), **opts) * self.noise_stddev
+        brightness = torch.randn((n, 1, 1, 1), **opts) * self.brightness_stddev
+
+        out = []
+        for im in ims:
+            im = (im * (contrast + 1.0) + brightness) * color
+            im = torch.clamp(im, min=0.0, max=1.0)
+            out.append(torch.pow(im, gamma_inv) + noise)
+        return out
+
+
+class BatchInputTransform(object):
+    """ turn the collated uint8 batch of DatasetFromList(uint8_inputs = True) into
+        input1, input2, target, left_rgb, right_rgb, semantic_label, on the device;
+    """
+    def __init__(self, self_guassian_normalize = True, is_data_augment = False):
+        self.self_guassian_normalize = self_guassian_normalize
+        self.is_data_augment = is_data_augment
+        self.color_trans = BatchRandomPhotometric(**photometric_params) if is_data_augment else None
+        self._imagenet_stats = {}
+
+    def get_imagenet_stats(self, device):
+        if device not in self._imagenet_stats:
+            self._imagenet_stats[device] = (
+                torch.tensor(imagenet_mean, device=device).view(1, 3, 1, 1),
+                torch.tensor(imagenet_std, device=device).view(1, 3, 1, 1))
+        return self._imagenet_stats[device]
+
+    def __call__(self, batch_data, device = 'cuda'):
+        left, right, target, semantic_label, stats = [x.to(device, non_blocking=True) for x in batch_data]
+        left = left.float()
+        right = right.float()
+        left_rgb = left / 255.0
+        right_rgb = right / 255.0
+
+        if self.is_data_augment:
+            input1, input2 = self.color_trans([left_rgb, right_rgb])
+            mean, std = self.get_imagenet_stats(left.device)
+            input1 = (input1 - mean) / std
+            input2 = (input2 - mean) / std
+        elif self.self_guassian_normalize:
+            # stats in [N, left/right, R/G/B, mean/std]
+            input1 = (left - stats[:, 0, :, 0, None, None]) / stats[:, 0, :, 1, None, None]
+            input2 = (right - stats[:, 1, :, 0, None, None]) / stats[:, 1, :, 1, None, None]
+        else:
+            input1, input2 = left_rgb, right_rgb
+
+        return input1, input2, target.float(), left_rgb, right_rgb, semantic_label.float()
@@ -20,6 +20,7 @@ from torchvision import transforms
 from torch.utils import data
 import numpy as np
 import matplotlib.pyplot as plt
+from src.loaddata.label_codec import LabelColorCodec
 # Based on https://github.com/mcordts/cityscapesScripts
 CityscapesClass = namedtuple('CityscapesClass', 
         ['name', 'id', 'train_id', 'category', 'category_id',
@@ -80,6 +81,8 @@ def get_cityscapes_labels():
 
         return cs_clr_labels
 
+cityscapes_codec = LabelColorCodec(get_cityscapes_labels())
+
 def encode_cityscapes_segmap(mask):
     """Encode segmentation label images as cityscapes classes
 
@@ -91,12 +94,7 @@ def encode_cityscapes_segmap(mask):
         (np.ndarray): class map with dimensions (M,N), where the value at
         a given location is the integer denoting the class index.
     """
-    mask = mask.astype(int)
-    label_mask = np.zeros((mask.shape[0], mask.shape[1]), dtype=np.int16)
-    for ii, label in enumerate(get_cityscapes_labels()):
-        label_mask[np.where(np.all(mask == label, axis=-1))[:2]] = ii
-    label_mask = label_mask.astype(int)
-    return label_mask
+    return cityscapes_codec.encode(mask)
 
 def decode_cityscapes_segmap(label_mask, plot=False):
     """Decode segmentation class labels into a color image
@@ -110,21 +108,7 @@ def decode_cityscapes_segmap(label_mask, plot=False):
     Returns:
         (np.ndarray, optional): the resulting decoded color image.
     """
-    label_colors = get_cityscapes_labels()
-    #print ("[???] label_colors shape = ", label_colors.shape)
-    r = label_mask.copy()
-    g = label_mask.copy()
-    b = label_mask.copy()
-    n_classes = 34
-    for ll in range(0, n_classes):
-        r[label_mask == ll] = label_colors[ll, 0]
-        g[label_mask == ll] = label_colors[ll, 1]
-        b[label_mask == ll] = label_colors[ll, 2]
-    rgb = np.zeros((label_mask.shape[0], label_mask.shape[1], 3))
-    #print ('[???] rgb shape = ', rgb.shape)
-    rgb[:, :, 0] = r / 255.0
-    rgb[:, :, 1] = g / 255.0
-    rgb[:, :, 2] = b / 255.0
+    rgb = cityscapes_codec.decode(label_mask)
     if plot:
         plt.imshow(rgb)
         plt.show()
@@ -142,41 +126,11 @@ def cityscape_batch_label2RGB(batch_label_mask):
         Returns:
             (np.ndarray, optional): the resulting decoded color image.
         """
-        #print ("[???] batch_label_mask shape = ", batch_label_mask.shape )
-        if batch_label_mask.shape[-1] == 1:
-            channel_dim = -1
-        elif batch_label_mask.shape[1] == 1:
-            channel_dim = 1
-
-        indices = np.squeeze(batch_label_mask, axis=channel_dim).astype(np.int32) # in shape [N, H, W]
-
-
-        N, H, W = indices.shape[:]
-        #print ("[???] indices.shape = ", indices.shape)
-        
-        batch_label_rgb = np.zeros((N,H,W,3))
-        #get cityscape colormap
-        cmap = get_cityscapes_labels() # in shape (34, 3)
-        #print ('[???] camp shape = ', cmap.shape)
-        """ deal with invalid label values due to data augmentation """
         #NOTE: due to data augmentation to label and image, e.g., random rotation,
         # so somewhere will have invalid label values (i.e., label > num_classes = 34),
         # e.g., after augmentation, label = 250, which is in valid, due to 250 > 34;
-        # so we have to take this case into consideration !!!
-        indices[indices >= 34] = 0
-        for j in range(N):
-            
-            #NOTE:assert already verified!!!
-            #tmp_max = np.amax(indices[j])
-            #assert tmp_max < 34, 'batch_idx = {}, max_value_index = {}, max_val = {}'.format(
-            #    j, np.unravel_index(np.argmax(indices[j], axis=None), indices[j].shape), tmp_max)
-            
-            # gather
-            batch_label_rgb[j,:,:,0] = np.take(cmap[:,0], indices[j]) / 255 # Red
-            batch_label_rgb[j,:,:,1] = np.take(cmap[:,1], indices[j]) / 255 # Green
-            batch_label_rgb[j,:,:,2] = np.take(cmap[:,2], indices[j]) / 255 # Blue
-        
-        return batch_label_rgb
+        # the codec maps them to 0;
+        return cityscapes_codec.decode_batch(batch_label_mask)
 
 
 # > this code is adopted from TORCHVISION.DATASETS.CITYSCAPES, at 
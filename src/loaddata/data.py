@@ -18,7 +18,13 @@ def get_training_set(data_path,
         is_semantic=True,
         #is_kt12_gray = True
         kt12_image_mode = 'rgb',
-        is_data_augment = False
+        is_data_augment = False,
+        shard_dir = None,
+        crop_first = False,
+        uint8_inputs = False,
+        in_ram = False,
+        io_threads = 0,
+        manifest = None
         ):
     return DatasetFromList(data_path, train_list,
             crop_size, True, 
@@ -26,7 +32,13 @@ def get_training_set(data_path,
             shift, is_semantic, 
             #is_kt12_gray,
             kt12_image_mode,
-            is_data_augment
+            is_data_augment,
+            shard_dir,
+            crop_first,
+            uint8_inputs,
+            in_ram,
+            io_threads,
+            manifest
             )
 
 
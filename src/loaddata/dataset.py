@@ -16,10 +16,12 @@ import re
 import sys
 
 
+import os
 from os.path import join as pjoin
+from concurrent.futures import ThreadPoolExecutor
 import src.pfmutil as pfm
 import cv2
-from .virtual_kitti2_labels import encode_color_segmap
+from .vkt2_cache import load_vkt2_disparity, load_vkt2_label
 import random
 
 def train_transform(temp_data, crop_height, crop_width, shift=0):
@@ -62,6 +64,10 @@ def train_transform(temp_data, crop_height, crop_width, shift=0):
         start_y = random.randint(0, h - crop_height)
         temp_data = temp_data[:, start_y: start_y + crop_height, start_x: start_x + crop_width]
     
+    return split_temp_data(temp_data)
+
+def split_temp_data(temp_data):
+    """ split the 15-channel temp_data (already cropped) into the training tensors """
     left = temp_data[0: 3, :, :]
     right = temp_data[3: 6, :, :]
     target = temp_data[6: 7, :, :]
@@ -122,15 +128,7 @@ def train_transform_augmentation(temp_data, crop_height, crop_width, scale = [0.
     right_rgb = torch.from_numpy(temp_out_data[:,:,9:12].transpose(2,0,1)) #[H, W, 3]
     semantic_label = torch.from_numpy(semantic_label) # [1, H, W]
     
-    my_color_trans = RandomPhotometric(
-                    noise_stddev=0.0,
-                    min_contrast=-0.3,
-                    max_contrast=0.3,
-                    brightness_stddev=0.02,
-                    min_color=0.9,
-                    max_color=1.1,
-                    min_gamma=0.7,
-                    max_gamma=1.5)
+    my_color_trans = RandomPhotometric(**photometric_params)
 
     # will change [H,W,3] to [3, H, W] 
     left, right = my_color_trans([left, right])
@@ -140,12 +138,47 @@ def train_transform_augmentation(temp_data, crop_height, crop_width, scale = [0.
     return left, right, target, left_rgb, right_rgb, semantic_label
 
 
+def scale_crop_uint8(left, right, disp_left, semantic_label, crop_height, crop_width, 
+        scale = [0.5, 1.15], method = 'nearest'):
+    """ the random scale crop of train_transform_augmentation(), on the uint8 images;
+        the photometric jitter and normalization are done in src/loaddata/batch_transform.py;
+    """
+    h, w = left.shape[0:2]
+    temp_scale = scale[0] + (scale[1] - scale[0]) * random.random()
+    new_crop_h = int(crop_height * temp_scale)
+    new_crop_w = int(crop_width * temp_scale)
+    assert new_crop_h < h and new_crop_w < w
+    start_x = random.randint(0, w - new_crop_w)
+    start_y = random.randint(0, h - new_crop_h)
+    window = (slice(start_y, start_y + new_crop_h), slice(start_x, start_x + new_crop_w))
+    
+    left = resize_images(left[window], crop_height, crop_width, method)
+    right = resize_images(right[window], crop_height, crop_width, method)
+    disp_left = np.array(disp_left[window], dtype=np.float32)
+    disp_left[disp_left == np.inf] = 0
+    disp_left = resize_disparity(disp_left, crop_height, crop_width, method)
+    semantic_label = resize_images(np.ascontiguousarray(semantic_label[window]), crop_height, crop_width, "nearest")
+    return left, right, disp_left, semantic_label
+
+
 #added by CCJ:
 # this code is adapted from PSMNet;
 
 __imagenet_stats = {'mean': [0.485, 0.456, 0.406],
                     'std': [0.229, 0.224, 0.225]}
 
+# photometric augmentation used by train_transform_augmentation();
+photometric_params = {
+    'noise_stddev': 0.0,
+    'min_contrast': -0.3,
+    'max_contrast': 0.3,
+    'brightness_stddev': 0.02,
+    'min_color': 0.9,
+    'max_color': 1.1,
+    'min_gamma': 0.7,
+    'max_gamma': 1.5,
+    }
+
 
 # this code is adapted from HD^3;
 class Normalize(object):
@@ -318,8 +351,33 @@ def normalize_gray_via_mean_std(img, is_mean_std = True):
     else:
         return img/255.0
 
+_io_pools = {}
+def get_io_pool(num_threads):
+    """ thread pool of the current process for the file reads of a sample, 
+        or None (sequential reads) if num_threads <= 0;
+        keyed by pid, so each DataLoader worker creates its own pool after fork;
+    """
+    if num_threads <= 0:
+        return None
+    key = (os.getpid(), num_threads)
+    if key not in _io_pools:
+        _io_pools[key] = ThreadPoolExecutor(max_workers = num_threads)
+    return _io_pools[key]
+
+def read_concurrently(io_pool, *readers):
+    """ run the readers (functions without arguments) in the io_pool, and return their results;
+        cv2.imread, PIL decoding and np.fromfile release the GIL, so the reads and decoding overlap;
+    """
+    if io_pool is None:
+        return [reader() for reader in readers]
+    futures = [io_pool.submit(reader) for reader in readers]
+    return [f.result() for f in futures]
+
 # load sf (scene flow) data
-def load_sfdata(data_path, current_file, self_guassian_normalize = True):
+def load_sfdata(data_path, current_file, self_guassian_normalize = True, io_pool = None, files = None):
+    """ files: the resolved paths (e.g., from the manifest, see manifest.py), or None to 
+        build them from current_file;
+    """
     A = current_file
     #filename = pjoin(data_path, 'frames_finalpass', A)
     filename = pjoin(data_path, A)
@@ -328,29 +386,29 @@ def load_sfdata(data_path, current_file, self_guassian_normalize = True):
     #left  = Image.open(filename)
     #left.show()
     #left  = np.asarray(Image.open(filename), dtype=np.float32, order='C')
-    left = cv2.imread(filename)[:,:,::-1].astype(np.float32) # change BRG to RGB via `::-1`;
-    #print ('[???] left image shape = ', left.shape)
-    #pfm.show_uint8(left)
+    imglname = filename
     #filename = pjoin(data_path, 'frames_finalpass/' + A[:-13] + 'right/' + A[len(A)-8:])
-    filename = pjoin(data_path, A[:-13] + 'right/' + A[len(A)-8:])
+    imgrname = pjoin(data_path, A[:-13] + 'right/' + A[len(A)-8:])
     #print ("[****] rimg: {}".format(filename))
-    right = cv2.imread(filename)[:,:,::-1].astype(np.float32)
-    #pfm.show_uint8(right)
     #filename = pjoin(data_path, 'disparity/' + A[0:-4] + '.pfm')
     #print ("[???]", current_file, type(current_file))
     pos = A.find('/')
     tmp_len = len('frames_finalpass')
-    filename = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-4] + '.pfm')
+    displname = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-4] + '.pfm')
     #print ("[****] ldisp: {}".format(filename))
-    disp_left = pfm.readPFM(filename)
+    #print ("[???] ",data_path +  'disparity/' + A[0:-13] + 'right/' + A[len(A)-8:-4] + '.pfm' )
+    disprname = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-13] + 'right/' + A[len(A)-8:-4] + '.pfm')
+    #print ("[****] rdisp: {}".format(filename))
+    if files is not None:
+        imglname, imgrname, displname, disprname = [files[k] for k in ['left', 'right', 'disp_left', 'disp_right']]
+    left, right, disp_left, disp_right = read_concurrently(io_pool,
+        lambda: cv2.imread(imglname)[:,:,::-1].astype(np.float32), # change BRG to RGB via `::-1`;
+        lambda: cv2.imread(imgrname)[:,:,::-1].astype(np.float32),
+        lambda: pfm.readPFM(displname),
+        lambda: pfm.readPFM(disprname))
     disp_left[disp_left == np.inf] = 0 # set zero as a invalid disparity value;
     #print ('[***] disp_left shape = ', disp_left.shape)
     #pfm.show(disp_left)
-    #print ("[???] ",data_path +  'disparity/' + A[0:-13] + 'right/' + A[len(A)-8:-4] + '.pfm' )
-    filename = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-13] + 'right/' + A[len(A)-8:-4] + '.pfm')
-    #print ("[****] rdisp: {}".format(filename))
-    disp_right = pfm.readPFM(filename)
-    #pfm.show(disp_right)
     height,width = left.shape[:2]
     
     temp_data = np.zeros([8+6+1, height, width], 'float32')
@@ -370,19 +428,21 @@ def load_sfdata(data_path, current_file, self_guassian_normalize = True):
     return temp_data
 
 
-def load_kitti2012_data(file_path, current_file, self_guassian_normalize = True):
-    """ load current file from the list"""
-    filename = pjoin(file_path, 'colored_0/' + current_file)
+def load_kitti2012_data(file_path, current_file, self_guassian_normalize = True, io_pool = None, files = None):
+    """ load current file from the list, or from files (see load_sfdata()) """
+    imglname = pjoin(file_path, 'colored_0/' + current_file)
     #print ("limg: {}".format(filename))
-    left = np.asarray(Image.open(filename),dtype=np.float32, order="C")
     #filename = pjoin(file_path, 'image_1/' + current_file)
-    filename = pjoin(file_path, 'colored_1/' + current_file)
+    imgrname = pjoin(file_path, 'colored_1/' + current_file)
     #print ("rimg: {}".format(filename))
-    right = np.asarray(Image.open(filename), dtype=np.float32, order='C')
-    
-    filename = pjoin(file_path, 'disp_occ_pfm/' + current_file[0:-4]+ '.pfm')
+    displname = pjoin(file_path, 'disp_occ_pfm/' + current_file[0:-4]+ '.pfm')
     #print ("ldisp: {}".format(filename))
-    disp_left = pfm.readPFM(filename)
+    if files is not None:
+        imglname, imgrname, displname = [files[k] for k in ['left', 'right', 'disp_left']]
+    left, right, disp_left = read_concurrently(io_pool,
+        lambda: np.asarray(Image.open(imglname),dtype=np.float32, order="C"),
+        lambda: np.asarray(Image.open(imgrname), dtype=np.float32, order='C'),
+        lambda: pfm.readPFM(displname))
     height, width = disp_left.shape[:2]
     #disp_left[disp_left == np.inf] = width*2 #set 2*width as a invalid disparity value;
     disp_left[disp_left == np.inf] = 0 # set zero as a invalid disparity value;
@@ -401,16 +461,25 @@ def load_kitti2012_data(file_path, current_file, self_guassian_normalize = True)
     temp_data[13, :, :] = right[:,:,2]/255.0 #B
     return temp_data
 
-def load_kitti2012_gray_data(file_path, current_file, self_guassian_normalize = True):
-    """ load current file from the list"""
+def load_kitti2012_gray_data(file_path, current_file, self_guassian_normalize = True, io_pool = None, files = None):
+    """ load current file from the list, or from files (see load_sfdata()) """
     imglname = pjoin(file_path, 'image_0/' + current_file)
-    left = np.asarray(Image.open(imglname), dtype=np.float32, order="C")
-    #print ("left shape = ", left.shape)
     imgrname = pjoin(file_path, 'image_1/' + current_file)
-    right = np.asarray(Image.open(imgrname), dtype=np.float32, order='C')
-    #print ("right shape = ", right.shape)
     displname = pjoin(file_path, 'disp_occ_pfm/' + current_file[0:-4]+ '.pfm')
-    disp_left = pfm.readPFM(displname)
+    rgb_lname = pjoin(file_path, 'colored_0/' + current_file)
+    rgb_rname = pjoin(file_path, 'colored_1/' + current_file)
+    if files is not None:
+        # (the color images, for visualization only, are not in the manifest;)
+        imglname, imgrname, displname = [files[k] for k in ['left', 'right', 'disp_left']]
+    left, right, disp_left, left_rgb, right_rgb = read_concurrently(io_pool,
+        lambda: np.asarray(Image.open(imglname), dtype=np.float32, order="C"),
+        lambda: np.asarray(Image.open(imgrname), dtype=np.float32, order='C'),
+        lambda: pfm.readPFM(displname),
+        # for tensorboard visualization
+        lambda: np.asarray(Image.open(rgb_lname), dtype=np.float32, order="C"),
+        lambda: np.asarray(Image.open(rgb_rname), dtype=np.float32, order="C"))
+    #print ("left shape = ", left.shape)
+    #print ("right shape = ", right.shape)
     #print ("disp shape = ", disp_left.shape)
     #print ("limg: {}, rimg: {}, ldisp: {}".format(imglname, imgrname, displname))
     height, width = disp_left.shape[:2]
@@ -432,11 +501,6 @@ def load_kitti2012_gray_data(file_path, current_file, self_guassian_normalize =
     
     temp_data[6, :, :] = disp_left
     # save for tensorboard visualization
-    rgb_lname = pjoin(file_path, 'colored_0/' + current_file)
-    left_rgb = np.asarray(Image.open(rgb_lname), dtype=np.float32, order="C")
-    rgb_rname = pjoin(file_path, 'colored_1/' + current_file)
-    right_rgb = np.asarray(Image.open(rgb_rname), dtype=np.float32, order="C")
-    # save for tensorboard visualization
     temp_data[8, :, :] = left_rgb[:,:,0]/255.0 #R 
     temp_data[9, :, :] = left_rgb[:,:,1]/255.0 #G
     temp_data[10, :, :] = left_rgb[:,:,2]/255.0 #B
@@ -446,18 +510,25 @@ def load_kitti2012_gray_data(file_path, current_file, self_guassian_normalize =
     return temp_data
 
 
-def load_kitti2015_data(file_path, current_file, is_semantic = True, self_guassian_normalize = True):
-    """ load current file from the list"""
-    filename = pjoin(file_path, 'image_0/' + current_file)
+def load_kitti2015_data(file_path, current_file, is_semantic = True, self_guassian_normalize = True, io_pool = None,
+        files = None):
+    """ load current file from the list, or from files (see load_sfdata()) """
+    imglname = pjoin(file_path, 'image_0/' + current_file)
     #print ("limg: {}".format(filename))
-    left = np.asarray(Image.open(filename), dtype=np.float32, order="C")
-    filename = pjoin(file_path, 'image_1/' + current_file)
+    imgrname = pjoin(file_path, 'image_1/' + current_file)
     #print ("rimg: {}".format(filename))
-    right = np.asarray(Image.open(filename), dtype=np.float32, order="C")
-    filename = file_path + 'disp_occ_0_pfm/' + current_file[0:-4] + '.pfm'
+    displname = pjoin(file_path, 'disp_occ_0_pfm/' + current_file[0:-4] + '.pfm')
     #print ("ldisp: {}".format(filename))
-
-    disp_left = pfm.readPFM(filename)
+    # uint8 gray png image
+    semantic_name = pjoin(file_path, '../data_semantics/training/semantic/' + current_file)
+    if files is not None:
+        imglname, imgrname, displname = [files[k] for k in ['left', 'right', 'disp_left']]
+        semantic_name = files.get('semantic_label', semantic_name)
+    left, right, disp_left, semantic_label = read_concurrently(io_pool,
+        lambda: np.asarray(Image.open(imglname), dtype=np.float32, order="C"),
+        lambda: np.asarray(Image.open(imgrname), dtype=np.float32, order="C"),
+        lambda: pfm.readPFM(displname),
+        lambda: np.asarray(Image.open(semantic_name), dtype=np.float32, order="C") if is_semantic else None)
     height, width = disp_left.shape[:2]
     #disp_left[disp_left == np.inf] = width*2 # set 2*width as a invalid disparity value;
     disp_left[disp_left == np.inf] = 0 # set zero as a invalid disparity value;
@@ -476,10 +547,6 @@ def load_kitti2015_data(file_path, current_file, is_semantic = True, self_guassi
     temp_data[13, :, :] = right[:,:,2]/255.0 #B
     # semantic segmentaion label
     if is_semantic:
-        # uint8 gray png image
-        filename = pjoin(file_path, '../data_semantics/training/semantic/' + current_file)
-        #print ("semantic label: {}".format(filename))
-        semantic_label = np.asarray(Image.open(filename), dtype=np.float32, order="C")
         #pfm.show(semantic_label)
         temp_data[14,:,:] = semantic_label
     
@@ -513,7 +580,8 @@ def get_virtual_kitti2_filelist(file_list_txt = './lists/virtual_kitti2_train.li
     print ("[***] Virtual KITTI 2: %s has %d images." %(file_list_txt, len(file_list_new)))
     return file_list_new
 
-def load_virtual_kitti2_data(file_path, current_file, is_semantic = True, self_guassian_normalize = True):
+def load_virtual_kitti2_data(file_path, current_file, is_semantic = True, self_guassian_normalize = True, io_pool = None,
+        files = None):
     # e.g., current_file = "Scene01/15-deg-left/frames/rgb/Camera_0/rgb_00001.jpg"
     # e.g., file_path = "/media/ccjData2/datasets/Virtual-KITTI-V2/"
     A = current_file 
@@ -521,39 +589,20 @@ def load_virtual_kitti2_data(file_path, current_file, is_semantic = True, self_g
     imglname = pjoin(file_path, "vkitti_2.0.3_rgb/" + A) 
     
     """ load current file from the list"""
-    left = cv2.imread(imglname)[:,:,::-1].astype(np.float32) # change BRG to RGB via ``::-1`;
-    #pfm.show_uint8(left, title='left image')
     imgrname = pjoin(file_path, "vkitti_2.0.3_rgb/" + A[:-22] + 'Camera_1/' + A[-13:])
-    right = cv2.imread(imgrname)[:,:,::-1].astype(np.float32) # change BRG to RGB via ``::-1`;
-    #pfm.show_uint8(right, title= 'right image')
-    height, width = left.shape[:2]
-    
-    depth_png_filename = pjoin(file_path, "vkitti_2.0.3_depth/" + A[:-26] + 'depth/Camera_0/depth_' + A[-9:-4] + ".png")
-    #print ("imgl = ", imglname, ", imgr = ", imgrname, ", depth_left = ", depth_png_filename)
-    #NOTE: The depth map in centimeters can be directly loaded
-    depth_left = cv2.imread(depth_png_filename, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
-
-    # Intrinsi: f_x = f_y = 725.0087 
-    # offset(i.e., distance between stereo views): B = 0.532725 m = 53.2725 cm
-    B = 53.2725 # in centimeters;
-    f = 725.0087 # in pixels
-    # set zero as a invalid disparity value;
-    disp_left = np.zeros([height, width], 'float32')
-    mask = depth_left > 0
-    #pfm.show_uint8(mask*255, title='mask')
-
-    disp_left[mask] = f*B/ depth_left[mask] # d = fB/z
+    if files is not None:
+        # (the disparity and the label: from their caches, if valid, see vkt2_cache.py;)
+        imglname, imgrname = files['left'], files['right']
+    left, right, disp_left, semantic_label = read_concurrently(io_pool,
+        lambda: cv2.imread(imglname)[:,:,::-1].astype(np.float32), # change BRG to RGB via ``::-1`;
+        lambda: cv2.imread(imgrname)[:,:,::-1].astype(np.float32),
+        # disparity (d = fB/z) from the depth png, or from the cache (see vkt2_cache.py);
+        lambda: load_vkt2_disparity(file_path, A),
+        #loadding semantic segmantation labels, or from the cache (see vkt2_cache.py);
+        lambda: load_vkt2_label(file_path, A) if is_semantic else None)
+    #pfm.show_uint8(left, title='left image')
     #pfm.show(disp_left, title='disp_left')
-    
-    #NOTE: saving disparity file if needed!
-    #disp_pfm_filename = pjoin(file_path, "vkitti_2.0.3_disparity/" + A[:-26] + 'disparity/Camera_0/disparity_' + A[-9:-4] + ".pfm")
-    #print ("disp_pfm_filename = ", disp_pfm_filename)
-    #tmp_len = disp_pfm_filename.rfind("/")
-    #tmp_dir = disp_pfm_filename[0:tmp_len]
-    #print ("tmp_dir = ", tmp_dir)
-    #if not os.path.exists(tmp_dir):
-    #    os.makedirs(tmp_dir)
-    #pfm.save(disp_pfm_filename, disp_left)
+    height, width = left.shape[:2]
 
     temp_data = np.zeros([8+6+1, height, width], 'float32')
     temp_data[0],temp_data[1],temp_data[2] = normalize_rgb_via_mean_std(left, is_mean_std=self_guassian_normalize)
@@ -569,17 +618,169 @@ def load_virtual_kitti2_data(file_path, current_file, is_semantic = True, self_g
     temp_data[13, :, :] = right[:,:,2]/255.0 #B
     # semantic segmentaion label
     if is_semantic:
-        #loadding semantic segmantation labels
-        seg_filename = pjoin(file_path, "vkitti_2.0.3_classSegmentation/" + A[:-26] + 'classSegmentation/Camera_0/classgt_' + A[-9:-4] + ".png")
-        #print ("semantic label: {}".format(seg_filename))
-        semantic_rgb_label = cv2.imread(seg_filename)[:,:,::-1] # change BRG to RGB via ``::-1`;
-        #pfm.show_uint8(semantic_rgb_label, title="semantic_rgb_label")
-        semantic_label = encode_color_segmap(semantic_rgb_label)
         #pfm.show(semantic_label, title="semantic_label")
         temp_data[14,:,:] = semantic_label.astype(np.float32)
     
     return temp_data
 
+""" uint8 loaders, used by the packed shards (see src/loaddata/shard_pack.py) """
+def load_raw_data(data_path, current_file, 
+        kitti2012 = False, kitti2015 = False, virtual_kitti2 = False, 
+        is_semantic = True, kt12_image_mode = 'rgb', disp_mmap = False, io_pool = None, files = None):
+    """ load the current file without any float conversion or normalization;
+        returns:
+            left, right: uint8 RGB images in [H, W, 3];
+            disp_left: float32 disparity in [H, W], zero as invalid value;
+                if disp_mmap, it is a read-only memmap of the PFM file, in which 
+                inf is not replaced yet (see build_temp_data());
+            semantic_label: uint8 label map in [H, W], or None if not available;
+        NOTE: for KT12 'gray' and 'gray2rgb' modes, the gray image is copied to the 
+        three channels, i.e., the same input the network gets from load_kitti2012_gray_data();
+        files: the resolved paths (e.g., from the manifest, see manifest.py), or None to 
+        resolve them via get_sample_files();
+    """
+    A = current_file
+    read_png = lambda x: np.asarray(Image.open(x), dtype=np.uint8)
+    read_rgb = lambda x: np.ascontiguousarray(cv2.imread(x)[:,:,::-1]) # change BRG to RGB via ``::-1`;
+    read_label = lambda x: None
+    if kitti2012:
+        if kt12_image_mode in ['gray', 'gray2rgb']:
+            read_image = lambda x: np.stack([read_png(x)]*3, axis=2)
+        else:
+            read_image = read_png
+        read_disp = lambda x: pfm.readPFM(x, disp_mmap)
+    elif kitti2015:
+        read_image = read_png
+        read_disp = lambda x: pfm.readPFM(x, disp_mmap)
+        if is_semantic:
+            read_label = read_png
+    elif virtual_kitti2:
+        read_image = read_rgb
+        # from the cache if it is valid, see vkt2_cache.py;
+        read_disp = lambda x: load_vkt2_disparity(data_path, A, disp_mmap)
+        if is_semantic:
+            read_label = lambda x: load_vkt2_label(data_path, A)
+    else: # scene flow
+        read_image = read_rgb
+        read_disp = lambda x: pfm.readPFM(x, disp_mmap)
+    
+    if files is None:
+        files = get_sample_files(data_path, A, kitti2012, kitti2015, virtual_kitti2, is_semantic, kt12_image_mode)
+    left, right, disp_left, semantic_label = read_concurrently(io_pool,
+        lambda: read_image(files['left']), 
+        lambda: read_image(files['right']),
+        lambda: read_disp(files.get('disp_left')), 
+        lambda: read_label(files.get('semantic_label')))
+    
+    if not isinstance(disp_left, np.memmap):
+        disp_left[disp_left == np.inf] = 0 # set zero as a invalid disparity value;
+    return left, right, disp_left, semantic_label
+
+
+def get_sample_files(data_path, current_file, 
+        kitti2012 = False, kitti2015 = False, virtual_kitti2 = False, 
+        is_semantic = True, kt12_image_mode = 'rgb', with_extra = False):
+    """ paths of the files read for the current sample, as a dict of 
+        'left', 'right', 'disp_left' (not for Virtual KITTI 2), 'disp_right' (scene flow only), 
+        'semantic_label' (KITTI 2015 only), and, if with_extra, 'extra' (the other files 
+        read by the loaders, e.g., for read-ahead);
+    """
+    A = current_file
+    files = {}
+    if kitti2012:
+        if kt12_image_mode in ['gray', 'gray2rgb']:
+            files['left'] = pjoin(data_path, 'image_0/' + A)
+            files['right'] = pjoin(data_path, 'image_1/' + A)
+            if with_extra: # load_kitti2012_gray_data() reads the color images for visualization;
+                files['extra'] = [pjoin(data_path, 'colored_0/' + A), pjoin(data_path, 'colored_1/' + A)]
+        else:
+            files['left'] = pjoin(data_path, 'colored_0/' + A)
+            files['right'] = pjoin(data_path, 'colored_1/' + A)
+        files['disp_left'] = pjoin(data_path, 'disp_occ_pfm/' + A[0:-4]+ '.pfm')
+    
+    elif kitti2015:
+        files['left'] = pjoin(data_path, 'image_0/' + A)
+        files['right'] = pjoin(data_path, 'image_1/' + A)
+        files['disp_left'] = pjoin(data_path, 'disp_occ_0_pfm/' + A[0:-4] + '.pfm')
+        if is_semantic:
+            files['semantic_label'] = pjoin(data_path, '../data_semantics/training/semantic/' + A)
+    
+    elif virtual_kitti2:
+        files['left'] = pjoin(data_path, "vkitti_2.0.3_rgb/" + A)
+        files['right'] = pjoin(data_path, "vkitti_2.0.3_rgb/" + A[:-22] + 'Camera_1/' + A[-13:])
+    
+    if virtual_kitti2 and with_extra:
+        from .vkt2_cache import (get_vkt2_depth_path, get_vkt2_segmap_path, 
+            get_vkt2_disparity_cache_path, get_vkt2_label_cache_path, is_cache_valid)
+        # the cached maps if they are valid, otherwise their sources;
+        files['extra'] = []
+        for src_path, cache_path in [(get_vkt2_depth_path(data_path, A), get_vkt2_disparity_cache_path(data_path, A)), 
+                (get_vkt2_segmap_path(data_path, A), get_vkt2_label_cache_path(data_path, A))][:2 if is_semantic else 1]:
+            files['extra'].append(cache_path if is_cache_valid(cache_path, src_path) else src_path)
+    
+    elif not (kitti2012 or kitti2015 or virtual_kitti2): # scene flow
+        files['left'] = pjoin(data_path, A)
+        files['right'] = pjoin(data_path, A[:-13] + 'right/' + A[len(A)-8:])
+        pos = A.find('/')
+        tmp_len = len('frames_finalpass')
+        files['disp_left'] = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-4] + '.pfm')
+        files['disp_right'] = pjoin(data_path, A[0:pos] + '/disparity' + A[pos+1+tmp_len:-13] + 'right/' + A[len(A)-8:-4] + '.pfm')
+    return files
+
+
+def get_rgb_mean_std(img):
+    """ per-channel mean and std of the full image, in [3, 2] float32;
+        computed exactly as normalize_rgb_via_mean_std() does, so that the 
+        normalization of a crop gives the same values as cropping the normalized image;
+    """
+    img = img.astype(np.float32)
+    stats = np.zeros([3, 2], 'float32')
+    for c in range(3):
+        stats[c, 0] = np.mean(img[:, :, c])
+        stats[c, 1] = np.std(img[:, :, c])
+    return stats
+
+
+def get_rgb_mean_std_uint8(img):
+    """ the same statistics as get_rgb_mean_std(), but computed from the 
+        histogram of the uint8 image, without any float copy of the full image;
+        it matches get_rgb_mean_std() up to float32 rounding;
+    """
+    assert img.dtype == np.uint8
+    levels = np.arange(256, dtype=np.float64)
+    stats = np.zeros([3, 2], 'float32')
+    for c in range(3):
+        hist = np.bincount(img[:, :, c].ravel(), minlength=256).astype(np.float64)
+        n = hist.sum()
+        mean = (hist * levels).sum() / n
+        stats[c, 0] = mean
+        stats[c, 1] = np.sqrt((hist * (levels - mean)**2).sum() / n)
+    return stats
+
+
+def build_temp_data(left, right, disp_left, semantic_label, 
+        left_stats, right_stats, self_guassian_normalize = True):
+    """ build the 15-channel temp_data from uint8 images (or crops of them);
+        left_stats/right_stats: full-image mean/std from get_rgb_mean_std();
+    """
+    height, width = left.shape[:2]
+    temp_data = np.zeros([8+6+1, height, width], 'float32')
+    for i, (img, stats) in enumerate([(left, left_stats), (right, right_stats)]):
+        img = img.astype(np.float32)
+        for c in range(3):
+            if self_guassian_normalize:
+                temp_data[3*i + c] = (img[:, :, c] - stats[c, 0]) / stats[c, 1]
+            else:
+                temp_data[3*i + c] = img[:, :, c]/255.0
+            # save for tensorboard visualization
+            temp_data[8 + 3*i + c] = img[:, :, c]/255.0
+    temp_data[6, :, :] = disp_left
+    temp_data[6][temp_data[6] == np.inf] = 0 # set zero as a invalid disparity value;
+    if semantic_label is not None:
+        temp_data[14, :, :] = semantic_label
+    return temp_data
+
+
 class DatasetFromList(data.Dataset): 
     def __init__(self, data_path, 
             file_list_txt, 
@@ -590,7 +791,13 @@ class DatasetFromList(data.Dataset):
             shift=0, 
             is_semantic=True,
             kt12_image_mode = 'rgb',
-            is_data_augment = False
+            is_data_augment = False,
+            shard_dir = None, # if set, read samples from the packed shards (see shard_pack.py);
+            crop_first = False, # draw the crop window first, and only normalize the crop;
+            uint8_inputs = False, # return uint8 crops, normalized later by src/loaddata/batch_transform.py;
+            in_ram = False, # decode the list once into shared memory (see ram_arena.py);
+            io_threads = 0, # threads to read the files of a sample concurrently, 0 for sequential reads;
+            manifest = None # manifest of the list (see manifest.py), validated before training;
             ):
         super(DatasetFromList, self).__init__()
         #self.image_filenames = [join(image_dir, x) for x in listdir(image_dir) if is_image_file(x)]
@@ -635,23 +842,194 @@ class DatasetFromList(data.Dataset):
             self.my_kwargs.update({
                 'shift':  self.shift
             })
+        
+        self.crop_first = crop_first
+        # full-image mean/std per file, for crop_first loading;
+        self.stats_cache = {}
+        self.shard_reader = None
+        if shard_dir:
+            from .shard_pack import ShardReader
+            self.shard_reader = ShardReader(shard_dir)
+            assert self.shard_reader.file_list == self.file_list, \
+                "shards at {} were not packed from {}".format(shard_dir, file_list_txt)
+            print ("[***] reading samples from the packed shards at {}".format(shard_dir))
+        elif in_ram:
+            from .ram_arena import RamArena
+            self.shard_reader = RamArena(data_path, self.file_list,
+                kitti2012, kitti2015, virtual_kitti2, is_semantic, self.kt12_image_mode)
+        
+        self.io_threads = io_threads
+        self.manifest = None
+        if manifest:
+            from .manifest import Manifest
+            self.manifest = Manifest(manifest, data_path)
+            self.manifest.validate(self.file_list)
+            print ("[***] file paths from the manifest {}".format(manifest))
+        self.uint8_inputs = uint8_inputs
+        if uint8_inputs:
+            assert self.shift == 0, "shift > 0 is not supported with uint8_inputs"
+            self.my_kwargs_uint8 = {k: v for k, v in self.my_kwargs.items() if k in ['scale', 'method']}
+    
+    def get_crop_window(self, height, width):
+        """ draw the random crop window as train_transform() does;
+            returns None if the full image is needed (padding, shift or augmentation);
+        """
+        if not self.training or self.is_data_augment or self.shift > 0:
+            return None
+        if height <= self.crop_height or width <= self.crop_width:
+            return None
+        start_x = random.randint(0, width - self.crop_width)
+        start_y = random.randint(0, height - self.crop_height)
+        return start_y, start_x
+    
+    def get_image_stats(self, index, left, right):
+        """ cached full-image mean/std of the left and right images """
+        if index not in self.stats_cache:
+            self.stats_cache[index] = (get_rgb_mean_std_uint8(left), get_rgb_mean_std_uint8(right))
+        return self.stats_cache[index]
+    
+    def get_sample_files(self, index):
+        """ all the files read for the sample, e.g., for read-ahead (see read_ahead.py);
+            empty if the samples are read from the shards or from RAM;
+        """
+        if self.shard_reader is not None:
+            return []
+        if self.manifest is not None:
+            files = self.manifest.get_files(index)
+        else:
+            files = get_sample_files(self.data_path, self.file_list[index], 
+                self.kitti2012, self.kitti2015, self.virtual_kitti2, self.is_semantic, self.kt12_image_mode, 
+                with_extra = True)
+        # load_raw_data() (crop_first or uint8_inputs) does not read the right disparity;
+        if self.crop_first or self.uint8_inputs:
+            files.pop('disp_right', None)
+        paths = files.pop('extra', [])
+        return list(files.values()) + paths
+
+    def load_cropped_raw(self, index):
+        """ crop-first loading, from the packed shards or from the raw files;
+            returns the uint8 left/right, disp_left and semantic_label of the crop 
+            (or of the full image if window is None), the full-image stats and the window;
+        """
+        if self.shard_reader is not None:
+            reader = self.shard_reader
+            height, width = reader.get_size(index)
+            window = self.get_crop_window(height, width)
+            if window is None:
+                left, right, disp_left, semantic_label = reader.read_crop(index)
+            else:
+                left, right, disp_left, semantic_label = reader.read_crop(index, window[0], window[1],
+                    self.crop_height, self.crop_width)
+            left_stats, right_stats = reader.get_stats(index)
+        else:
+            left, right, disp_left, semantic_label = load_raw_data(self.data_path, self.file_list[index],
+                self.kitti2012, self.kitti2015, self.virtual_kitti2, self.is_semantic, self.kt12_image_mode,
+                disp_mmap = True, io_pool = get_io_pool(self.io_threads),
+                files = self.manifest.get_files(index) if self.manifest is not None else None)
+            window = self.get_crop_window(*left.shape[:2])
+            left_stats, right_stats = self.get_image_stats(index, left, right)
+            if window is not None:
+                y0, x0 = window
+                y1, x1 = y0 + self.crop_height, x0 + self.crop_width
+                left = left[y0:y1, x0:x1]
+                right = right[y0:y1, x0:x1]
+                disp_left = disp_left[y0:y1, x0:x1]
+                if semantic_label is not None:
+                    semantic_label = semantic_label[y0:y1, x0:x1]
+        if not self.is_semantic:
+            semantic_label = None
+        return left, right, disp_left, semantic_label, left_stats, right_stats, window
+
+    def load_cropped_data(self, index):
+        """ crop-first loading; returns the temp_data and the flag if it has been cropped already """
+        left, right, disp_left, semantic_label, left_stats, right_stats, window = self.load_cropped_raw(index)
+        temp_data = build_temp_data(left, right, disp_left, semantic_label,
+            left_stats, right_stats, self.self_guassian_normalize)
+        return temp_data, window is not None
+
+    def load_uint8_data(self, index):
+        """ the sample without any normalization, see src/loaddata/batch_transform.py;
+            returns:
+                left, right: uint8 tensors in [3, h, w];
+                target: float32 disparity in [1, h, w], zero as invalid value;
+                semantic_label: uint8 tensor in [1, h, w], all zeros if is_semantic == False;
+                stats: float32 tensor in [2, 3, 2], full-image [left/right, R/G/B, mean/std];
+            NOTE: an image smaller than the crop is zero-padded at the top-left as train_transform() 
+            does, but the padded pixels are normalized on the device later, instead of being zeros 
+            in the normalized images;
+        """
+        left, right, disp_left, semantic_label, left_stats, right_stats, window = self.load_cropped_raw(index)
+        height, width = left.shape[:2]
+        if semantic_label is None:
+            semantic_label = np.zeros([height, width], 'uint8')
+        
+        if window is None and self.training and self.is_data_augment:
+            left, right, disp_left, semantic_label = scale_crop_uint8(left, right, disp_left, semantic_label,
+                self.crop_height, self.crop_width, **self.my_kwargs_uint8)
+        
+        elif window is None and self.training:
+            # as train_transform(), per axis: random crop if it is larger than the crop, 
+            # zero-padding at the top / left if it is smaller;
+            y0, x0 = 0, 0
+            if height > self.crop_height or width > self.crop_width:
+                # (in the order of train_transform(), for the same random crop;)
+                x0 = random.randint(0, max(0, width - self.crop_width))
+                y0 = random.randint(0, max(0, height - self.crop_height))
+            out = [x[y0:y0 + self.crop_height, x0:x0 + self.crop_width] for x in [left, right, disp_left, semantic_label]]
+            pad_y, pad_x = self.crop_height - out[0].shape[0], self.crop_width - out[0].shape[1]
+            if pad_y > 0 or pad_x > 0:
+                for i, x in enumerate(out):
+                    out[i] = np.zeros([self.crop_height, self.crop_width] + list(x.shape[2:]), x.dtype)
+                    out[i][pad_y:, pad_x:] = x
+            left, right, disp_left, semantic_label = out
+        
+        elif window is None: # center crop, as valid_transform();
+            y0 = max(0, (height - self.crop_height) // 2)
+            x0 = max(0, (width - self.crop_width) // 2)
+            y1, x1 = y0 + self.crop_height, x0 + self.crop_width
+            left, right = left[y0:y1, x0:x1], right[y0:y1, x0:x1]
+            disp_left, semantic_label = disp_left[y0:y1, x0:x1], semantic_label[y0:y1, x0:x1]
+        
+        target = np.array(disp_left, dtype = np.float32)[None]
+        target[target == np.inf] = 0 # set zero as a invalid disparity value;
+        stats = np.stack([left_stats, right_stats]).astype(np.float32)
+        return (torch.from_numpy(np.ascontiguousarray(left.transpose(2, 0, 1))),
+                torch.from_numpy(np.ascontiguousarray(right.transpose(2, 0, 1))),
+                torch.from_numpy(target),
+                torch.from_numpy(np.array(semantic_label, dtype=np.uint8)[None]),
+                torch.from_numpy(stats))
 
     def __getitem__(self, index):
     #    print self.file_list[index]
-        if self.kitti2012 and self.kt12_image_mode in ['gray', 'gray2rgb']: #load kitti2012 gray dataset
-            temp_data = load_kitti2012_gray_data(self.data_path, self.file_list[index], self.self_guassian_normalize)
+        if self.uint8_inputs:
+            return self.load_uint8_data(index)
+        
+        # the paths from the manifest, otherwise built by each loader;
+        files = self.manifest.get_files(index) if self.manifest is not None else None
+        if self.shard_reader is not None or self.crop_first:
+            temp_data, is_cropped = self.load_cropped_data(index)
+            if is_cropped:
+                return split_temp_data(temp_data)
+        
+        elif self.kitti2012 and self.kt12_image_mode in ['gray', 'gray2rgb']: #load kitti2012 gray dataset
+            temp_data = load_kitti2012_gray_data(self.data_path, self.file_list[index], self.self_guassian_normalize, 
+                io_pool = get_io_pool(self.io_threads), files = files)
 
         elif self.kitti2012 and self.kt12_image_mode == 'rgb' : #load kitti2012 color dataset
-            temp_data = load_kitti2012_data(self.data_path, self.file_list[index], self.self_guassian_normalize)
+            temp_data = load_kitti2012_data(self.data_path, self.file_list[index], self.self_guassian_normalize, 
+                io_pool = get_io_pool(self.io_threads), files = files)
         
         elif self.kitti2015: #load kitti2015 dataset
-            temp_data = load_kitti2015_data(self.data_path, self.file_list[index], self.is_semantic, self.self_guassian_normalize)
+            temp_data = load_kitti2015_data(self.data_path, self.file_list[index], self.is_semantic, self.self_guassian_normalize,
+                io_pool = get_io_pool(self.io_threads), files = files)
         
         elif self.virtual_kitti2: #load virtual kitti 2 dataset
-            temp_data = load_virtual_kitti2_data(self.data_path, self.file_list[index], self.is_semantic, self.self_guassian_normalize)
+            temp_data = load_virtual_kitti2_data(self.data_path, self.file_list[index], self.is_semantic, self.self_guassian_normalize,
+                io_pool = get_io_pool(self.io_threads), files = files)
         
         else: #load scene flow dataset
-            temp_data = load_sfdata(self.data_path, self.file_list[index], self.self_guassian_normalize)
+            temp_data = load_sfdata(self.data_path, self.file_list[index], self.self_guassian_normalize,
+                io_pool = get_io_pool(self.io_threads), files = files)
         
         if self.training:
             input1, input2, target, input1_rgb, input2_rgb, semantic_label = self.train_trans(temp_data, 
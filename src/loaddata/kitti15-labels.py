@@ -11,6 +11,7 @@ from collections import namedtuple
 import numpy as np
 import matplotlib.pyplot as plt
 from PIL import Image
+from src.loaddata.label_codec import LabelColorCodec
 
 
 #--------------------------------------------------------------------------------
@@ -124,6 +125,8 @@ def get_kt15_labels():
 
         return kt15_clr_labels
 
+kt15_codec = LabelColorCodec(get_kt15_labels())
+
 def encode_segmap(mask):
     """Encode segmentation label images as kitti15 classes
 
@@ -135,12 +138,7 @@ def encode_segmap(mask):
         (np.ndarray): class map with dimensions (M,N), where the value at
         a given location is the integer denoting the class index.
     """
-    mask = mask.astype(int)
-    label_mask = np.zeros((mask.shape[0], mask.shape[1]), dtype=np.int16)
-    for ii, label in enumerate(get_kt15_labels()):
-        label_mask[np.where(np.all(mask == label, axis=-1))[:2]] = ii
-    label_mask = label_mask.astype(int)
-    return label_mask
+    return kt15_codec.encode(mask)
 
 def decode_segmap(label_mask, plot=False):
     """Decode segmentation class labels into a color image
@@ -154,19 +152,7 @@ def decode_segmap(label_mask, plot=False):
     Returns:
         (np.ndarray, optional): the resulting decoded color image.
     """
-    label_colors = get_kt15_labels()
-    r = label_mask.copy()
-    g = label_mask.copy()
-    b = label_mask.copy()
-    n_classes = 34
-    for ll in range(0, n_classes):
-        r[label_mask == ll] = label_colors[ll, 0]
-        g[label_mask == ll] = label_colors[ll, 1]
-        b[label_mask == ll] = label_colors[ll, 2]
-    rgb = np.zeros((label_mask.shape[0], label_mask.shape[1], 3))
-    rgb[:, :, 0] = r / 255.0
-    rgb[:, :, 1] = g / 255.0
-    rgb[:, :, 2] = b / 255.0
+    rgb = kt15_codec.decode(label_mask)
     if plot:
         plt.imshow(rgb)
         plt.show()
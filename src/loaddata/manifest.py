@@ -0,0 +1,219 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: manifest.py
+# @brief: build and load the manifest (resolved paths, image sizes, disparity validity) of a file list;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+The manifest of a list (e.g., lists/kitti2015_train170.list) resolves all the
+paths of each sample once, stats the files, and records the image size and
+the fraction of valid (finite and > 0) ground-truth disparities. It is saved
+as a compact .npz (numpy arrays only, no pickle), which DatasetFromList and
+test() load instantly, instead of rebuilding the paths by string slicing
+for each sample.
+
+Building it also validates the list before a multi-day run: any missing file,
+unreadable header, or left/right/disparity size mismatch is reported at once.
+
+Usage:
+    python3.7 -m src.loaddata.manifest --data_path=/data/ccjData/datasets/KITTI-2015/training/ \
+        --file_list=lists/kitti2015_train170.list --kitti2015=1 \
+        --out=lists/kitti2015_train170.manifest.npz --threads=16
+"""
+
+import os
+import json
+import time
+import numpy as np
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+
+import src.pfmutil as pfm
+from .dataset import get_sample_files
+from .shard_pack import read_file_list
+from .vkt2_cache import (get_vkt2_depth_path, get_vkt2_segmap_path,
+    get_vkt2_disparity_cache_path, get_vkt2_label_cache_path, is_cache_valid)
+
+manifest_keys = ['left', 'right', 'disp_left', 'disp_right', 'semantic_label']
+
+
+def get_image_size(path):
+    """ (height, width) from the header only """
+    if path.endswith('.pfm'):
+        with open(path, 'rb') as f:
+            height, width = pfm.readPFM_header(f)[:2]
+        return height, width
+    with Image.open(path) as img:
+        width, height = img.size
+    return height, width
+
+
+def get_disp_valid_fraction(path):
+    """ fraction of the valid (finite and > 0) disparities, or depths for Virtual KITTI 2 png """
+    if path.endswith('.pfm'):
+        disp = pfm.readPFM(path, mmap = True)
+    else:
+        disp = np.asarray(Image.open(path))
+    return float(np.count_nonzero(np.isfinite(disp) & (disp > 0))) / disp.size
+
+
+def resolve_sample(data_path, current_file, kitti2012 = False, kitti2015 = False,
+        virtual_kitti2 = False, is_semantic = True, kt12_image_mode = 'rgb'):
+    """ the paths of the sample, as a dict of manifest_keys ('' if not used) """
+    files = get_sample_files(data_path, current_file, kitti2012, kitti2015, virtual_kitti2,
+        is_semantic, kt12_image_mode)
+    if virtual_kitti2:
+        # the cached maps if they are valid, otherwise their sources;
+        A = current_file
+        src_path, cache_path = get_vkt2_depth_path(data_path, A), get_vkt2_disparity_cache_path(data_path, A)
+        files['disp_left'] = cache_path if is_cache_valid(cache_path, src_path) else src_path
+        if is_semantic:
+            src_path, cache_path = get_vkt2_segmap_path(data_path, A), get_vkt2_label_cache_path(data_path, A)
+            files['semantic_label'] = cache_path if is_cache_valid(cache_path, src_path) else src_path
+    return {key: files.get(key, '') for key in manifest_keys}
+
+
+def build_manifest(data_path, file_list_txt, out_path,
+        kitti2012 = False, kitti2015 = False, virtual_kitti2 = False,
+        is_semantic = True, kt12_image_mode = 'rgb',
+        num_threads = 16):
+    if not out_path.endswith('.npz'):
+        out_path += '.npz'
+    file_list = read_file_list(file_list_txt, virtual_kitti2)
+    since = time.time()
+
+    def check_one(current_file):
+        files = resolve_sample(data_path, current_file, kitti2012, kitti2015, virtual_kitti2,
+            is_semantic, kt12_image_mode)
+        errors = []
+        sizes = {}
+        for key, path in files.items():
+            if not path:
+                continue
+            try:
+                sizes[key] = get_image_size(path)
+            except Exception as error:
+                errors.append('{}: {}'.format(key, error))
+        valid_fraction = -1.0
+        if 'disp_left' in sizes:
+            valid_fraction = get_disp_valid_fraction(files['disp_left'])
+        if len(set(sizes.values())) > 1:
+            errors.append('size mismatch {}'.format(sizes))
+        height, width = sizes.get('left', (0, 0))
+        return files, height, width, valid_fraction, '; '.join(errors)
+
+    with ThreadPoolExecutor(max_workers = num_threads) as executor:
+        results = list(executor.map(check_one, file_list))
+
+    def rel(path):
+        return os.path.relpath(path, data_path) if path else ''
+    arrays = {'file_list': np.array(file_list)}
+    for key in manifest_keys:
+        arrays[key] = np.array([rel(r[0][key]) for r in results])
+    arrays['height'] = np.array([r[1] for r in results], dtype = np.int32)
+    arrays['width'] = np.array([r[2] for r in results], dtype = np.int32)
+    arrays['disp_valid_fraction'] = np.array([r[3] for r in results], dtype = np.float32)
+    arrays['error'] = np.array([r[4] for r in results])
+    meta = {
+        'file_list_txt': file_list_txt,
+        'kitti2012': bool(kitti2012),
+        'kitti2015': bool(kitti2015),
+        'virtual_kitti2': bool(virtual_kitti2),
+        'is_semantic': bool(is_semantic),
+        'kt12_image_mode': kt12_image_mode,
+        }
+    arrays['meta'] = np.array(json.dumps(meta))
+    np.savez(out_path, **arrays)
+
+    manifest = Manifest(out_path, data_path)
+    print ("[***] manifest of {} images saved at {}, {:.1f} s".format(len(file_list), out_path, time.time() - since))
+    manifest.summary()
+    return manifest
+
+
+class Manifest(object):
+    """ load the manifest saved by build_manifest() """
+    def __init__(self, manifest_path, data_path = None):
+        with np.load(manifest_path, allow_pickle = False) as arrays:
+            self.arrays = {key: arrays[key] for key in arrays.files}
+        self.manifest_path = manifest_path
+        self.data_path = data_path
+        self.meta = json.loads(str(self.arrays['meta']))
+        self.file_list = [str(x) for x in self.arrays['file_list']]
+        self.height = self.arrays['height']
+        self.width = self.arrays['width']
+        self.disp_valid_fraction = self.arrays['disp_valid_fraction']
+
+    def __len__(self):
+        return len(self.file_list)
+
+    def get_files(self, index, data_path = None):
+        """ absolute paths of the sample, as a dict of manifest_keys (only the used ones) """
+        data_path = self.data_path if data_path is None else data_path
+        return {key: os.path.join(data_path, str(self.arrays[key][index]))
+                for key in manifest_keys if self.arrays[key][index]}
+
+    def index_of(self, current_file):
+        """ index of the file name in the list, e.g., for a shuffled test list """
+        if not hasattr(self, '_index_of'):
+            self._index_of = {name: i for i, name in enumerate(self.file_list)}
+        return self._index_of[current_file]
+
+    def get_size(self, index):
+        return int(self.height[index]), int(self.width[index])
+
+    def get_errors(self):
+        return [(self.file_list[i], str(e)) for i, e in enumerate(self.arrays['error']) if e]
+
+    def validate(self, file_list = None, min_valid_fraction = 0.0):
+        """ fail fast before training or testing: raise if the manifest was built for another list,
+            if any file was missing or unreadable, or if a disparity map has too few valid pixels;
+        """
+        if file_list is not None and list(file_list) != self.file_list:
+            raise Exception("{} was not built for this file list".format(self.manifest_path))
+        errors = self.get_errors()
+        for i in np.nonzero((self.disp_valid_fraction >= 0) & (self.disp_valid_fraction < min_valid_fraction))[0]:
+            errors.append((self.file_list[i], 'disparity valid fraction {:.3f} < {:.3f}'.format(
+                self.disp_valid_fraction[i], min_valid_fraction)))
+        if errors:
+            for name, error in errors[:20]:
+                print ("[!!!] {}: {}".format(name, error))
+            raise Exception("{} invalid samples in {}".format(len(errors), self.manifest_path))
+
+    def get_size_buckets(self):
+        """ indices grouped by the image size, {(height, width): [indices]} """
+        buckets = {}
+        for i, size in enumerate(zip(self.height.tolist(), self.width.tolist())):
+            buckets.setdefault(size, []).append(i)
+        return buckets
+
+    def summary(self):
+        for (height, width), indices in sorted(self.get_size_buckets().items()):
+            print ("[***] {} x {}: {} images".format(height, width, len(indices)))
+        valid = self.disp_valid_fraction[self.disp_valid_fraction >= 0]
+        if len(valid) > 0:
+            print ("[***] disparity valid fraction: min {:.3f}, mean {:.3f}".format(valid.min(), valid.mean()))
+        errors = self.get_errors()
+        if errors:
+            print ("[!!!] {} invalid samples, e.g., {}: {}".format(len(errors), *errors[0]))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='build the manifest of a file list')
+    parser.add_argument('--data_path', type=str, required=True, help="data root")
+    parser.add_argument('--file_list', type=str, required=True, help="file list, e.g., lists/sceneflow_train.list")
+    parser.add_argument('--out', type=str, required=True, help="manifest file, e.g., lists/sceneflow_train.manifest.npz")
+    parser.add_argument('--kitti2012', type=int, default=0, help='kitti 2012 dataset? Default=False')
+    parser.add_argument('--kitti2015', type=int, default=0, help='kitti 2015? Default=False')
+    parser.add_argument('--virtual_kitti2', type=int, default=0, help='virtual_kitti2? Default=False')
+    parser.add_argument('--is_semantic', type=str, default= "true", help='flag to check semantic labels or not')
+    parser.add_argument('--kt12_image_mode', type=str, default= "rgb", help='kt2012 gray images, rgb, or gray2rgb')
+    parser.add_argument('--threads', type=int, default=16, help='number of threads')
+    args = parser.parse_args()
+
+    build_manifest(args.data_path, args.file_list, args.out,
+        args.kitti2012, args.kitti2015, args.virtual_kitti2,
+        str(args.is_semantic).lower() == 'true',
+        str(args.kt12_image_mode).lower(), args.threads)
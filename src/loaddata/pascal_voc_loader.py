@@ -25,6 +25,7 @@ from PIL import Image
 from tqdm import tqdm
 from torch.utils import data
 from torchvision import transforms
+from src.loaddata.label_codec import LabelColorCodec
 
 
 """ added by CCJ: """
@@ -82,6 +83,10 @@ def get_pascal_labels():
             ]
             )
 
+pascal_voc_codec = LabelColorCodec(get_pascal_labels())
+# the full 256-color pascal voc colormap, e.g., 255 for 'void/unlabelled';
+pascal_voc_cmap_codec = LabelColorCodec(pascal_voc_color_map(N=256, normalized=False))
+
 def pascal_voc_batch_label2RGB(batch_label_mask):
         """Decode segmentation class labels into a color image
 
@@ -93,27 +98,7 @@ def pascal_voc_batch_label2RGB(batch_label_mask):
         Returns:
             (np.ndarray, optional): the resulting decoded color image.
         """
-        #print ("[???] batch_label_mask shape = ", batch_label_mask.shape )
-        if batch_label_mask.shape[-1] == 1:
-            channel_dim = -1
-        elif batch_label_mask.shape[1] == 1:
-            channel_dim = 1
-
-        indices = np.squeeze(batch_label_mask, axis=channel_dim).astype(np.int32) # in shape [N, H, W]
-        N, H, W = indices.shape[:]
-        #print ("[???] indices.shape = ", indices.shape)
-        
-        batch_label_rgb = np.zeros((N,H,W,3))
-        #get pascal voc colormap
-        cmap = pascal_voc_color_map(N=256, normalized=False)# in shape [256, 3]
-        #print ('[???] camp shape = ', cmap.shape)
-        for j in range(N):
-            # gather
-            batch_label_rgb[j,:,:,0] = np.take(cmap[:,0], indices[j]) / 255 # Red
-            batch_label_rgb[j,:,:,1] = np.take(cmap[:,1], indices[j]) / 255 # Green
-            batch_label_rgb[j,:,:,2] = np.take(cmap[:,2], indices[j]) / 255 # Blue
-        
-        return batch_label_rgb
+        return pascal_voc_cmap_codec.decode_batch(batch_label_mask)
         
 
 class pascalVOCLoader(data.Dataset):
@@ -295,12 +280,7 @@ class pascalVOCLoader(data.Dataset):
             (np.ndarray): class map with dimensions (M,N), where the value at
             a given location is the integer denoting the class index.
         """
-        mask = mask.astype(int)
-        label_mask = np.zeros((mask.shape[0], mask.shape[1]), dtype=np.int16)
-        for ii, label in enumerate(self.get_pascal_labels()):
-            label_mask[np.where(np.all(mask == label, axis=-1))[:2]] = ii
-        label_mask = label_mask.astype(int)
-        return label_mask
+        return pascal_voc_codec.encode(mask)
 
     def decode_segmap(self, label_mask, plot=False):
         """Decode segmentation class labels into a color image
@@ -314,18 +294,7 @@ class pascalVOCLoader(data.Dataset):
         Returns:
             (np.ndarray, optional): the resulting decoded color image.
         """
-        label_colours = self.get_pascal_labels()
-        r = label_mask.copy()
-        g = label_mask.copy()
-        b = label_mask.copy()
-        for ll in range(0, self.n_classes):
-            r[label_mask == ll] = label_colours[ll, 0]
-            g[label_mask == ll] = label_colours[ll, 1]
-            b[label_mask == ll] = label_colours[ll, 2]
-        rgb = np.zeros((label_mask.shape[0], label_mask.shape[1], 3))
-        rgb[:, :, 0] = r / 255.0
-        rgb[:, :, 1] = g / 255.0
-        rgb[:, :, 2] = b / 255.0
+        rgb = pascal_voc_codec.decode(label_mask)
         if plot:
             plt.imshow(rgb)
             plt.show()
@@ -0,0 +1,92 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: prefetcher.py
+# @brief: overlap the loading and host-to-device copy of the next batch with the current step;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+import threading
+import queue
+import torch
+
+
+class DataPrefetcher(object):
+    """ wrap a DataLoader to always have the next batch ready:
+        - on CUDA: the next batch (pinned memory, i.e., DataLoader(pin_memory=True))
+          is copied with non_blocking=True on a side stream, one batch ahead,
+          so the copy runs while the current step is computing;
+        - on CPU: a background thread keeps up to two batches (double buffering);
+        Each batch is a list of tensors (on the device for CUDA);
+    """
+    def __init__(self, loader, device = 'cuda'):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.is_cuda = self.device.type == 'cuda'
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.is_cuda:
+            return self._cuda_iter()
+        return self._thread_iter()
+
+    def _cuda_iter(self):
+        stream = torch.cuda.Stream(device = self.device)
+        def preload(loader_iter):
+            try:
+                batch_data = next(loader_iter)
+            except StopIteration:
+                return None
+            with torch.cuda.stream(stream):
+                return [x.to(self.device, non_blocking=True) if torch.is_tensor(x) else x for x in batch_data]
+
+        loader_iter = iter(self.loader)
+        next_batch = preload(loader_iter)
+        while next_batch is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_stream(stream)
+            batch_data = next_batch
+            for x in batch_data:
+                # the memory was allocated on the side stream, but is used on the current stream;
+                if torch.is_tensor(x):
+                    x.record_stream(current_stream)
+            next_batch = preload(loader_iter)
+            yield batch_data
+
+    def _thread_iter(self):
+        buffer = queue.Queue(maxsize = 2)
+        stop = threading.Event()
+        end_of_data = object()
+        def put(item):
+            while not stop.is_set():
+                try:
+                    buffer.put(item, timeout = 0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                for batch_data in self.loader:
+                    if not put(batch_data):
+                        return
+                put(end_of_data)
+            except Exception as error:
+                # re-raised in the main thread;
+                put(error)
+
+        thread = threading.Thread(target = worker, daemon = True)
+        thread.start()
+        try:
+            while True:
+                batch_data = buffer.get()
+                if batch_data is end_of_data:
+                    break
+                if isinstance(batch_data, Exception):
+                    raise batch_data
+                yield batch_data
+        finally:
+            stop.set()
+            thread.join()
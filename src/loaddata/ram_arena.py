@@ -0,0 +1,81 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: ram_arena.py
+# @brief: decode a (small) file list once into a shared-memory arena;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+For the small benchmarks (e.g., 200 pairs of KITTI 2015), all the samples
+fit in RAM. RamArena decodes the list once, in the main process, into one
+shared-memory uint8 tensor with the same block layout as the packed shards
+(see shard_pack.py):
+    left, right: uint8 [H, W, 3], label: uint8 [H, W], disp: float32 [H, W]
+The DataLoader workers attach to the same memory (fork, or the shared-memory
+handle of torch.multiprocessing for spawn) instead of copying it, and the
+random crops of each epoch are read from RAM via ShardReader.read_crop().
+"""
+
+import time
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+
+from .dataset import load_raw_data, get_rgb_mean_std
+from .shard_pack import ShardReader, index_dtype, _align
+
+
+class RamArena(ShardReader):
+    def __init__(self, data_path, file_list,
+            kitti2012 = False, kitti2015 = False, virtual_kitti2 = False,
+            is_semantic = True, kt12_image_mode = 'rgb',
+            num_threads = 4):
+        since = time.time()
+        def load_one(current_file):
+            left, right, disp_left, semantic_label = load_raw_data(data_path, current_file,
+                kitti2012, kitti2015, virtual_kitti2, is_semantic, kt12_image_mode)
+            return left, right, semantic_label, disp_left.astype(np.float32)
+
+        with ThreadPoolExecutor(max_workers = num_threads) as executor:
+            samples = list(executor.map(load_one, file_list))
+        decode_time = time.time() - since
+
+        # block offsets, in the same layout as pack_shards();
+        index = np.zeros(len(file_list), dtype = index_dtype)
+        keys = ['left_offset', 'right_offset', 'label_offset', 'disp_offset']
+        pos = 0
+        for i, blocks in enumerate(samples):
+            index[i]['height'], index[i]['width'] = blocks[0].shape[:2]
+            index[i]['label_offset'] = -1
+            for key, arr in zip(keys, blocks):
+                if arr is None:
+                    continue
+                pos = _align(pos)
+                index[i][key] = pos
+                pos += arr.nbytes
+            index[i]['stats'][0] = get_rgb_mean_std(blocks[0])
+            index[i]['stats'][1] = get_rgb_mean_std(blocks[1])
+
+        self.arena = torch.empty(_align(pos), dtype = torch.uint8).share_memory_()
+        buf = self.arena.numpy()
+        for i in range(len(samples)):
+            for key, arr in zip(keys, samples[i]):
+                if arr is not None:
+                    offset = int(index[i][key])
+                    buf[offset: offset + arr.nbytes] = np.ascontiguousarray(arr).view(np.uint8).ravel()
+            samples[i] = None # release the decoded copy;
+
+        self.shard_dir = None
+        self.index = index
+        self.meta = {'data_path': data_path, 'file_list': list(file_list), 'disp_dtype': 'float32'}
+        self.file_list = self.meta['file_list']
+        self.disp_dtype = np.dtype(np.float32)
+        self._shards = {}
+        print ("[***] RamArena: decoded {} images into {:.1f} MB of shared memory, {:.1f} s (decoding {:.1f} s)".format(
+            len(file_list), self.arena.numel() / 1024.0**2, time.time() - since, decode_time))
+
+    def _get_shard(self, shard_id):
+        # one shard only, i.e., the numpy view of the arena;
+        if 0 not in self._shards:
+            self._shards[0] = self.arena.numpy()
+        return self._shards[0]
@@ -0,0 +1,67 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: read_ahead.py
+# @brief: read ahead the files of the next samples in the sampler order;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+On a network-mounted dataset, the latency of each file read dominates the
+loading time. ReadAheadSampler wraps the sampler of the DataLoader: when the
+DataLoader takes the k-th index, the files of the (k + read_ahead)-th sample
+are read by a thread pool of the main process, so they are already in the
+(OS-wide) page cache when a worker decodes that sample.
+
+Usage:
+    sampler = ReadAheadSampler(RandomSampler(train_set), train_set, read_ahead = 16)
+    DataLoader(train_set, sampler = sampler, ...)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import Sampler
+
+READ_CHUNK = 1 << 20
+
+
+def readahead_file(path):
+    """ bring the file into the page cache; returns the number of bytes read """
+    try:
+        with open(path, 'rb', buffering = 0) as f:
+            buf = bytearray(READ_CHUNK)
+            nbytes = 0
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    return nbytes
+                nbytes += n
+    except OSError:
+        # a missing file is reported by the loader itself;
+        return 0
+
+
+class ReadAheadSampler(Sampler):
+    def __init__(self, sampler, dataset, read_ahead = 16, num_threads = 4):
+        """ dataset: with get_sample_files(index), e.g., DatasetFromList """
+        self.sampler = sampler
+        self.dataset = dataset
+        self.read_ahead = read_ahead
+        self.num_threads = num_threads
+        self._pool = None
+
+    def __len__(self):
+        return len(self.sampler)
+
+    def _submit(self, index):
+        for path in self.dataset.get_sample_files(index):
+            self._pool.submit(readahead_file, path)
+
+    def __iter__(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers = self.num_threads)
+        indices = list(iter(self.sampler))
+        for index in indices[:self.read_ahead]:
+            self._submit(index)
+        for k, index in enumerate(indices):
+            if k + self.read_ahead < len(indices):
+                self._submit(indices[k + self.read_ahead])
+            yield index
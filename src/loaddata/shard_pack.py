@@ -0,0 +1,226 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: shard_pack.py
+# @brief: pack a file list into memory-mapped shards, and read crops from them;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+Offline packer and reader of memory-mapped training shards.
+
+Each sample of a list (e.g., lists/sceneflow_train.list) is decoded once and
+appended to a shard file (shard_%05d.bin) as:
+    left  : uint8,   [H, W, 3]
+    right : uint8,   [H, W, 3]
+    label : uint8,   [H, W] (only if semantic label is available)
+    disp  : float16, [H, W] (or float32, see `disp_dtype`)
+Each block starts at a 64-byte aligned offset. The offsets, the image size
+and the full-image mean/std (for self_guassian_normalize) are saved in
+`index.npy`, and the packing settings in `meta.json`.
+
+The reader np.memmap's each shard once per (DataLoader worker) process,
+and returns views of the crop, so only the pages of the crop are touched.
+
+Usage:
+    python3.7 -m src.loaddata.shard_pack --data_path=/data/ccjData/datasets/SceneFlowDataset/ \
+        --file_list=lists/sceneflow_train.list --out_dir=/data/ccjData/shards/sceneflow_train
+"""
+
+import os
+import json
+import time
+import numpy as np
+from os.path import join as pjoin
+
+from .dataset import load_raw_data, get_rgb_mean_std, get_virtual_kitti2_filelist
+
+SHARD_ALIGN = 64
+
+index_dtype = np.dtype([
+    ('shard', np.int32),
+    ('height', np.int32),
+    ('width', np.int32),
+    ('left_offset', np.int64),
+    ('right_offset', np.int64),
+    ('label_offset', np.int64), # -1 means no semantic label
+    ('disp_offset', np.int64),
+    ('stats', np.float32, (2, 3, 2)), # [left/right, R/G/B, mean/std]
+    ])
+
+
+def _align(offset, align = SHARD_ALIGN):
+    return (offset + align - 1) // align * align
+
+
+def read_file_list(file_list_txt, virtual_kitti2 = False):
+    if virtual_kitti2:
+        return get_virtual_kitti2_filelist(file_list_txt)
+    with open(file_list_txt, 'r') as f:
+        return [l.rstrip() for l in f.readlines() if not l.rstrip().startswith('#')]
+
+
+def pack_shards(data_path, file_list_txt, out_dir,
+        kitti2012 = False, kitti2015 = False, virtual_kitti2 = False,
+        is_semantic = True, kt12_image_mode = 'rgb',
+        disp_dtype = 'float16',
+        shard_size_mb = 2048 # start a new shard after this size;
+        ):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+        print ('makedirs {}'.format(out_dir))
+
+    file_list = read_file_list(file_list_txt, virtual_kitti2)
+    disp_dtype = np.dtype(disp_dtype)
+    assert disp_dtype in [np.float16, np.float32], "disp_dtype should be float16 or float32"
+    shard_size = shard_size_mb * 1024 * 1024
+    index = np.zeros(len(file_list), dtype = index_dtype)
+
+    shard_id = -1
+    f_shard = None
+    pos = 0
+    since = time.time()
+    for i, current_file in enumerate(file_list):
+        left, right, disp_left, semantic_label = load_raw_data(data_path, current_file,
+            kitti2012, kitti2015, virtual_kitti2, is_semantic, kt12_image_mode)
+        height, width = left.shape[:2]
+
+        if f_shard is None or pos >= shard_size:
+            if f_shard is not None:
+                f_shard.close()
+            shard_id += 1
+            f_shard = open(pjoin(out_dir, 'shard_%05d.bin' % shard_id), 'wb')
+            pos = 0
+
+        blocks = [('left_offset', left), ('right_offset', right),
+                  ('label_offset', semantic_label),
+                  ('disp_offset', disp_left.astype(disp_dtype))]
+        index[i]['shard'] = shard_id
+        index[i]['height'] = height
+        index[i]['width'] = width
+        index[i]['label_offset'] = -1
+        for key, arr in blocks:
+            if arr is None:
+                continue
+            assert arr.shape[:2] == (height, width), "{}: size mismatch in {}".format(current_file, key)
+            pad = _align(pos) - pos
+            if pad > 0:
+                f_shard.write(b'\0' * pad)
+                pos += pad
+            index[i][key] = pos
+            buf = np.ascontiguousarray(arr).tobytes()
+            f_shard.write(buf)
+            pos += len(buf)
+        index[i]['stats'][0] = get_rgb_mean_std(left)
+        index[i]['stats'][1] = get_rgb_mean_std(right)
+
+        if i % 500 == 0:
+            print ("packing {:0>5d} / {:0>5d}: {}, shard {}, {:.1f} s".format(
+                i, len(file_list), current_file, shard_id, time.time() - since))
+
+    if f_shard is not None:
+        f_shard.close()
+    np.save(pjoin(out_dir, 'index.npy'), index)
+    meta = {
+        'data_path': data_path,
+        'file_list_txt': file_list_txt,
+        'file_list': file_list,
+        'kitti2012': bool(kitti2012),
+        'kitti2015': bool(kitti2015),
+        'virtual_kitti2': bool(virtual_kitti2),
+        'is_semantic': bool(is_semantic),
+        'kt12_image_mode': kt12_image_mode,
+        'disp_dtype': disp_dtype.name,
+        'shard_num': shard_id + 1,
+        }
+    with open(pjoin(out_dir, 'meta.json'), 'wt') as f_json:
+        json.dump(meta, f_json, indent = 4)
+    print ("[***] packed {} images into {} shards at {}, {:.1f} s".format(
+        len(file_list), shard_id + 1, out_dir, time.time() - since))
+    return index
+
+
+class ShardReader(object):
+    """ read samples (or crops of them) from the shards written by pack_shards();
+        The memmaps are opened lazily, so that each DataLoader worker
+        opens its own ones after fork.
+    """
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.index = np.load(pjoin(shard_dir, 'index.npy'))
+        with open(pjoin(shard_dir, 'meta.json'), 'r') as f_json:
+            self.meta = json.load(f_json)
+        self.file_list = self.meta['file_list']
+        self.disp_dtype = np.dtype(self.meta['disp_dtype'])
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getstate__(self):
+        # do not pickle the memmaps to the DataLoader workers;
+        state = self.__dict__.copy()
+        state['_shards'] = {}
+        return state
+
+    def _get_shard(self, shard_id):
+        if shard_id not in self._shards:
+            self._shards[shard_id] = np.memmap(pjoin(self.shard_dir, 'shard_%05d.bin' % shard_id),
+                dtype = np.uint8, mode = 'r')
+        return self._shards[shard_id]
+
+    def get_size(self, idx):
+        return int(self.index[idx]['height']), int(self.index[idx]['width'])
+
+    def get_stats(self, idx):
+        """ full-image mean/std of left and right images, each in [3, 2] """
+        stats = self.index[idx]['stats']
+        return stats[0], stats[1]
+
+    def _view(self, idx, key, dtype, channels):
+        item = self.index[idx]
+        height, width = int(item['height']), int(item['width'])
+        offset = int(item[key])
+        shape = (height, width, channels) if channels > 1 else (height, width)
+        nbytes = height * width * channels * np.dtype(dtype).itemsize
+        shard = self._get_shard(int(item['shard']))
+        return shard[offset: offset + nbytes].view(dtype).reshape(shape)
+
+    def read_crop(self, idx, start_y = 0, start_x = 0, crop_height = None, crop_width = None):
+        """ return views (no copy) of the crop:
+            left, right in uint8 [h, w, 3], disp_left in [h, w], and semantic_label
+            in uint8 [h, w] (or None);
+        """
+        height, width = self.get_size(idx)
+        end_y = height if crop_height is None else start_y + crop_height
+        end_x = width if crop_width is None else start_x + crop_width
+
+        left = self._view(idx, 'left_offset', np.uint8, 3)[start_y:end_y, start_x:end_x]
+        right = self._view(idx, 'right_offset', np.uint8, 3)[start_y:end_y, start_x:end_x]
+        disp_left = self._view(idx, 'disp_offset', self.disp_dtype, 1)[start_y:end_y, start_x:end_x]
+        if self.index[idx]['label_offset'] >= 0:
+            semantic_label = self._view(idx, 'label_offset', np.uint8, 1)[start_y:end_y, start_x:end_x]
+        else:
+            semantic_label = None
+        return left, right, disp_left, semantic_label
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description='pack a file list into memory-mapped shards')
+    parser.add_argument('--data_path', type=str, required=True, help="data root")
+    parser.add_argument('--file_list', type=str, required=True, help="file list, e.g., lists/sceneflow_train.list")
+    parser.add_argument('--out_dir', type=str, required=True, help="dir to save the shards")
+    parser.add_argument('--kitti2012', type=int, default=0, help='kitti 2012 dataset? Default=False')
+    parser.add_argument('--kitti2015', type=int, default=0, help='kitti 2015? Default=False')
+    parser.add_argument('--virtual_kitti2', type=int, default=0, help='virtual_kitti2? Default=False')
+    parser.add_argument('--is_semantic', type=str, default= "true", help='flag to pack semantic labels or not')
+    parser.add_argument('--kt12_image_mode', type=str, default= "rgb", help='kt2012 gray images, rgb, or gray2rgb')
+    parser.add_argument('--disp_dtype', type=str, default= "float16", help='float16 or float32')
+    parser.add_argument('--shard_size_mb', type=int, default= 2048, help='size of each shard in MB')
+    args = parser.parse_args()
+
+    pack_shards(args.data_path, args.file_list, args.out_dir,
+        args.kitti2012, args.kitti2015, args.virtual_kitti2,
+        str(args.is_semantic).lower() == 'true',
+        str(args.kt12_image_mode).lower(),
+        args.disp_dtype, args.shard_size_mb)
@@ -10,6 +10,7 @@
 import cv2
 import numpy as np
 import src.pfmutil as pfm
+from src.loaddata.label_codec import LabelColorCodec
 from os.path import join as pjoin
 import os
 
@@ -90,6 +91,8 @@ def get_virtual_kitti2_labels():
 
     return virtual_kt2_clr_labels
 
+virtual_kitti2_codec = LabelColorCodec(get_virtual_kitti2_labels())
+
 def encode_color_segmap(mask):
     """Encode segmentation label images as virtual kitti classes
 
@@ -101,12 +104,15 @@ def encode_color_segmap(mask):
         (np.ndarray): class map with dimensions (M,N), where the value at
         a given location is the integer denoting the class index.
     """
-    mask = mask.astype(int)
-    label_mask = np.zeros((mask.shape[0], mask.shape[1]), dtype=np.int16)
-    for ii, label in enumerate(get_virtual_kitti2_labels()):
-        label_mask[np.where(np.all(mask == label, axis=-1))[:2]] = ii
-    label_mask = label_mask.astype(int)
-    return label_mask
+    return virtual_kitti2_codec.encode(mask)
+
+def decode_color_segmap(label_mask):
+    """Decode class map (M, N) into a color image (M, N, 3) in [0, 1]"""
+    return virtual_kitti2_codec.decode(label_mask)
+
+def virtual_kitti2_batch_label2RGB(batch_label_mask):
+    """Decode batch class maps in (N, H, W), (N,H,W,1), or (N,1,H,W) into color images (N,H,W,3)"""
+    return virtual_kitti2_codec.decode_batch(batch_label_mask)
 
 
 
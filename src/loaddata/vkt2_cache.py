@@ -0,0 +1,134 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: vkt2_cache.py
+# @brief: on-disk cache of Virtual KITTI 2 disparity and class-label maps;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+Virtual KITTI 2 only ships depth (16-bit png, in centimeters) and class
+segmentation in colors. Converting them (d = f*B/z and the color-to-label
+encoding) on every read dominates the loading time, so we cache:
+    disparity:   vkitti_2.0.3_disparity/SceneX/Y/frames/disparity/Camera_0/disparity_%05d.pfm
+    class label: vkitti_2.0.3_classLabel/SceneX/Y/frames/classLabel/Camera_0/classlabel_%05d.png (uint8)
+next to the dataset. Each cached file gets the mtime of its source file, and
+it is used only if its mtime still matches that of the source; otherwise the
+maps are recomputed from the source.
+
+One-time conversion:
+    python3.7 -m src.loaddata.vkt2_cache --data_path=/media/ccjData2/datasets/Virtual-KITTI-V2/ \
+        --file_list=lists/virtual_kitti2_all_random_train.list --threads=8
+"""
+
+import os
+import cv2
+import time
+import numpy as np
+from os.path import join as pjoin
+
+import src.pfmutil as pfm
+from .virtual_kitti2_labels import encode_color_segmap
+
+# Intrinsic: f_x = f_y = 725.0087
+# offset(i.e., distance between stereo views): B = 0.532725 m = 53.2725 cm
+VKT2_BASELINE = 53.2725 # in centimeters;
+VKT2_FOCAL = 725.0087 # in pixels
+
+
+# e.g., A = "Scene01/15-deg-left/frames/rgb/Camera_0/rgb_00001.jpg"
+def get_vkt2_depth_path(data_path, A):
+    return pjoin(data_path, "vkitti_2.0.3_depth/" + A[:-26] + 'depth/Camera_0/depth_' + A[-9:-4] + ".png")
+
+def get_vkt2_segmap_path(data_path, A):
+    return pjoin(data_path, "vkitti_2.0.3_classSegmentation/" + A[:-26] + 'classSegmentation/Camera_0/classgt_' + A[-9:-4] + ".png")
+
+def get_vkt2_disparity_cache_path(data_path, A):
+    return pjoin(data_path, "vkitti_2.0.3_disparity/" + A[:-26] + 'disparity/Camera_0/disparity_' + A[-9:-4] + ".pfm")
+
+def get_vkt2_label_cache_path(data_path, A):
+    return pjoin(data_path, "vkitti_2.0.3_classLabel/" + A[:-26] + 'classLabel/Camera_0/classlabel_' + A[-9:-4] + ".png")
+
+
+def depth_to_disparity(depth):
+    """ depth in centimeters to float32 disparity, zero as invalid value """
+    disp = np.zeros(depth.shape[:2], 'float32')
+    mask = depth > 0
+    disp[mask] = VKT2_FOCAL*VKT2_BASELINE / depth[mask] # d = fB/z
+    return disp
+
+
+def is_cache_valid(cache_path, src_path):
+    """ the cached file is valid if it has the same mtime (in seconds) as its source """
+    try:
+        return int(os.stat(cache_path).st_mtime) == int(os.stat(src_path).st_mtime)
+    except OSError:
+        return False
+
+
+def _write_cache(cache_path, src_path, write_func):
+    tmp_dir = os.path.dirname(cache_path)
+    if not os.path.exists(tmp_dir):
+        os.makedirs(tmp_dir, exist_ok = True)
+    # write to a temporary file first, so a reader never sees a partial file;
+    tmp_path = cache_path + '.tmp%d' % os.getpid() + os.path.splitext(cache_path)[1]
+    write_func(tmp_path)
+    os.replace(tmp_path, cache_path)
+    st = os.stat(src_path)
+    os.utime(cache_path, (st.st_atime, st.st_mtime))
+
+
+def load_vkt2_disparity(data_path, A, mmap = False, write_cache = False):
+    """ left disparity of the current file, from the cache if it is valid """
+    depth_path = get_vkt2_depth_path(data_path, A)
+    cache_path = get_vkt2_disparity_cache_path(data_path, A)
+    if is_cache_valid(cache_path, depth_path):
+        return pfm.readPFM(cache_path, mmap)
+    #NOTE: The depth map in centimeters can be directly loaded
+    depth = cv2.imread(depth_path, cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+    disp = depth_to_disparity(depth)
+    if write_cache:
+        _write_cache(cache_path, depth_path, lambda x: pfm.save(x, disp))
+    return disp
+
+
+def load_vkt2_label(data_path, A, write_cache = False):
+    """ uint8 class label map of the current file, from the cache if it is valid """
+    seg_path = get_vkt2_segmap_path(data_path, A)
+    cache_path = get_vkt2_label_cache_path(data_path, A)
+    if is_cache_valid(cache_path, seg_path):
+        return cv2.imread(cache_path, cv2.IMREAD_GRAYSCALE)
+    semantic_rgb_label = cv2.imread(seg_path)[:,:,::-1] # change BRG to RGB via ``::-1`;
+    label = encode_color_segmap(semantic_rgb_label).astype(np.uint8)
+    if write_cache:
+        _write_cache(cache_path, seg_path, lambda x: cv2.imwrite(x, label))
+    return label
+
+
+def convert_vkt2_cache(data_path, file_list, is_semantic = True, num_threads = 4):
+    """ one-time conversion of the files in the list; valid cached files are skipped """
+    from concurrent.futures import ThreadPoolExecutor
+    def convert_one(A):
+        load_vkt2_disparity(data_path, A, write_cache = True)
+        if is_semantic:
+            load_vkt2_label(data_path, A, write_cache = True)
+
+    since = time.time()
+    with ThreadPoolExecutor(max_workers = num_threads) as executor:
+        for i, _ in enumerate(executor.map(convert_one, file_list)):
+            if i % 1000 == 0:
+                print ("converting {:0>5d} / {:0>5d}: {:.1f} s".format(i, len(file_list), time.time() - since))
+    print ("[***] cached disparity/label maps of {} images at {}, {:.1f} s".format(
+        len(file_list), data_path, time.time() - since))
+
+
+if __name__ == "__main__":
+    import argparse
+    from .dataset import get_virtual_kitti2_filelist
+    parser = argparse.ArgumentParser(description='cache Virtual KITTI 2 disparity and class-label maps')
+    parser.add_argument('--data_path', type=str, required=True, help="Virtual KITTI 2 root")
+    parser.add_argument('--file_list', type=str, required=True, help="file list, e.g., lists/virtual_kitti2_all_random_train.list")
+    parser.add_argument('--is_semantic', type=str, default= "true", help='flag to cache the class labels or not')
+    parser.add_argument('--threads', type=int, default=4, help='number of threads for the conversion')
+    args = parser.parse_args()
+    convert_vkt2_cache(args.data_path, get_virtual_kitti2_filelist(args.file_list),
+        str(args.is_semantic).lower() == 'true', args.threads)
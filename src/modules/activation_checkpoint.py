@@ -0,0 +1,269 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: activation_checkpoint.py
+# @brief: activation checkpointing of the 3D cost aggregation stacks of PSMNet, GCNet and GANet;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+The 3D cost aggregation keeps every 5-D activation alive for backward. With
+activation checkpointing, a block saves only its inputs; its activations are
+recomputed in backward, i.e., about one extra forward of the block per step.
+
+    set_activation_checkpointing(model, mode), mode in:
+      - 'none'     : no checkpointing;
+      - 'hourglass': one segment per hourglass / top-level block,
+                     i.e., dres0-dres4 and classif1-3 of PSMNet, the conv3d blocks
+                     (conv3dbn_*, block_3d_*, deconvbn*) of GCNet, and the BasicConv /
+                     Conv2x / SGABlock / Disp blocks of the CostAggregation of GANet;
+      - 'block'    : one segment per block inside them, i.e., the convs of each
+                     hourglass and of each Conv3DBlock of GCNet (GANet: as 'hourglass');
+                     smaller segments, recomputed one at a time, but more saved inputs;
+
+The blocks keep their class (a subclass with a checkpointing forward() is swapped
+in), so the state_dict keys, the DataParallel replicas and the call sites in the
+forward() of all the AttenStereoNet variants are unchanged. The recomputation in
+backward does not update the running statistics of the batch norms a second time.
+
+Memory and time report:
+    python3.7 -m src.modules.activation_checkpoint
+"""
+
+import time
+import inspect
+import contextlib
+import torch
+import torch.nn as nn
+from torch.utils.checkpoint import checkpoint
+
+CHECKPOINT_MODES = ['none', 'hourglass', 'block']
+
+# the top-level blocks of the cost aggregation, by attribute name;
+HOURGLASS_BLOCKS = [
+    'dres0', 'dres1', 'dres2', 'dres3', 'dres4', 'classif1', 'classif2', 'classif3', # PSMNet
+    'conv3dbn_1', 'conv3dbn_2', 'block_3d_1', 'block_3d_2', 'block_3d_3', 'block_3d_4',
+    'deconvbn1', 'deconvbn2', 'deconvbn3', 'deconvbn4', # GCNet
+    ]
+
+# the aggregation modules with a flat forward(), whose blocks are checkpointed in both modes
+# (as one segment, they would be recomputed as a whole in backward, with no lower peak);
+FLAT_BLOCKS = ['cost_agg'] # GANet
+
+# torch >= 1.11: the non-reentrant checkpoint, which also handles the non-tensor
+# inputs (e.g., the guidance dict of CostAggregation) and the inputs without grad;
+_has_non_reentrant = 'use_reentrant' in inspect.signature(checkpoint).parameters
+
+
+@contextlib.contextmanager
+def _frozen_bn_stats(module):
+    """ restores the running statistics of the batch norms after the block """
+    bns = [m for m in module.modules() if isinstance(m, nn.modules.batchnorm._BatchNorm) and m.track_running_stats]
+    stats = [[b.clone() for b in (m.running_mean, m.running_var, m.num_batches_tracked)] for m in bns]
+    try:
+        yield
+    finally:
+        for m, saved in zip(bns, stats):
+            for b, s in zip((m.running_mean, m.running_var, m.num_batches_tracked), saved):
+                b.copy_(s)
+
+
+class _CheckpointMixin(object):
+    """ the forward() of the checkpointed blocks, see set_activation_checkpointing() """
+    def forward(self, *inputs):
+        module_forward = super(_CheckpointMixin, self).forward
+        if not torch.is_grad_enabled():
+            return module_forward(*inputs)
+        if not _has_non_reentrant and not (all(torch.is_tensor(x) or x is None for x in inputs)
+                and any(torch.is_tensor(x) and x.requires_grad for x in inputs)):
+            # the reentrant checkpoint would lose the grads of these blocks;
+            return module_forward(*inputs)
+        calls = [0]
+        def run(*inputs):
+            calls[0] += 1
+            if calls[0] == 1:
+                return module_forward(*inputs)
+            # the recomputation in backward;
+            with _frozen_bn_stats(self):
+                return module_forward(*inputs)
+        if _has_non_reentrant:
+            return checkpoint(run, *inputs, use_reentrant = False)
+        return checkpoint(run, *inputs)
+
+
+_checkpointed_classes = {}
+
+def _set_checkpointed(module, enabled):
+    cls = type(module)
+    if issubclass(cls, _CheckpointMixin):
+        if not enabled:
+            module.__class__ = cls.__bases__[1]
+    elif enabled:
+        if cls not in _checkpointed_classes:
+            _checkpointed_classes[cls] = type('Checkpointed' + cls.__name__, (_CheckpointMixin, cls), {})
+        module.__class__ = _checkpointed_classes[cls]
+
+
+def get_checkpoint_blocks(model, mode):
+    """ the modules of model checkpointed with this mode, see the module docstring """
+    assert mode in CHECKPOINT_MODES, "mode should be one of {}".format(CHECKPOINT_MODES)
+    if mode == 'none':
+        return []
+    blocks = []
+    for name in HOURGLASS_BLOCKS:
+        block = getattr(model, name, None)
+        if not isinstance(block, nn.Module):
+            continue
+        if mode == 'hourglass' or isinstance(block, nn.Sequential):
+            # (a conv + bn + relu chain: no gain from splitting it;)
+            blocks.append(block)
+        else:
+            blocks += [m for m in block.children() if any(True for _ in m.parameters())]
+    for name in FLAT_BLOCKS:
+        block = getattr(model, name, None)
+        if isinstance(block, nn.Module):
+            blocks += [m for m in block.children() if any(True for _ in m.parameters())]
+    return blocks
+
+
+def set_activation_checkpointing(model, mode = 'none'):
+    """
+    args:
+        model: e.g., AttenStereoNet, or PSMNet / GCNet / GANet; or its DataParallel;
+        mode: 'none', 'hourglass' or 'block';
+    return:
+        the number of checkpointed blocks;
+    """
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+    for m in model.modules():
+        _set_checkpointed(m, False)
+    blocks = get_checkpoint_blocks(model, mode)
+    for m in blocks:
+        _set_checkpointed(m, True)
+    return len(blocks)
+
+
+def _aggregation_stack(arch, N, H, W, maxdisp, device):
+    """ the 3D cost aggregation of arch (without the feature extraction), and its inputs """
+    if arch == 'psm':
+        from .psmnet_submodule import PSMNet
+        model = PSMNet(maxdisp)
+        inputs = [torch.randn(N, 64, maxdisp // 4, H // 4, W // 4)]
+        def run(cost):
+            # as PSMNet.forward();
+            cost0 = model.dres0(cost)
+            cost0 = model.dres1(cost0) + cost0
+            out1, pre1, post1 = model.dres2(cost0, None, None)
+            out1 = out1 + cost0
+            out2, pre2, post2 = model.dres3(out1, pre1, post1)
+            out2 = out2 + cost0
+            out3, pre3, post3 = model.dres4(out2, pre1, post2)
+            out3 = out3 + cost0
+            cost1 = model.classif1(out1)
+            cost2 = model.classif2(out2) + cost1
+            cost3 = model.classif3(out3) + cost2
+            return cost1.sum() + cost2.sum() + cost3.sum()
+    elif arch == 'gcnet':
+        from ..baselines.GCNet.models.gcnet import GCNet
+        model = GCNet(maxdisp, is_kendall_version = True)
+        inputs = [torch.randn(N, 64, maxdisp // 2, H // 2, W // 2)]
+        run = lambda cv: model.cost_aggregation_kendall(cv).sum()
+    else:
+        from ..baselines.GANet.models.GANet_deep_syncbn_v2 import Guidance, CostAggregation
+        model = nn.Module()
+        model.guidance = Guidance()
+        model.cost_agg = CostAggregation(maxdisp)
+        inputs = [torch.randn(N, 64, maxdisp // 3 + 1, H // 3, W // 3), torch.randn(N, 64, H, W)]
+        run = lambda cv, g: sum(d.sum() for d in model.cost_agg(cv, model.guidance(g)))
+    model = model.to(device).train()
+    inputs = [x.to(device).requires_grad_() for x in inputs]
+    return model, run, inputs
+
+
+def _proc_status_bytes(key):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(key + ':'):
+                return float(line.split()[1]) * 1024.0
+
+
+def _measure(arch, mode, N, H, W, maxdisp, repeat, device, queue = None):
+    """ time of forward + backward, the memory kept for backward, and the peak memory
+        (CUDA), or the RSS increase (CPU, Linux), over the step;
+    """
+    torch.manual_seed(0)
+    model, run, inputs = _aggregation_stack(arch, N, H, W, maxdisp, device)
+    num_blocks = set_activation_checkpointing(model, mode)
+    def sync():
+        if device != 'cpu':
+            torch.cuda.synchronize()
+    # the first step: the grads, and the one-time allocations, e.g., of the checkpoint itself;
+    run(*inputs).backward()
+    sync()
+    grads = [p.grad.clone() for p in model.parameters() if p.grad is not None]
+    if device != 'cpu':
+        torch.cuda.reset_peak_memory_stats()
+        base = torch.cuda.memory_allocated()
+    else:
+        # resets the peak RSS (VmHWM) to the current RSS;
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        base = _proc_status_bytes('VmRSS')
+    since = time.time()
+    for i in range(repeat):
+        loss = run(*inputs)
+        if i == 0:
+            # the memory kept for backward;
+            sync()
+            held = (torch.cuda.memory_allocated() if device != 'cpu' else _proc_status_bytes('VmRSS')) - base
+        loss.backward()
+    sync()
+    ms = (time.time() - since) / repeat * 1000
+    if device != 'cpu':
+        mem = torch.cuda.max_memory_allocated() - base
+    else:
+        mem = _proc_status_bytes('VmHWM') - base
+    result = (num_blocks, held / 1024.0**2, mem / 1024.0**2, ms, grads)
+    if queue is not None:
+        # (as numpy arrays: the shared memory of the tensors would not outlive the process;)
+        queue.put(result[:4] + ([g.cpu().numpy() for g in grads],))
+    return result
+
+
+def benchmark_activation_checkpoint(archs = ('psm', 'gcnet', 'ganet'), N = 1, H = 96, W = 192, maxdisp = 96,
+        repeat = 1, device = 'cpu'):
+    """ forward + backward of the cost aggregation stacks, for each checkpointing mode;
+        on the CPU, each run is in a new process, for its peak RSS;
+    """
+    import os
+    import multiprocessing
+    # (glibc: the tensors over 64 KB in their own mmap, so they leave the RSS once freed;)
+    os.environ.setdefault('MALLOC_MMAP_THRESHOLD_', '65536')
+    for arch in archs:
+        ref = None
+        for mode in CHECKPOINT_MODES:
+            args = (arch, mode, N, H, W, maxdisp, repeat, device)
+            if device == 'cpu':
+                ctx = multiprocessing.get_context('spawn')
+                queue = ctx.Queue()
+                process = ctx.Process(target = _measure, args = args + (queue,))
+                process.start()
+                result = queue.get()
+                process.join()
+                result = result[:4] + ([torch.from_numpy(g) for g in result[4]],)
+            else:
+                result = _measure(*args)
+            num_blocks, held, mem, ms, grads = result
+            if ref is None:
+                ref = grads
+            diff = max((a - b).abs().max().item() for a, b in zip(grads, ref))
+            print ("[{}] {:>9s} ({:2d} blocks): {:7.1f} MB after forward, {:7.1f} MB peak{}, {:8.2f} ms (forward + backward), grad max abs diff {:.1e}".format(
+                arch, mode, num_blocks, held, mem, '' if device != 'cpu' else ' (RSS increase)', ms, diff))
+
+
+if __name__ == "__main__":
+    benchmark_activation_checkpoint(('psm', 'gcnet'), device = 'cpu')
+    # (the SGA and LGA of GANet fall back to the PyTorch references without the GANet_cpu extension;)
+    benchmark_activation_checkpoint(('ganet',), H = 48, W = 96, maxdisp = 48, device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_activation_checkpoint(H = 256, W = 512, maxdisp = 192, device = 'cuda')
@@ -11,7 +11,7 @@ import math
 from .bilateral import bilateralFilter
 
 from ..baselines.DispNet.models.dispnet import (
-        correlation1D_map_V1,
+        correlation1D_map_V3,
 #        downsample_conv_bn,
 #        conv3x3_bn,
 #        upconv3x3_bn,
@@ -37,16 +37,19 @@ class AttenStereoNet(DispNet):
             crop_img_w = 512,
             isDFN = True, 
             dilation = 1,
-            cost_filter_grad = True
+            cost_filter_grad = True,
+            corr_disp_chunk = 0,
+            dfn_backend = 'im2col' # 'im2col' or 'shift', see src/modules/dfn.py;
             ):
         # due to TWO consecutive downsampling, so here maxdisp=40, 
         # actually means 4*maxdisp=160 in the original input image pair;
         super(AttenStereoNet, self).__init__( 
                 is_corr = True, 
                 maxdisp_corr = maxdisp //4, # for maxdisp_corr!! 
-                corr_func_type = 'correlation1D_map_V1',
+                corr_func_type = 'correlation1D_map_V3',
                 is_bn = True,
-                is_relu = True)
+                is_relu = True,
+                corr_disp_chunk = corr_disp_chunk)
 
         #self.maxdisp_corr = maxdisp // 4
         #self.is_bn = True
@@ -68,15 +71,15 @@ class AttenStereoNet(DispNet):
                     #img_size = (crop_img_h//4, crop_img_w//4), # due to 1/4 downsampling in PSMNet;
                     in_channels = 3)
             #the module layer:
-            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation)
+            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation, backend = dfn_backend)
             #Try V2:
-            self.corr_func = filtered_correlation1D(self.maxdisp_corr, self.kernel_size, self.dilation)
+            self.corr_func = filtered_correlation1D(self.maxdisp_corr, self.kernel_size, self.dilation, corr_disp_chunk)
         else:
             print ('[!!!] No dfn_generator and dfn_layer!!')
             self.dfn_generator = None
             self.dfn_layer = None
             # corr_func used in DispNetC baseline
-            self.corr_func = correlation1D_map_V1(self.maxdisp_corr)
+            self.corr_func = correlation1D_map_V3(self.maxdisp_corr, corr_disp_chunk)
 
         """ the followind initilization is omitted due to inheritance from DispNet """
 
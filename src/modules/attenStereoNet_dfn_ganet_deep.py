@@ -21,6 +21,8 @@ from ..baselines.GANet.models.GANet_deep_syncbn_v2 import (
     )
 
 from src.net_init import net_init_v0, net_init_SyncBN
+from src.modules.cost_volume import build_cost_volume
+from src.modules.cost_volume_filter import CostVolumeFilter
 # see this problem: 
 # 1) Question about SyncBN open-mmlab/mmdetection#933, at https://github.com/open-mmlab/mmdetection/issues/933;
 # 2) Multi-GPU training process stuck randomly #219, at https://github.com/facebookresearch/Detectron/issues/219;
@@ -42,9 +44,11 @@ class AttenStereoNet(GANet):
             crop_img_w = 512,
             isDFN = True, 
             dilation = 2,
-            cost_filter_grad = False
+            cost_filter_grad = False,
+            dfn_backend = 'im2col' # 'im2col' or 'shift', see src/modules/dfn.py;
             ):
         super(AttenStereoNet, self).__init__(maxdisp = maxdisp)
+        self.cv = build_cost_volume # loop-free, instead of cost_volume_faster;
         self.isDFN = isDFN # True of False
         self.kernel_size = kernel_size
         self.dilation = dilation
@@ -66,7 +70,8 @@ class AttenStereoNet(GANet):
                     is_sync_bn=True
                     )
             #the module layer:
-            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation)
+            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation, backend = dfn_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.dfn_layer.workspace_factor)
         else:
             print ('[!!!] No dfn_generator and dfn_layer!!')
             self.dfn_generator = None
@@ -125,10 +130,8 @@ class AttenStereoNet(GANet):
             
             # NOTE: this is the memory problem ???
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                    #print ('bilateral filtering cost volume slice %d/%d' %(d+1, D))
-                    cv_d_slice = cv[:,:,d,:,:].contiguous()
-                    cv[:,:,d,:,:] = self.dfn_layer(cv_d_slice, dfn_filter, dfn_bias)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                cv = self.cost_filter(cv, self.dfn_layer, dfn_filter, dfn_bias)
             
             # make sure the contiguous memeory
             cv = cv.contiguous()
@@ -12,7 +12,9 @@ from .dfn import filterGenerator, DynamicFilterLayerOneChannel, DynamicFilterLay
 #from .embednetwork import embed_net
 #from .bilateral import bilateralFilter
 from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 """
 our network
 """
@@ -29,7 +31,8 @@ class AttenStereoNet(GCNet):
             dilation = 2,
             cost_filter_grad = False,
             is_kendall_version = True, # excatly following the structure in Kendall's GCNet paper;
-            is_quarter_size_cost_volume_gcnet = False # cost volume in quarter image size, i.e., [D/4, H/4, W/4]
+            is_quarter_size_cost_volume_gcnet = False, # cost volume in quarter image size, i.e., [D/4, H/4, W/4]
+            dfn_backend = 'im2col' # 'im2col' or 'shift', see src/modules/dfn.py;
             ):
         
         super(AttenStereoNet, self).__init__(
@@ -52,7 +55,8 @@ class AttenStereoNet(GCNet):
                 in_channels = 3
                 )
             #the module layer:
-            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation)
+            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation, backend = dfn_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.dfn_layer.workspace_factor)
         else:
             print ('[!!!] No dfn_generator and dfn_layer!!')
             self.dfn_generator = None
@@ -81,7 +85,7 @@ class AttenStereoNet(GCNet):
         f_imgl = self.feature_extraction(imgl)
         f_imgr = self.feature_extraction(imgr)
         # cost volume
-        cv = cost_volume_faster(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
+        cv = build_cost_volume(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
         #print ("[???] cv shape: ", cv.shape)
         
         if not self.isDFN:
@@ -104,13 +108,8 @@ class AttenStereoNet(GCNet):
             #with torch.set_grad_enabled(False):
             #with torch.set_grad_enabled(True):
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0, D):
-                #for d in range(0,1):
-                    #print ('DFN filtering cost volume slice %d/%d' %(d+1, D))
-                    # apply DFN filter to cost volume [N,C,H,W];
-                    cv_d_slice = cv[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cv[:,:,d,:,:] = self.dfn_layer(cv_d_slice, dfn_filter, dfn_bias)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                cv = self.cost_filter(cv, self.dfn_layer, dfn_filter, dfn_bias)
 
         cv = cv.contiguous()
         # cost volume aggregation
@@ -128,7 +127,7 @@ class AttenStereoNet(GCNet):
             out = out[:,None,...] # add channel C first, i.e., chang [N,D,H,W] to [N,C=1,D,H,W];
             out = F.interpolate(out, [self.maxdisp, H, W], mode='trilinear', align_corners=True) # in size [N,C=1,D,H,W];
             out = torch.squeeze(out, 1) # in size [N,D,H,W]
-        prob = F.softmax(out, 1)
+        prob = softmax_fp32(out, 1)
         #disp = self.disparityregression(prob, maxdisp=self.maxdisp//img_ds_scale)
         #NOTE: This is right!!! Updated on 04/12/2020;
         disp = self.disparityregression(prob, maxdisp=self.maxdisp)
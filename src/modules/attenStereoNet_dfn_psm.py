@@ -21,7 +21,9 @@ from .psmnet_submodule import PSMNet, disparityregression
 #from .bilateral import bilateralFilter
 from .dfn import filterGenerator, DynamicFilterLayerOneChannel, DynamicFilterLayer
 #from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 """
 our network
@@ -36,7 +38,8 @@ class AttenStereoNet(PSMNet):
             crop_img_w = 512,
             isDFN = True, 
             dilation = 2,
-            cost_filter_grad = True
+            cost_filter_grad = True,
+            dfn_backend = 'im2col' # 'im2col' or 'shift', see src/modules/dfn.py;
             ):
         super(AttenStereoNet, self).__init__(maxdisp=maxdisp)
         #self.maxdisp = maxdisp
@@ -52,7 +55,8 @@ class AttenStereoNet(PSMNet):
                     #img_size = (crop_img_h//4, crop_img_w//4), # due to 1/4 downsampling in PSMNet;
                     in_channels = 3)
             #the module layer:
-            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation)
+            self.dfn_layer = DynamicFilterLayer(kernel_size, dilation, backend = dfn_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.dfn_layer.workspace_factor)
         else:
             print ('[!!!] No dfn_generator and dfn_layer!!')
             self.dfn_generator = None
@@ -67,7 +71,7 @@ class AttenStereoNet(PSMNet):
         y = self.feature_extraction(right) # right feature, in size [N,C,H/4,W/4]
 
         # matching volume, in size [N,2C,D/4, H/4, W/4]; 
-        cost = cost_volume_faster(x, y, self.maxdisp // 4)
+        cost = build_cost_volume(x, y, self.maxdisp // 4)
         
         
         if not self.isDFN:
@@ -90,13 +94,8 @@ class AttenStereoNet(PSMNet):
             #with torch.set_grad_enabled(False):
             #with torch.set_grad_enabled(True):
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0, D):
-                #for d in range(0,1):
-                    #print ('DFN filtering cost volume slice %d/%d' %(d+1, D))
-                    # apply DFN filter to cost volume [N,C,H,W];
-                    cv_d_slice = cost[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cost[:,:,d,:,:] = self.dfn_layer(cv_d_slice, dfn_filter, dfn_bias)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                cost = self.cost_filter(cost, self.dfn_layer, dfn_filter, dfn_bias)
              
         cost = cost.contiguous()
 
@@ -124,18 +123,18 @@ class AttenStereoNet(PSMNet):
                                   mode='trilinear', align_corners=True)
 
             cost1 = torch.squeeze(cost1, 1)
-            pred1 = F.softmax(cost1, dim=1)
+            pred1 = softmax_fp32(cost1, dim=1)
             pred1 = disparityregression(self.maxdisp)(pred1)
 
             cost2 = torch.squeeze(cost2, 1)
-            pred2 = F.softmax(cost2, dim=1)
+            pred2 = softmax_fp32(cost2, dim=1)
             pred2 = disparityregression(self.maxdisp)(pred2)
 
         #cost3 = F.upsample(cost3, [self.maxdisp,left.size()[2],left.size()[3]], mode='trilinear')
         cost3 = F.interpolate(cost3, [self.maxdisp, left.size()[2], left.size()[3]],
                               mode='trilinear', align_corners=True)
         cost3 = torch.squeeze(cost3, 1)
-        pred3 = F.softmax(cost3, dim=1)
+        pred3 = softmax_fp32(cost3, dim=1)
         # For your information: This formulation 'softmax(c)' learned "similarity"
         # while 'softmax(-c)' learned 'matching cost' as mentioned in the paper.
         # However, 'c' or '-c' do not affect the performance because feature-based cost volume provided flexibility.
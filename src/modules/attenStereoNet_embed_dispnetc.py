@@ -32,7 +32,9 @@ class AttenStereoNet(DispNet):
             sigma_v = 0.1, 
             isEmbed = True, 
             dilation = 2,
-            cost_filter_grad = True
+            cost_filter_grad = True,
+            corr_disp_chunk = 0,
+            bilateral_backend = 'im2col' # 'im2col' or 'shift', see src/modules/bilateral.py;
             ):
         
         """ the following is from DispNetC """
@@ -41,9 +43,10 @@ class AttenStereoNet(DispNet):
         super(AttenStereoNet, self).__init__( 
                 is_corr = True, 
                 maxdisp_corr = maxdisp //4, # for maxdisp_corr!! 
-                corr_func_type = 'correlation1D_map_V1',
+                corr_func_type = 'correlation1D_map_V3',
                 is_bn = True,
-                is_relu = True)
+                is_relu = True,
+                corr_disp_chunk = corr_disp_chunk)
         
         self.isEmbed = isEmbed # True of False
         self.sigma_s = sigma_s
@@ -60,7 +63,8 @@ class AttenStereoNet(DispNet):
             print(' Enable Embedding Network!!!')
             self.embednet = embed_net()
             #the module layer:
-            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation)
+            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation,
+                backend = bilateral_backend)
         else:
             self.embednet = None
             self.bifilter = None
@@ -10,7 +10,7 @@ import math
 from .embednetwork import embed_net
 from .bilateral import bilateralFilter
 from ..baselines.DispNet.models.dispnet import (
-        correlation1D_map_V1,
+        correlation1D_map_V3,
         downsample_conv_bn,
         conv3x3_bn,
         upconv3x3_bn,
@@ -33,7 +33,8 @@ class AttenStereoNet(nn.Module):
             sigma_v = 0.1, 
             isEmbed = True, 
             dilation = 2,
-            cost_filter_grad = True
+            cost_filter_grad = True,
+            corr_disp_chunk = 0
             ):
         super(AttenStereoNet, self).__init__()
         self.maxdisp = maxdisp
@@ -67,7 +68,7 @@ class AttenStereoNet(nn.Module):
         print ("[***] DispNet using is_relu : ", self.is_relu)
         print ("[***] DispNet using is_bn : ", self.is_bn)
         print ("[***] DispNet using maxdisp_corr : ", self.maxdisp_corr)
-        self.corr_func = correlation1D_map_V1(self.maxdisp_corr)
+        self.corr_func = correlation1D_map_V3(self.maxdisp_corr, corr_disp_chunk)
 
         
         """ DispNetC: encoder """
@@ -157,10 +158,12 @@ class AttenStereoNet(nn.Module):
             #print ('[???] correlation shape', out.shape)
             # NOTE: this might be the memory consuming!!!
             with torch.set_grad_enabled(self.cost_filter_grad):
-                out = self.bifilter(embed, out.contiguous())
+                # the bilateral weights, computed once for both the maps;
+                bi_weights = self.bifilter.compute_weights(embed)
+                out = self.bifilter(embed, out.contiguous(), bi_weights)
                 out = out.contiguous()
                 #print ('[???] filtered correlation shape', out.shape)
-                out_redir = self.bifilter(embed, out_redir.contiguous())
+                out_redir = self.bifilter(embed, out_redir.contiguous(), bi_weights)
                 out_redir = out_redir.contiguous()
                 #print ('[???] filtered out_redir shape', out_redir.shape)
 
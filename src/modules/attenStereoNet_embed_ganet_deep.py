@@ -25,6 +25,8 @@ from ..baselines.GANet.models.GANet_deep_syncbn_v2 import (
     )
 
 from src.net_init import net_init_v0
+from src.modules.cost_volume import build_cost_volume
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 ############################################
 """ adapted from GANet paper code """
@@ -39,9 +41,11 @@ class AttenStereoNet(GANet):
     def __init__(self, maxdisp=192, sigma_s = 0.7, # 1.7: 13 x 13; 0.3 : 3 x 3;
                  sigma_v = 0.1, isEmbed = True, 
                  dilation = 1,
-                 cost_filter_grad = False
+                 cost_filter_grad = False,
+                 bilateral_backend = 'im2col' # 'im2col' or 'shift', see src/modules/bilateral.py;
                  ):
         super(AttenStereoNet, self).__init__(maxdisp = maxdisp)
+        self.cv = build_cost_volume # loop-free, instead of cost_volume_faster;
         #self.maxdisp = maxdisp
 
         self.isEmbed = isEmbed # True of False
@@ -55,7 +59,9 @@ class AttenStereoNet(GANet):
             print(' Enable Embedding Network!!!')
             self.embednet = embed_net()
             #the module layer:
-            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation)
+            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation,
+                backend = bilateral_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.bifilter.workspace_factor)
         else:
             self.embednet = None
             self.bifilter = None
@@ -114,10 +120,10 @@ class AttenStereoNet(GANet):
             
             # NOTE: this is the memory problem ???
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                    #print ('bilateral filtering cost volume slice %d/%d' %(d+1, D))
-                    cv_d_slice = cv[:,:,d,:,:]
-                    cv[:,:,d,:,:] = self.bifilter(embed, cv_d_slice)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the bilateral weights from the embedding, computed once for all the slices;
+                bi_weights = self.bifilter.compute_weights(embed)
+                cv = self.cost_filter(cv, lambda x, w: self.bifilter.apply_weights(w, x), bi_weights)
             
             # make sure the contiguous memeory
             cv = cv.contiguous()
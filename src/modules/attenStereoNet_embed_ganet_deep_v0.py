@@ -18,10 +18,10 @@ from .bilateral import bilateralFilter
 #from .bilateral_func import bilateralFilter
 from ..baselines.GANet.libs.sync_bn.modules.sync_bn import BatchNorm2d, BatchNorm3d
 from ..baselines.GANet.libs.GANet.modules.GANet import DisparityRegression
-from ..baselines.GANet.libs.GANet.modules.GANet import GetCostVolume
 from ..baselines.GANet.libs.GANet.modules.GANet import LGA, LGA2, LGA3
 
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import cost_volume_faster, build_cost_volume
+from src.modules.mixed_precision import keep_fp32
 ############################################
 """ adapted from GANet paper code """
 ############################################
@@ -226,6 +226,8 @@ class Disp(nn.Module):
 #        self.conv32x1 = BasicConv(32, 1, kernel_size=3)
         self.conv32x1 = nn.Conv3d(32, 1, (3, 3, 3), (1, 1, 1), (1, 1, 1), bias=False)
 
+    # the softmin (and LGA) and the regression in fp32, under autocast;
+    @keep_fp32
     def forward(self, x):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], mode='trilinear', align_corners=False)
         x = torch.squeeze(x, 1)
@@ -251,6 +253,7 @@ class DispAgg(nn.Module):
         x = self.LGA2(x, g)
         return x
 
+    @keep_fp32
     def forward(self, x, lg1, lg2):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], mode='trilinear', align_corners=False)
         x = torch.squeeze(x, 1)
@@ -555,11 +558,10 @@ class AttenStereoNet(nn.Module):
         #self.conv3d_start = BasicConv(cv_in_channels, 32, is_3d=True, kernel_size=3, padding=1, relu=False)
         self.conv_x = BasicConv(32, 32, kernel_size=3, padding=1) # with default bn=True, relu=True
         self.conv_y = BasicConv(32, 32, kernel_size=3, padding=1) # with default bn=True, relu=True
-        if self.isEmbed:
-            self.cv = GetCostVolume4BilaterFilter(int(self.maxdisp/3))
-            #self.cv = GetCostVolume4BilaterFilterV0(int(self.maxdisp/3))
-        else:
-            self.cv = GetCostVolume(int(self.maxdisp/3))
+        # loop-free, instead of GetCostVolume4BilaterFilter / GetCostVolume;
+        # mask_left: the same cost volume as them, i.e., zeros where w < d;
+        self.cv = build_cost_volume
+        #self.cv = GetCostVolume4BilaterFilterV0(int(self.maxdisp/3))
         
         self.guidance = Guidance()
         
@@ -604,13 +606,13 @@ class AttenStereoNet(nn.Module):
         # feture concatenation to generate cost volume
         if not self.isEmbed:
             # [N, C, D/3, H/3, W/3]
-            cv = self.cv(f_x, f_y)
+            cv = self.cv(f_x, f_y, int(self.maxdisp/3) + 1, mask_left = True)
             embed = None
             #embed_scale = None
 
         else: # using embedding
             # [D/3, N, C, H/3, W/3]
-            cv = self.cv(f_x, f_y)
+            cv = self.cv(f_x, f_y, int(self.maxdisp/3) + 1, mask_left = True)
             # downscale x to [N,C,H/3, W/3] then fed into embeddingnet,
             # because the cost volume generated below is in shape [N,C,D/3, H/3, W/3]
             x_scale = F.interpolate(x, [x.size()[2]//3, x.size()[3]//3], 
@@ -628,13 +630,15 @@ class AttenStereoNet(nn.Module):
             # NO sure this torch.no_grad() will distory the training or not !!!!
             #with torch.no_grad():
             with torch.set_grad_enabled(self.cost_filter_grad):
+                # the bilateral weights, computed once for all the slices;
+                bi_weights = self.bifilter.compute_weights(embed)
                 for d in range(0,D):
                 #for d in range(0,1):
                     #print ('bilateral filtering cost volume slice %d/%d' %(d+1, D))
                     # apply bilateral filter to cost volume [N,C,H,W];
                     cv_d_slice = cv[:,:,d,:,:]
                     #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cv[:,:,d,:,:] = self.bifilter(embed, cv_d_slice)
+                    cv[:,:,d,:,:] = self.bifilter.apply_weights(bi_weights, cv_d_slice)
                     #cv[:,:,d,:,:] = self.bifilter(embed, cv_d_slice, self.sigma_s, self.sigma_v, isCUDA = True, dilation = 1)
                     #print ('[???] cv_d_filtered shape', cv_d_filtered.shape)
              
@@ -11,7 +11,9 @@ from ..baselines.GCNet.models.gcnet import GCNet
 from .embednetwork import embed_net
 from .bilateral import bilateralFilter
 from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 """
 our network
@@ -27,6 +29,7 @@ class AttenStereoNet(GCNet):
             isEmbed = True, 
             dilation = 1,
             cost_filter_grad = False,
+            bilateral_backend = 'im2col', # 'im2col' or 'shift', see src/modules/bilateral.py;
             is_kendall_version = True, # excatly following the structure in Kendall's GCNet paper;
             is_quarter_size_cost_volume_gcnet = False # cost volume in quarter image size, i.e., [D/4, H/4, W/4]
             ):
@@ -47,7 +50,9 @@ class AttenStereoNet(GCNet):
         if self.isEmbed:
             print(' Enable Embedding Network!!!')
             self.embednet = embed_net()
-            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation)
+            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation,
+                backend = bilateral_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.bifilter.workspace_factor)
         else:
             self.embednet = None
             self.bifilter = None
@@ -78,7 +83,7 @@ class AttenStereoNet(GCNet):
         f_imgr = self.feature_extraction(imgr)
 
         # cost volume
-        cv = cost_volume_faster(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
+        cv = build_cost_volume(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
         #print ("[???] cv shape: ", cv.shape)
          
         
@@ -103,11 +108,10 @@ class AttenStereoNet(GCNet):
             #with torch.set_grad_enabled(False):
             #with torch.set_grad_enabled(True):
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                    #print ('bilateral filtering cost volume slice %d/%d' %(d+1, D))
-                    cv_d_slice = cv[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cv[:,:,d,:,:] = self.bifilter(embed, cv_d_slice)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the bilateral weights from the embedding, computed once for all the slices;
+                bi_weights = self.bifilter.compute_weights(embed)
+                cv = self.cost_filter(cv, lambda x, w: self.bifilter.apply_weights(w, x), bi_weights)
              
         cv = cv.contiguous()
         # cost volume aggregation
@@ -125,7 +129,7 @@ class AttenStereoNet(GCNet):
             out = out[:,None,...] # add channel C first, i.e., chang [N,D,H,W] to [N,C=1,D,H,W];
             out = F.interpolate(out, [self.maxdisp, H, W], mode='trilinear', align_corners=True) # in size [N,C=1,D,H,W];
             out = torch.squeeze(out, 1) # in size [N,D,H,W]
-        prob = F.softmax(out, 1)
+        prob = softmax_fp32(out, 1)
         #disp = self.disparityregression(prob, maxdisp=self.maxdisp//img_ds_scale)
         #NOTE: This is right!!! Updated on 04/12/2020;
         disp = self.disparityregression(prob, maxdisp=self.maxdisp)
@@ -11,7 +11,9 @@ from .psmnet_submodule import PSMNet, disparityregression
 from .embednetwork import embed_net
 from .bilateral import bilateralFilter
 #from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 """
 our network
@@ -23,7 +25,8 @@ class AttenStereoNet(PSMNet):
     def __init__(self, maxdisp=192, sigma_s = 0.7, # 1.7: 13 x 13; 0.3 : 3 x 3;
             sigma_v = 0.1, isEmbed = True, 
             dilation = 1,
-            cost_filter_grad = False
+            cost_filter_grad = False,
+            bilateral_backend = 'im2col' # 'im2col' or 'shift', see src/modules/bilateral.py;
             ):
         super(AttenStereoNet, self).__init__(maxdisp = maxdisp)
         #self.maxdisp = maxdisp
@@ -37,7 +40,9 @@ class AttenStereoNet(PSMNet):
             print(' Enable Embedding Network!!!')
             self.embednet = embed_net()
             #the module layer:
-            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation)
+            self.bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = True, dilation = self.dilation,
+                backend = bilateral_backend)
+            self.cost_filter = CostVolumeFilter('channel', workspace_factor = self.bifilter.workspace_factor)
             # the function version
             #self.bifilter = bilateralFilter
         else:
@@ -52,7 +57,7 @@ class AttenStereoNet(PSMNet):
         y = self.feature_extraction(right) # right feature
 
         # matching volume, in size [N,2C,D/4, H/4, W/4];
-        cost = cost_volume_faster(x, y, self.maxdisp//4)
+        cost = build_cost_volume(x, y, self.maxdisp//4)
         
         if not self.isEmbed:
             embed = None
@@ -76,13 +81,10 @@ class AttenStereoNet(PSMNet):
             #with torch.set_grad_enabled(False):
             #with torch.set_grad_enabled(True):
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                #for d in range(0,1):
-                    #print ('bilateral filtering cost volume slice %d/%d' %(d+1, D))
-                    # apply bilateral filter to cost volume [N,C,H,W];
-                    cv_d_slice = cost[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cost[:,:,d,:,:] = self.bifilter(embed, cv_d_slice)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the bilateral weights from the embedding, computed once for all the slices;
+                bi_weights = self.bifilter.compute_weights(embed)
+                cost = self.cost_filter(cost, lambda x, w: self.bifilter.apply_weights(w, x), bi_weights)
              
         cost = cost.contiguous()
 
@@ -112,18 +114,18 @@ class AttenStereoNet(PSMNet):
                                   mode='trilinear', align_corners=True)
 
             cost1 = torch.squeeze(cost1, 1)
-            pred1 = F.softmax(cost1, dim=1)
+            pred1 = softmax_fp32(cost1, dim=1)
             pred1 = disparityregression(self.maxdisp)(pred1)
 
             cost2 = torch.squeeze(cost2, 1)
-            pred2 = F.softmax(cost2, dim=1)
+            pred2 = softmax_fp32(cost2, dim=1)
             pred2 = disparityregression(self.maxdisp)(pred2)
 
         #cost3 = F.upsample(cost3, [self.maxdisp,left.size()[2],left.size()[3]], mode='trilinear')
         cost3 = F.interpolate(cost3, [self.maxdisp, left.size()[2], left.size()[3]],
                               mode='trilinear', align_corners=True)
         cost3 = torch.squeeze(cost3, 1)
-        pred3 = F.softmax(cost3, dim=1)
+        pred3 = softmax_fp32(cost3, dim=1)
         # For your information: This formulation 'softmax(c)' learned "similarity"
         # while 'softmax(-c)' learned 'matching cost' as mentioned in the paper.
         # However, 'c' or '-c' do not affect the performance because feature-based cost volume provided flexibility.
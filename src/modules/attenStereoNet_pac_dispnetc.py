@@ -41,7 +41,8 @@ class AttenStereoNet(DispNet):
             pac_out_channels = 64,
             dilation = 2,
             cost_filter_grad = True,
-            native_impl = True
+            native_impl = True,
+            corr_disp_chunk = 0
             ):
         
         # due to TWO consecutive downsampling, so here maxdisp=40, 
@@ -49,9 +50,10 @@ class AttenStereoNet(DispNet):
         super(AttenStereoNet, self).__init__( 
                 is_corr = True, 
                 maxdisp_corr = maxdisp //4, # for maxdisp_corr!! 
-                corr_func_type = 'correlation1D_map_V1',
+                corr_func_type = 'correlation1D_map_V3',
                 is_bn = True,
-                is_relu = True
+                is_relu = True,
+                corr_disp_chunk = corr_disp_chunk
                 )
 
         #self.maxdisp = maxdisp
@@ -72,7 +74,9 @@ class AttenStereoNet(DispNet):
                                 stride = 1, padding = self.pad, dilation = self.d,
                                 native_impl = native_impl
                                 )
-            if native_impl:
+            if native_impl == 'auto':
+                print(' Enable Pixel-Adaptive Convolution (PAC) Network, implementation auto-tuned per shape!!!')
+            elif native_impl:
                 print(' Enable Native_implement Pixel-Adaptive Convolution (NPAC) Network!!!')
             else:
                 print(' Enable (Filter_implemetn) Pixel-Adaptive Convolution (PAC) Network!!!')
@@ -23,6 +23,8 @@ from ..baselines.GANet.models.GANet_deep_syncbn_v2 import (
     )
 
 from src.net_init import net_init_v0
+from src.modules.cost_volume import build_cost_volume
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 ############################################
 """ adapted from GANet paper code """
@@ -46,6 +48,7 @@ class AttenStereoNet(GANet):
             ):
         
         super(AttenStereoNet, self).__init__(maxdisp = maxdisp)
+        self.cv = build_cost_volume # loop-free, instead of cost_volume_faster;
         
         self.isPAC = isPAC # True of False
         self.isEmbed = isEmbed # True of False
@@ -61,7 +64,10 @@ class AttenStereoNet(GANet):
                                 stride = 1, padding = self.pad, dilation = self.d,
                                 native_impl = native_impl
                                 )
-            if native_impl:
+            self.cost_filter = CostVolumeFilter('batch', workspace_factor = self.k**2)
+            if native_impl == 'auto':
+                print(' Enable Pixel-Adaptive Convolution (PAC) Network, implementation auto-tuned per shape!!!')
+            elif native_impl:
                 print(' Enable Native_implement Pixel-Adaptive Convolution (NPAC) Network!!!')
             else:
                 print(' Enable (Filter_implemetn) Pixel-Adaptive Convolution (PAC) Network!!!')
@@ -135,12 +141,10 @@ class AttenStereoNet(GANet):
             
             # NOTE: this might be the memory consuming!!!
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                    cv_d_slice = cv[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cv[:,:,d,:,:] = self.pacconv(
-                            input_2d = cv_d_slice,
-                            input_for_kernel = pac_guide_fea)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the adaptive kernel from the guide, computed once for all the slices;
+                pac_kernel = self.pacconv.compute_kernel(pac_guide_fea)[0]
+                cv = self.cost_filter(cv, lambda x, k: self.pacconv(input_2d = x, input_for_kernel = None, kernel = k), pac_kernel)
 
         # make sure the contiguous memeory
         cv = cv.contiguous()
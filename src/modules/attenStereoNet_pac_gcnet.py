@@ -12,7 +12,9 @@ from .embednetwork import embed_net
 from .pac import  PacConv2d
 #from .bilateral import bilateralFilter
 from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 """
 our network
 """
@@ -54,7 +56,10 @@ class AttenStereoNet(GCNet):
                                 stride = 1, padding = self.pad, dilation = self.d,
                                 native_impl = native_impl
                                 )
-            if native_impl:
+            self.cost_filter = CostVolumeFilter('batch', workspace_factor = self.k**2)
+            if native_impl == 'auto':
+                print(' Enable Pixel-Adaptive Convolution (PAC) Network, implementation auto-tuned per shape!!!')
+            elif native_impl:
                 print(' Enable Native_implement Pixel-Adaptive Convolution (NPAC) Network!!!')
             else:
                 print(' Enable (Filter_implemetn) Pixel-Adaptive Convolution (PAC) Network!!!')
@@ -88,7 +93,7 @@ class AttenStereoNet(GCNet):
         f_imgr = self.feature_extraction(imgr)
 
         # cost volume
-        cv = cost_volume_faster(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
+        cv = build_cost_volume(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
         #print ("[???] cv shape: ", cv.shape)
         
         pac_guide_fea = None 
@@ -117,13 +122,10 @@ class AttenStereoNet(GCNet):
             #with torch.set_grad_enabled(True):
             #print ("[***???] self.cost_filter_grad = ", self.cost_filter_grad)
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                #for d in range(0,1):
-                    cv_d_slice = cv[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cv[:,:,d,:,:] = self.pacconv(
-                            input_2d = cv_d_slice,
-                            input_for_kernel = pac_guide_fea)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the adaptive kernel from the guide, computed once for all the slices;
+                pac_kernel = self.pacconv.compute_kernel(pac_guide_fea)[0]
+                cv = self.cost_filter(cv, lambda x, k: self.pacconv(input_2d = x, input_for_kernel = None, kernel = k), pac_kernel)
         
         cv = cv.contiguous()
         # cost volume aggregation
@@ -141,7 +143,7 @@ class AttenStereoNet(GCNet):
             out = out[:,None,...] # add channel C first, i.e., chang [N,D,H,W] to [N,C=1,D,H,W];
             out = F.interpolate(out, [self.maxdisp, H, W], mode='trilinear', align_corners=True) # in size [N,C=1,D,H,W];
             out = torch.squeeze(out, 1) # in size [N,D,H,W]
-        prob = F.softmax(out, 1)
+        prob = softmax_fp32(out, 1)
         #disp = self.disparityregression(prob, maxdisp=self.maxdisp//img_ds_scale)
         #NOTE: This is right!!! Updated on 04/12/2020;
         disp = self.disparityregression(prob, maxdisp=self.maxdisp)
@@ -18,7 +18,9 @@ from .psmnet_submodule import PSMNet, disparityregression
 from .embednetwork import embed_net
 from .pac import  PacConv2d
 #from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
+from src.modules.cost_volume_filter import CostVolumeFilter
 
 """
 our network
@@ -53,7 +55,10 @@ class AttenStereoNet(PSMNet):
                                 stride = 1, padding = self.pad, dilation = self.d,
                                 native_impl = native_impl
                                 )
-            if native_impl:
+            self.cost_filter = CostVolumeFilter('batch', workspace_factor = self.k**2)
+            if native_impl == 'auto':
+                print(' Enable Pixel-Adaptive Convolution (PAC) Network, implementation auto-tuned per shape!!!')
+            elif native_impl:
                 print(' Enable Native_implement Pixel-Adaptive Convolution (NPAC) Network!!!')
             else:
                 print(' Enable (Filter_implemetn) Pixel-Adaptive Convolution (PAC) Network!!!')
@@ -77,7 +82,7 @@ class AttenStereoNet(PSMNet):
         x = self.feature_extraction(left) # left feature, in size [N,C,H/4,W/4]
         y = self.feature_extraction(right)# right feature, in size [N,C,H/4,W/4]
         # matching volume, in size [N,2C,D/4, H/4, W/4];
-        cost = cost_volume_faster(x, y, self.maxdisp//4)
+        cost = build_cost_volume(x, y, self.maxdisp//4)
         
         pac_guide_fea = None 
         if self.isPAC:
@@ -103,13 +108,10 @@ class AttenStereoNet(PSMNet):
             #with torch.set_grad_enabled(True):
             #print ("[***???] self.cost_filter_grad = ", self.cost_filter_grad)
             with torch.set_grad_enabled(self.cost_filter_grad):
-                for d in range(0,D):
-                #for d in range(0,1):
-                    cv_d_slice = cost[:,:,d,:,:].contiguous()
-                    #print ('[???] cv_d_slice shape', cv_d_slice.shape)
-                    cost[:,:,d,:,:] = self.pacconv(
-                            input_2d = cv_d_slice,
-                            input_for_kernel = pac_guide_fea)
+                # the D slices in batches, instead of one call per slice (see cost_volume_filter.py);
+                # the adaptive kernel from the guide, computed once for all the slices;
+                pac_kernel = self.pacconv.compute_kernel(pac_guide_fea)[0]
+                cost = self.cost_filter(cost, lambda x, k: self.pacconv(input_2d = x, input_for_kernel = None, kernel = k), pac_kernel)
 
         cost = cost.contiguous()
 
@@ -139,17 +141,17 @@ class AttenStereoNet(PSMNet):
                                   mode='trilinear', align_corners=True)
 
             cost1 = torch.squeeze(cost1, 1)
-            pred1 = F.softmax(cost1, dim=1)
+            pred1 = softmax_fp32(cost1, dim=1)
             pred1 = disparityregression(self.maxdisp)(pred1)
 
             cost2 = torch.squeeze(cost2, 1)
-            pred2 = F.softmax(cost2, dim=1)
+            pred2 = softmax_fp32(cost2, dim=1)
             pred2 = disparityregression(self.maxdisp)(pred2)
 
         cost3 = F.interpolate(cost3, [self.maxdisp, left.size()[2], left.size()[3]],
                               mode='trilinear', align_corners=True)
         cost3 = torch.squeeze(cost3, 1)
-        pred3 = F.softmax(cost3, dim=1)
+        pred3 = softmax_fp32(cost3, dim=1)
         # For your information: This formulation 'softmax(c)' learned "similarity"
         # while 'softmax(-c)' learned 'matching cost' as mentioned in the paper.
         # However, 'c' or '-c' do not affect the performance because feature-based 
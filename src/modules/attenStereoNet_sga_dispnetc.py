@@ -31,16 +31,18 @@ class AttenStereoNet(DispNet):
             #is_quarter_size = True, # feature in 1/4 image size (i.e., H/4 x W/4) or 1/3 size (i.e., H/3 x W/3)
             downsample_scale = 4, # dummy one!!!
             is_lga = False, # generate LGA(Local Guided Aggregation) weights or not
-            cost_filter_grad = False
+            cost_filter_grad = False,
+            corr_disp_chunk = 0
             ):
         # due to TWO consecutive downsampling, so here maxdisp=40, 
         # actually means 4*maxdisp=160 in the original input image pair;
         super(AttenStereoNet, self).__init__( 
                 is_corr = True, 
                 maxdisp_corr = maxdisp //4, # for maxdisp_corr!! 
-                corr_func_type = 'correlation1D_map_V1',
+                corr_func_type = 'correlation1D_map_V3',
                 is_bn = True,
-                is_relu = True)
+                is_relu = True,
+                corr_disp_chunk = corr_disp_chunk)
         #self.downsample_scale = downsample_scale # dummy one!!!
         self.downsample_scale = 4
         print ("SGA + DispNetC: set downsample_scale = %d" % self.downsample_scale)
@@ -10,7 +10,8 @@ import math
 from ..baselines.GCNet.models.gcnet import GCNet
 from .embednetwork import embed_net
 #from .bilateral import bilateralFilter
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
 from .sga_11 import SGA_CostAggregation
 from src.net_init import net_init_v0
 
@@ -88,7 +89,7 @@ class AttenStereoNet(GCNet):
         f_imgr = self.feature_extraction(imgr)
 
         # cost volume
-        cv = cost_volume_faster(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
+        cv = build_cost_volume(f_imgl, f_imgr, d = self.maxdisp//(2*img_ds_scale))
         #print ("[???] cv shape: ", cv.shape)
 
         if self.is_sga_guide_from_img:
@@ -124,7 +125,7 @@ class AttenStereoNet(GCNet):
             out = out[:,None,...] # add channel C first, i.e., chang [N,D,H,W] to [N,C=1,D,H,W];
             out = F.interpolate(out, [self.maxdisp, H, W], mode='trilinear', align_corners=True) # in size [N,C=1,D,H,W];
             out = torch.squeeze(out, 1) # in size [N,D,H,W]
-        prob = F.softmax(out, 1)
+        prob = softmax_fp32(out, 1)
         #disp = self.disparityregression(prob, maxdisp=self.maxdisp//img_ds_scale)
         #NOTE: This is right!!! Updated on 04/12/2020;
         disp = self.disparityregression(prob, maxdisp=self.maxdisp)
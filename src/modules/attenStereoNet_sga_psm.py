@@ -11,7 +11,8 @@ from .psmnet_submodule import PSMNet, disparityregression
 from .embednetwork import embed_net
 #from .bilateral import bilateralFilter
 from src.net_init import net_init_v0
-from src.modules.cost_volume import cost_volume_faster
+from src.modules.cost_volume import build_cost_volume
+from src.modules.mixed_precision import softmax_fp32
 from .sga_11 import SGA_CostAggregation
 
 """
@@ -66,7 +67,7 @@ class AttenStereoNet(PSMNet):
         y = self.feature_extraction(right) # right feature
 
         # matching volume, in size [N,2C,D/4, H/4, W/4];
-        cost = cost_volume_faster(x, y, self.maxdisp//4)
+        cost = build_cost_volume(x, y, self.maxdisp//4)
         
         if self.is_sga_guide_from_img:
             g_in = None
@@ -111,18 +112,18 @@ class AttenStereoNet(PSMNet):
                                   mode='trilinear', align_corners=True)
 
             cost1 = torch.squeeze(cost1, 1)
-            pred1 = F.softmax(cost1, dim=1)
+            pred1 = softmax_fp32(cost1, dim=1)
             pred1 = disparityregression(self.maxdisp)(pred1)
 
             cost2 = torch.squeeze(cost2, 1)
-            pred2 = F.softmax(cost2, dim=1)
+            pred2 = softmax_fp32(cost2, dim=1)
             pred2 = disparityregression(self.maxdisp)(pred2)
 
         #cost3 = F.upsample(cost3, [self.maxdisp,left.size()[2],left.size()[3]], mode='trilinear')
         cost3 = F.interpolate(cost3, [self.maxdisp, left.size()[2], left.size()[3]],
                               mode='trilinear', align_corners=True)
         cost3 = torch.squeeze(cost3, 1)
-        pred3 = F.softmax(cost3, dim=1)
+        pred3 = softmax_fp32(cost3, dim=1)
         # For your information: This formulation 'softmax(c)' learned "similarity"
         # while 'softmax(-c)' learned 'matching cost' as mentioned in the paper.
         # However, 'c' or '-c' do not affect the performance because feature-based cost volume provided flexibility.
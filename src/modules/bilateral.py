@@ -13,11 +13,15 @@ import sys
 import math
 import torch
 import torch.nn as nn
-from .im2col import im2col_layer
+import torch.nn.functional as F
+from .im2col import im2col_layer, shift_range
+from .permutohedral import get_bilateral_lattice
+from .mixed_precision import keep_fp32, float32_region
 
 __all__ = ['bilateralFilter', 
         'get_space_gaussian_filter', 
         'get_gaussian_filter_width_from_sigma',
+        'bilateral_filter_shift',
         ]
 # try to use pyinn.im2col for speed up 
 #try:
@@ -74,12 +78,113 @@ def get_space_gaussian_filter(sigma_s = 0.1):
     return sw_filter.astype(np.float32)
 
 
+def _bilateral_taps(embed, sg_weights, k, d, sigma_v):
+    """ yield, for each of the k*k offsets (in the im2col order), 
+        the shift (dy, dx), the embedding difference [N,F,H,W] and the weight [N,1,H,W];
+        the embedding is zero padded, as nn.Unfold does, so the border taps 
+        are in the normalizer exactly as in the im2col backend;
+    """
+    N, _, H, W = embed.size()
+    p = d*(k - 1) // 2
+    embed_pad = F.pad(embed, [p, p, p, p])
+    for i in range(k):
+        for j in range(k):
+            diff = embed_pad[:, :, i*d:i*d + H, j*d:j*d + W] - embed
+            w = torch.sum(diff*diff, dim = 1, keepdim = True).mul_(-0.5 / sigma_v**2).exp_()
+            w *= sg_weights[i*k + j]
+            yield i*d - p, j*d - p, diff, w
+
+
+class BilateralShiftFunction(torch.autograd.Function):
+    """ the embedding bilateral filter by shift-and-accumulate:
+        for each of the k*k offsets, the range x space weight [N,1,H,W] is computed 
+        from the shifted embedding, and accumulated, with the weighted shifted input, 
+        into the normalizer [N,1,H,W] and the output [N,C,H,W];
+        i.e., the transient memory is O(F + C), instead of the O((F + C)*k*k) of 
+        the unfolded embedding and input of compute_weights() and apply_weights();
+        backward recomputes the weights per offset, and saves only the inputs, 
+        the output and the normalizer;
+    """
+    @staticmethod
+    def forward(ctx, embed, x, sg_weights, k, d, sigma_v, reg_constant):
+        N, C, H, W = x.size()
+        # the normalizer and the sums in the dtype of the weights, i.e., in fp32 for
+        # a 16-bit x under autocast (see compute_weights());
+        acc_dtype = torch.promote_types(x.dtype, embed.dtype)
+        out = torch.zeros_like(x, dtype = acc_dtype)
+        wgt_sum = x.new_full((N, 1, H, W), reg_constant, dtype = acc_dtype)
+        for dy, dx, _, w in _bilateral_taps(embed, sg_weights, k, d, sigma_v):
+            wgt_sum += w
+            (oy, iy), (ox, ix) = shift_range(dy, H), shift_range(dx, W)
+            out[:, :, oy, ox].addcmul_(x[:, :, iy, ix], w[:, :, oy, ox])
+        out /= wgt_sum
+        ctx.save_for_backward(embed, x, out, wgt_sum)
+        ctx.params = (sg_weights, k, d, sigma_v)
+        ctx.mark_non_differentiable(wgt_sum)
+        return out.to(x.dtype), wgt_sum
+
+    @staticmethod
+    def backward(ctx, grad, _):
+        embed, x, out, wgt_sum = ctx.saved_tensors
+        sg_weights, k, d, sigma_v = ctx.params
+        N, C, H, W = x.size()
+        grad = grad / wgt_sum
+        # out = sum(w*x_s) / sum(w), so d(loss)/dw = sum_c(grad*(x_s - out)) / sum(w);
+        grad_w_base = -torch.sum(grad*out, dim = 1, keepdim = True)
+        grad_x = torch.zeros_like(x, dtype = grad.dtype) if ctx.needs_input_grad[1] else None
+        grad_embed = None
+        if ctx.needs_input_grad[0]:
+            p = d*(k - 1) // 2
+            grad_embed_pad = embed.new_zeros((N, embed.size(1), H + 2*p, W + 2*p))
+            grad_embed = grad_embed_pad[:, :, p:p + H, p:p + W]
+        for i, (dy, dx, diff, w) in enumerate(_bilateral_taps(embed, sg_weights, k, d, sigma_v)):
+            (oy, iy), (ox, ix) = shift_range(dy, H), shift_range(dx, W)
+            if grad_x is not None:
+                grad_x[:, :, iy, ix].addcmul_(grad[:, :, oy, ox], w[:, :, oy, ox])
+            if grad_embed is not None:
+                grad_w = grad_w_base.clone()
+                grad_w[:, :, oy, ox] += torch.sum(grad[:, :, oy, ox]*x[:, :, iy, ix], dim = 1, keepdim = True)
+                # dw/d(embed) = w*diff/sigma_v^2, and dw/d(shifted embed) = - w*diff/sigma_v^2;
+                diff *= grad_w.mul_(w).div_(sigma_v**2)
+                grad_embed += diff
+                a, b = i // k * d, i % k * d
+                grad_embed_pad[:, :, a:a + H, b:b + W] -= diff
+        if grad_embed is not None:
+            grad_embed = grad_embed.contiguous()
+        return grad_embed, grad_x, None, None, None, None, None
+
+
+def bilateral_filter_shift(embed_in, x_in, sg_weights, k, dilation, sigma_v, reg_constant = 1e-20):
+    """
+    the embedding bilateral filter, by shift-and-accumulate, see BilateralShiftFunction;
+
+    Args:
+        embed_in (Tensor), embeding for generatin mask, in size [N,F,H,W]
+        x_in     (Tensor), input array, in size [N,C,H,W]
+        sg_weights (list), the k*k values of the space gaussian filter, row-major;
+        k, dilation (int), window size and dilation;
+        sigma_v (float), value gaussian std. dev.;
+
+    Returns:
+        result (Tensor), bilateral-filtered x_in, in size [N,C,H,W]
+        wgt_sum (Tensor), the normalizer (sum of the weights + reg_constant), in size [N,1,H,W]
+    """
+    return BilateralShiftFunction.apply(embed_in, x_in, list(sg_weights), k, dilation, sigma_v, reg_constant)
+
+
 """ module : bilateral filter leveraging embedding feature """
 class bilateralFilter(nn.Module):
-    def __init__(self,  sigma_s = 0.7, sigma_v = 0.1, isCUDA = True, dilation = 1):
+    def __init__(self,  sigma_s = 0.7, sigma_v = 0.1, isCUDA = True, dilation = 1, backend = 'im2col',
+            lattice_guide_dims = 4):
         super(bilateralFilter, self).__init__()
         """
         Member Args:
+            self.backend      (str)    'im2col': unfolds the embedding and the input (k*k times their memory);
+                                       'shift' : shift-and-accumulate over the k*k offsets, see BilateralShiftFunction;
+                                       'lattice': the permutohedral lattice, whose cost does not depend on sigma_s,
+                                                  with no truncation to the k x k window, see permutohedral.py;
+            self.lattice_guide_dims (int) for 'lattice', the embedding is reduced to these many dimensions by PCA,
+                                       0 to keep all of them;
             self.sg_filter  (Tensor)   spatial gaussia filter, given sigma_s as spatial gaussian std. dev.
             self.win_width    (float)  spatical gaussin filter half window size, determined by space filter std dev sigma_s;
             self.sigma_s      (float)  space gaussian std. dev.
@@ -110,32 +215,49 @@ class bilateralFilter(nn.Module):
         self.im2col = im2col_layer(k = self.k, d = dilation, is5D = True)
         self.reg_constant=1e-20 # regularization constant
 
+        assert backend in ['im2col', 'shift', 'lattice'], "backend should be 'im2col', 'shift' or 'lattice'"
+        self.backend = backend
+        self.sg_weights = self.sg_filter.view(-1).tolist()
+        self.lattice_guide_dims = lattice_guide_dims
+
+    @property
+    def workspace_factor(self):
+        """ transient memory of apply_weights(), in multiples of its input, for CostVolumeFilter """
+        if self.backend == 'im2col':
+            return self.k*self.k
+        if self.backend == 'lattice':
+            # up to d+1 lattice vertices per pixel, for the d = 2 + guide_dims features, and a blur copy;
+            # (all the 64 channels of embed_net if not reduced);
+            return 2*((self.lattice_guide_dims if self.lattice_guide_dims > 0 else 64) + 3)
+        return 1
 
-    def forward(self, embed_in, x_in):
+    @keep_fp32 # the embedding exponentials and wgt_sum, under autocast;
+    def compute_weights(self, embed_in):
         """
-        using im2col to change the filtering to element-wise matrix multiplication
-        Performs standard bilateral filtering of an input image.
-        Padding is taken care by the inside function im2col_pytorch()!!!
+        the normalized bilateral weights from the embedding, 
+        i.e., range gaussian x space gaussian / their sum (eq (4) in W. Harley's paper);
+        computed once, then applied to any number of cost volume slices by apply_weights();
 
         Args:
             embed_in (Tensor), embeding for generatin mask, in size [N,F,H,W]
-            x_in     (Tensor), input array, in size [N,C,H,W], 
-                            apply the bilateral filter to it;
 
         Returns:
-            result (Tensor) bilateral-filtered x_in, in size [N,C,H,W]
+            weights (Tensor) in size [N,1,k*k,H,W];
+                    for the 'shift' backend, which keeps no weights, the embedding itself;
+                    for the 'lattice' backend, the PermutohedralLattice of the embedding;
         """
-    
+        if self.backend == 'shift':
+            return embed_in
+        if self.backend == 'lattice':
+            return get_bilateral_lattice(embed_in, self.sigma_s, self.sigma_v, self.d, self.lattice_guide_dims)
         N,F,H,W = embed_in.shape[:]
-        #print ('embed_in shape = ', embed_in.shape)
-        
         #NOTE: newly added for multiple GPUs
         if self.isCUDA:
             # cuda() and to('cuda') are going to do the same thing, but the later is more flexible;
             # With the explicit call, you can also use multiple cuda devices – e.g. to('cuda:0');
             # The simpler cuda() call will just use the DEFAULT cuda device.
             #self.sg_filter = self.sg_filter.to("cuda:0")
-            self.sg_filter = self.sg_filter.to(x_in.device)
+            self.sg_filter = self.sg_filter.to(embed_in.device)
         
         """ apply im2col for embedding masking """
         # The PAC paper said that 'Use PyINN if possible (about 15% faster)',
@@ -143,59 +265,94 @@ class bilateralFilter(nn.Module):
         if has_pyinn and self.d == 1:
             embed_im2col = P.im2col(embed_in, (self.k, self.k), 
                     stride = 1, padding = self.pad).view(N,F,-1,H,W)
-            #print (embed_im2col.shape)
         else:
             embed_im2col = self.im2col(embed_in) # in shape [N, F, k*k, H, W]
 
-
-        #print ("sigma_v ", sigma_v)
-        #embed_tile = embed_in.view(N,F,1,H,W)
         # broadcasting
         embed_im2col -= embed_in.view(N,F,1,H,W)
-        #rg_filter = torch.exp(-0.5*torch.sum((embed_im2col - embed_tile)**2, dim = 1, keepdim= True) / (self.sigma_v**2)) # [N,1,k*k,H,W]
         rg_filter = torch.exp_(-0.5*torch.sum(embed_im2col.pow_(2), dim = 1, keepdim= True) / (self.sigma_v**2)) # [N,1,k*k,H,W]
-        #rg_filter = torch.exp_(torch.sum(embed_im2col.pow_(2), dim = 1, keepdim= True).mul_(-0.5/(self.sigma_v**2))) # [N,1,k*k,H,W]
-        
-        if 0: # show
-            print ('rg_filter shape = ', rg_filter.shape)
-            for i in range(0, self.k*self.k):
-                shft_x = i % (2*self.win_width+1) - self.win_width
-                shft_y = i / (2*self.win_width+1) - self.win_width
-                print("show shift [%d][%d] " %( shft_y, shft_x))
-                pfm.show(rg_filter[0,0,i,:,:].cpu().numpy())
-        #print ('rg_filter :', rg_filter[0,0,:,20,20])
-        # in shape (N, 1, k*k, H, W)
-        #print ("[**] ", rg_filter.shape, self.sg_filter.shape)
-        #Updated on 2019/11/08: change it to in-place operation
-        #wgt_filter = rg_filter * self.sg_filter # broadcasting
         
         #NOTE:updated due to the gradient error!!!
         #change the inplace *= to out-of-place one, due to the error: gradient computation has been modified by an inplace operation
-        #rg_filter *= self.sg_filter # broadcasting
         rg_filter = rg_filter*self.sg_filter # broadcasting
         
-        
-
         """
         implement eq (4) in W. Harley' paper 
         "Segmentation-Aware Convolutional Networks Using Local Attention Masks (ICCV'17)"
         """
-        wgt_sum = torch.ones([N, 1, H, W])*self.reg_constant
-        if self.isCUDA:
-            wgt_sum = wgt_sum.cuda()
-        """ broadcasting """
+        wgt_sum = torch.sum(rg_filter, axis=2, keepdim=True) + self.reg_constant # N x 1 x 1 x H x W
+        return rg_filter / wgt_sum
+    
+    def apply_weights(self, weights, x_in):
+        """
+        Args:
+            weights (Tensor), from compute_weights(), in size [N,1,k*k,H,W]
+            x_in    (Tensor), input array, in size [N,C,H,W], e.g., one slice 
+                              or all the D slices (folded into C) of the cost volume;
+
+        Returns:
+            result (Tensor) bilateral-filtered x_in, in size [N,C,H,W]
+        
+        Under autocast, x_in and its unfolded copy stay in 16 bits, only the weights
+        (and the normalizers of the shift and lattice backends) are in fp32;
+        """
+        if self.backend == 'shift':
+            return bilateral_filter_shift(weights, x_in, self.sg_weights, self.k, self.d,
+                self.sigma_v, self.reg_constant)[0]
+        if self.backend == 'lattice':
+            # (the normalizer is splatted and blurred with x_in;)
+            with float32_region():
+                return weights.normalized_filter(x_in.float(), self.reg_constant).to(x_in.dtype)
         #unrolled for element-wise multiplication:
-        N, C, H, W = x_in.size()[:]
-        #print ('[???] x_in shape = ', x_in.shape)
         x_in_im2col = self.im2col(x_in) # in shape [N, C, k*k, H, W]
-        
         #(N, C, k*k, H, W ) * (N, 1, k*k, H, W) => (N, C, k*k, H, W)
-        #print ("[**] x shape, wgt_filter shape :", x_in_im2col.shape, rg_filter.shape)
-        #result = x_in_im2col * wgt_filter 
-        wgt_sum += torch.sum(rg_filter, axis=2) # N x 1 x H x W 
-        x_in_im2col *= rg_filter # N x C x k*k x H x W
-        result = torch.sum(x_in_im2col, axis = 2) # N x C x H x W
-        # normalize the result and return
-        # N x C x H x W 
-        result /= wgt_sum
-        return result
+        x_in_im2col *= weights.to(x_in.dtype) # N x C x k*k x H x W
+        return torch.sum(x_in_im2col, axis = 2) # N x C x H x W
+
+    def forward(self, embed_in, x_in, weights = None):
+        """
+        using im2col to change the filtering to element-wise matrix multiplication
+        Performs standard bilateral filtering of an input image.
+        Padding is taken care by the inside function im2col_pytorch()!!!
+
+        Args:
+            embed_in (Tensor), embeding for generatin mask, in size [N,F,H,W]
+            x_in     (Tensor), input array, in size [N,C,H,W], 
+                            apply the bilateral filter to it;
+            weights  (Tensor), optional, from compute_weights(embed_in), to skip recomputing them;
+
+        Returns:
+            result (Tensor) bilateral-filtered x_in, in size [N,C,H,W]
+        """
+        if weights is None:
+            weights = self.compute_weights(embed_in)
+        return self.apply_weights(weights, x_in)
+
+
+def benchmark_bilateral_backends(N = 1, F = 64, C = 32, D = 24, H = 48, W = 96, 
+        sigma_s = 0.7, dilation = 2, repeat = 3, device = 'cpu'):
+    """ 'im2col' vs. 'shift' backend, on all the D slices of a cost volume folded into the channels:
+        time of forward + backward, and the peak memory (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from .cost_volume_filter import time_forward_backward
+    embed = torch.randn(N, F, H, W, device = device, requires_grad = True)
+    x = torch.randn(N, C*D, H, W, device = device, requires_grad = True)
+    ref = None
+    for backend in ['im2col', 'shift']:
+        bifilter = bilateralFilter(sigma_s, 0.1, isCUDA = device != 'cpu', dilation = dilation, backend = backend)
+        func = lambda: bifilter(embed, x)
+        out = func()
+        if ref is None:
+            ref = out.detach()
+        else:
+            assert torch.allclose(out, ref, atol = 1e-5)
+        del out
+        ms, mem = time_forward_backward(func, repeat, device)
+        print ("[{}] k = {}, F = {}, C = {}: {:.2f} ms (forward + backward), {}".format(
+            backend, bifilter.k, F, C*D, ms, mem))
+
+
+if __name__ == "__main__":
+    benchmark_bilateral_backends(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_bilateral_backends(device = 'cuda')
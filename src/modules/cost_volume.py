@@ -10,6 +10,7 @@
 import torch
 from torch.autograd import Variable
 import torch.nn as nn
+import torch.nn.functional as F
 
 #-------------------
 #NOTE: this function is adapted from PSMNet code ??? TOO SLOW???;
@@ -75,3 +76,158 @@ def cost_volume_faster(x, y, d):
     #assert(cv.is_contiguous() == True)
     #print ("[???] cv shape = ", cv.shape)
     return cv
+
+
+#-------------------
+# loop-free cost volume, added by CCJ;
+#-------------------
+_cost_volume_mask_cache = {}
+
+def get_cost_volume_mask(d, W, device):
+    """ bool mask in [D, 1, W], True where w < d, i.e., the zero padding of the shifted feature """
+    key = (d, W, str(device))
+    if key not in _cost_volume_mask_cache:
+        j = torch.arange(d, device=device).view(d, 1, 1)
+        w = torch.arange(W, device=device).view(1, 1, W)
+        _cost_volume_mask_cache[key] = w < j
+    return _cost_volume_mask_cache[key]
+
+
+def shifted_views(v, d):
+    """ strided views of v (the y half of a contiguous cost volume, in [N,C,D,H,W]), 
+        s.t. view[..., j, h, t] = v[..., j, h, t + j]: along D, the stride is H*W + 1;
+        the elements with t + j >= W fall into the next row (or the next slice) at w < j,
+        i.e., in the zero padding, except for the last row of the last slice, 
+        so the views are split as: 
+            rows [0, H-1) of all the slices, in [N,C,D,H-1,W];
+            row H-1 of slices [0, D-1), in [N,C,D-1,W];
+            row H-1 of slice D-1, in [N,C,W-D+1];
+    """
+    N, C, D, H, W = v.size()
+    sN, sC = v.stride(0), v.stride(1)
+    offset = v.storage_offset()
+    HW = H*W
+    return (v.as_strided((N, C, D, H-1, W), (sN, sC, HW+1, W, 1), offset),
+            v.as_strided((N, C, D-1, W), (sN, sC, HW+1, 1), offset + (H-1)*W),
+            v.as_strided((N, C, W-D+1), (sN, sC, 1), offset + (D-1)*(HW+1) + (H-1)*W))
+
+
+class CostVolumeFunction(torch.autograd.Function):
+    """ concatenation cost volume without any loop over D:
+        left half : a broadcast copy of x;
+        right half: one strided copy of y into the shifted views of the output (see shifted_views()),
+                    then the zero padding (w < j) is filled;
+        i.e., without the D intermediate tensors of cost_volume_faster() 
+        or the D slice assignments of get_costVolume();
+        backward sums the gradient along the same views, and saves nothing;
+    """
+    @staticmethod
+    def forward(ctx, x, y, d, mask_left = False, out = None):
+        N, C, H, W = x.size()
+        assert d <= W, "disparity range {} > feature width {}".format(d, W)
+        if out is None:
+            out = x.new_empty((N, 2*C, d, H, W))
+        else:
+            assert out.size() == (N, 2*C, d, H, W) and out.is_contiguous()
+            ctx.mark_dirty(out)
+        mask = get_cost_volume_mask(d, W, x.device)
+        out_x, out_y = out[:, :C], out[:, C:]
+        
+        out_x.copy_(x.unsqueeze(2).expand(N, C, d, H, W))
+        if mask_left:
+            out_x.masked_fill_(mask, 0)
+        
+        y_rows, y_last, y_last_slice = shifted_views(out_y, d)
+        y_rows.copy_(y[:, :, None, :H-1].expand(N, C, d, H-1, W))
+        y_last.copy_(y[:, :, None, H-1].expand(N, C, d-1, W))
+        y_last_slice.copy_(y[:, :, H-1, :W-d+1])
+        out_y.masked_fill_(mask, 0)
+        
+        ctx.d = d
+        ctx.mask_left = mask_left
+        ctx.size = (N, C, H, W)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad):
+        d, mask_left = ctx.d, ctx.mask_left
+        N, C, H, W = ctx.size
+        mask = get_cost_volume_mask(d, W, grad.device)
+        grad_x = grad_y = None
+        if ctx.needs_input_grad[0]:
+            grad_x = grad[:, :C]
+            if mask_left:
+                grad_x = grad_x.masked_fill(mask, 0)
+            grad_x = grad_x.sum(2)
+        if ctx.needs_input_grad[1]:
+            # contiguous, and zero in the padding, which the shifted views run into;
+            g = grad[:, C:].masked_fill(mask, 0)
+            g_rows, g_last, g_last_slice = shifted_views(g, d)
+            grad_y = grad.new_empty((N, C, H, W))
+            grad_y[:, :, :H-1] = g_rows.sum(2)
+            grad_y[:, :, H-1] = g_last.sum(2)
+            grad_y[:, :, H-1, :W-d+1] += g_last_slice
+        return grad_x, grad_y, None, None, None
+
+
+def build_cost_volume(x, y, d, mask_left = False, out = None):
+    """
+    args:
+        x : left feature,  in size [N,C,H,W]
+        y : right feature, in size [N,C,H,W]
+        d : disparity range
+        mask_left: if True, zeros the left feature where w < d, as get_costVolume() does;
+                   otherwise, the same as cost_volume_faster();
+        out: (optional) preallocated contiguous buffer in size [N,2C,D,H,W], filled in place;
+    return:
+        cost: cost volume in size [N,2C,D,H,W]
+    """
+    return CostVolumeFunction.apply(x, y, d, mask_left, out)
+
+
+def benchmark_cost_volume(N = 2, C = 32, H = 64, W = 128, d = 48, repeat = 10, device = 'cpu'):
+    """ compare build_cost_volume() against cost_volume_faster() and get_costVolume() """
+    import time
+    x = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    y = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    out = x.new_empty((N, 2*C, d, H, W))
+    def get_costVolume_device(x, y, d):
+        # get_costVolume() hard-codes .cuda();
+        cost = x.new_zeros((x.size(0), x.size(1)*2, d, x.size(2), x.size(3)))
+        for i in range(0, d):
+            if i > 0:
+                cost[:, :C, i, :, i:] = x[:, :, :, i:]
+                cost[:, C:, i, :, i:] = y[:, :, :, :-i]
+            else:
+                cost[:, :C, i, :, :] = x
+                cost[:, C:, i, :, :] = y
+        return cost
+    funcs = [
+        ('cost_volume_faster', lambda: cost_volume_faster(x, y, d)),
+        ('build_cost_volume', lambda: build_cost_volume(x, y, d)),
+        ('get_costVolume', lambda: get_costVolume_device(x, y, d)),
+        ('build_cost_volume(mask_left)', lambda: build_cost_volume(x, y, d, mask_left = True)),
+        ('build_cost_volume(out)', lambda: build_cost_volume(x.detach(), y.detach(), d, out = out)),
+        ]
+    assert torch.equal(funcs[0][1](), funcs[1][1]())
+    assert torch.equal(funcs[2][1](), funcs[3][1]())
+    def sync():
+        if device != 'cpu':
+            torch.cuda.synchronize()
+    for name, func in funcs:
+        func() # warm up;
+        sync()
+        since = time.time()
+        for _ in range(repeat):
+            cv = func()
+            if cv.requires_grad:
+                cv.sum().backward()
+        sync()
+        print ("{:>30s}: {:.2f} ms ({})".format(name, (time.time() - since) / repeat * 1000,
+            'forward + backward' if cv.requires_grad else 'forward'))
+
+
+if __name__ == "__main__":
+    benchmark_cost_volume(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_cost_volume(device = 'cuda')
@@ -0,0 +1,230 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: cost_volume_filter.py
+# @brief: filter the D slices of a cost volume in batches, instead of one call per slice;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+All the DAF models filter the cost volume [N,C,D,H,W] slice by slice:
+    for d in range(D): cost[:,:,d] = filter(guide, cost[:,:,d].contiguous())
+i.e., D calls, D contiguous copies and D writes back into the volume.
+CostVolumeFilter runs several slices per call, in one of two layouts:
+    - 'channel': the slices are folded into the channels, [N, C*c, H, W],
+      for the filters applied to each channel independently with one guide
+      per sample (the embedding bilateral filter, the DFN dynamic filter);
+      if all the D slices are in one call, this is a view of the volume, no copy;
+    - 'batch': the slices are folded into the batch, [N*c, C, H, W], and the
+      guides are tiled c times, for the filters mixing the channels (PAC);
+The number of slices per call is either given, or derived from a memory budget;
+by default (neither is set), one slice per call, i.e., the peak memory of the
+per-slice loop; all the D slices at once is an opt-in (slices_per_call = -1),
+its transient memory is D times larger, e.g., about 18 GB for the im2col of
+ASN-Embed-PSM (k = 7) on a [1, 64, 48, 96, 312] volume, instead of 0.37 GB.
+
+Usage:
+    self.cost_filter = CostVolumeFilter(fold = 'channel', workspace_factor = k*k)
+    weights = self.bifilter.compute_weights(embed)
+    cost = self.cost_filter(cost, lambda x, w: self.bifilter.apply_weights(w, x), weights)
+"""
+
+import time
+import torch
+
+
+class CostVolumeFilter(object):
+    """ no parameters and no state, so it can be shared by the replicas of DataParallel """
+    def __init__(self, fold = 'channel', slices_per_call = 0, memory_budget_mb = 0,
+            workspace_factor = 1.0):
+        """
+        args:
+            fold: 'channel' or 'batch', see above;
+            slices_per_call: number of slices per call, -1 for all the D slices at once,
+                             0 to derive it from memory_budget_mb;
+            memory_budget_mb: budget of the transient memory of each call; if 0 (and
+                              slices_per_call is 0), one slice per call, as the per-slice loop;
+            workspace_factor: transient memory of the filter, in multiples of its input,
+                              e.g., k*k for the im2col based filters;
+        """
+        assert fold in ['channel', 'batch'], "fold should be 'channel' or 'batch'"
+        self.fold = fold
+        self.slices_per_call = slices_per_call
+        self.memory_budget_mb = memory_budget_mb
+        self.workspace_factor = workspace_factor
+
+    def get_slices_per_call(self, cost, guides = ()):
+        D = cost.size(2)
+        if self.slices_per_call > 0:
+            return min(self.slices_per_call, D)
+        if self.slices_per_call < 0:
+            return D
+        if self.memory_budget_mb <= 0:
+            # no budget given: the peak memory of the per-slice loop;
+            return 1
+        N, C, _, H, W = cost.size()
+        # input, output and workspace of one slice, plus its tiled guides;
+        slice_bytes = N*C*H*W*cost.element_size()*(2.0 + self.workspace_factor)
+        if self.fold == 'batch':
+            slice_bytes += sum(g.numel()*g.element_size() for g in guides)
+        return int(max(1, min(D, self.memory_budget_mb*1024.0**2 // slice_bytes)))
+
+    def __call__(self, cost, filter_fn, *guides):
+        """
+        args:
+            cost: cost volume, in [N,C,D,H,W]
+            filter_fn: filter_fn(x, *guides), x in [N,C',H,W], returns [N,C',H,W];
+            guides: the guide tensors (e.g., embedding, dynamic filters), in [N,*,H,W];
+        return:
+            the filtered cost volume, in [N,C,D,H,W]
+        """
+        N, C, D, H, W = cost.size()
+        c = self.get_slices_per_call(cost, guides)
+        out = []
+        for d0 in range(0, D, c):
+            d1 = min(d0 + c, D)
+            cost_slices = cost[:, :, d0:d1]
+            if self.fold == 'channel':
+                y = filter_fn(cost_slices.reshape(N, C*(d1 - d0), H, W), *guides)
+                out.append(y.view(N, -1, d1 - d0, H, W))
+            else:
+                x = cost_slices.transpose(1, 2).reshape(N*(d1 - d0), C, H, W)
+                tiled = [g.unsqueeze(1).expand(N, d1 - d0, *g.size()[1:]).reshape(
+                    N*(d1 - d0), *g.size()[1:]) for g in guides]
+                y = filter_fn(x, *tiled)
+                out.append(y.view(N, d1 - d0, -1, H, W).transpose(1, 2))
+        out = out[0] if len(out) == 1 else torch.cat(out, dim = 2)
+
+        if cost.requires_grad and not torch.is_grad_enabled():
+            # as the per-slice assignments under torch.set_grad_enabled(False) did:
+            # the filtered values, with the gradient of the unfiltered volume;
+            return cost.copy_(out)
+        return out.contiguous()
+
+
+def filter_cost_volume_per_slice(cost, filter_fn, *guides):
+    """ the per-slice loop of the DAF models, the reference of CostVolumeFilter """
+    cost = cost.clone()
+    for d in range(cost.size(2)):
+        cost[:, :, d] = filter_fn(cost[:, :, d].contiguous(), *guides)
+    return cost
+
+
+def time_forward_backward(func, repeat = 3, device = 'cpu'):
+    """ the timing loop of the benchmarks: func() runs a forward, its output is summed for backward;
+    return:
+        the time of forward + backward in ms, averaged over repeat;
+        the memory, i.e., the peak (CUDA), or the bytes of the tensors saved by autograd 
+        for one forward (CPU), counted by storage, since the saved views share their base;
+    """
+    saved = {}
+    def pack(t):
+        saved[t.untyped_storage().data_ptr()] = t.untyped_storage().nbytes()
+        return t
+    with torch.autograd.graph.saved_tensors_hooks(pack, lambda t: t):
+        out = func()
+    del out
+    if device != 'cpu':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+    since = time.time()
+    for _ in range(repeat):
+        func().sum().backward()
+    if device != 'cpu':
+        torch.cuda.synchronize()
+        mem = "peak {:.1f} MB".format(torch.cuda.max_memory_allocated() / 1024.0**2)
+    else:
+        mem = "saved by autograd {:.1f} MB".format(sum(saved.values()) / 1024.0**2)
+    return (time.time() - since) / repeat * 1000, mem
+
+
+def benchmark_cost_volume_filter(N = 1, C = 32, D = 24, H = 48, W = 96,
+        budgets_mb = (0, 256, 64), repeat = 3, device = 'cpu'):
+    """ per-slice loop vs. CostVolumeFilter, with the embedding bilateral filter and the DFN layer:
+        time of forward + backward, and the peak memory (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from .bilateral import bilateralFilter
+    from .dfn import DynamicFilterLayer
+    bifilter = bilateralFilter(sigma_s = 0.7, sigma_v = 0.1, isCUDA = device != 'cpu', dilation = 2)
+    k = bifilter.k
+    dfn_layer = DynamicFilterLayer(kernel_size = 9, dilation = 1)
+    embed = torch.randn(N, 64, H, W, device = device)
+    dfn_filter = torch.randn(N, 81, H, W, device = device)
+    dfn_bias = torch.randn(N, 1, H, W, device = device)
+    cost = torch.randn(N, C, D, H, W, device = device, requires_grad = True)
+    filters = [
+        ('bilateral', lambda x, g: bifilter(g, x), (embed,), k*k),
+        ('dfn', lambda x, f, b: dfn_layer(x, f, b), (dfn_filter, dfn_bias), 81),
+        ]
+    for filter_name, filter_fn, guides, workspace_factor in filters:
+        runs = [('per-slice loop', lambda: filter_cost_volume_per_slice(cost, filter_fn, *guides))]
+        # the budgets, then all the D slices at once (slices_per_call = -1);
+        for slices, budget in [(0, b) for b in budgets_mb] + [(-1, 0)]:
+            cost_filter = CostVolumeFilter('channel', slices, budget, workspace_factor)
+            runs.append(('{}, {} slices/call'.format('budget {} MB'.format(budget) if slices == 0 else 'all',
+                cost_filter.get_slices_per_call(cost)), (lambda f: lambda: f(cost, filter_fn, *guides))(cost_filter)))
+        ref = runs[0][1]().detach()
+        for name, func in runs:
+            assert torch.allclose(func().detach(), ref, atol = 1e-5)
+            ms, mem = time_forward_backward(func, repeat, device)
+            print ("[{}] {:>32s}: {:.2f} ms (forward + backward), {}".format(filter_name, name, ms, mem))
+
+
+
+
+def benchmark_pac_kernel_reuse(model_name = 'ASN-PAC-PSM', N = 1, H = 256, W = 512, maxdisp = 192,
+        repeat = 3, device = 'cuda'):
+    """ the cost volume filtering of ASN-PAC-PSM or ASN-PAC-GCNet, with the model's PacConv2d:
+        - per slice, the kernel recomputed from the guide for each slice (the previous behavior);
+        - per slice, the kernel reused via PacConv2d.compute_kernel_cached();
+        - the kernel computed once, and the slices batched by CostVolumeFilter;
+    """
+    if model_name == 'ASN-PAC-PSM':
+        from .attenStereoNet_pac_psm import AttenStereoNet
+        # cost volume [N, 64, D/4, H/4, W/4]
+        model = AttenStereoNet(maxdisp = maxdisp, isPAC = True, isEmbed = True)
+        size = (N, 64, maxdisp//4, H//4, W//4)
+    elif model_name == 'ASN-PAC-GCNet':
+        from .attenStereoNet_pac_gcnet import AttenStereoNet
+        # cost volume [N, 64, D/4, H/4, W/4], with is_quarter_size_cost_volume_gcnet;
+        model = AttenStereoNet(maxdisp = maxdisp, isPAC = True, isEmbed = True,
+                is_quarter_size_cost_volume_gcnet = True)
+        size = (N, 64, maxdisp//4, H//4, W//4)
+    else:
+        raise Exception("No PAC model {}".format(model_name))
+    pacconv = model.pacconv.to(device)
+    cost_filter = model.cost_filter
+    # all the D slices in one call (the default is one slice per call);
+    cost_filter.slices_per_call = -1
+    cost = torch.randn(*size, device = device, requires_grad = True)
+    guide = torch.randn(N, 64, size[3], size[4], device = device, requires_grad = True)
+    def filter_fn(x, k):
+        return pacconv(input_2d = x, input_for_kernel = None, kernel = k)
+    runs = [
+        ('per slice, kernel per slice', lambda: filter_cost_volume_per_slice(cost,
+            lambda x, g: pacconv(input_2d = x, input_for_kernel = None, kernel = pacconv.compute_kernel(g)[0]), guide)),
+        ('per slice, cached kernel', lambda: filter_cost_volume_per_slice(cost,
+            lambda x, g: pacconv(input_2d = x, input_for_kernel = None, kernel = pacconv.compute_kernel_cached(g)[0]), guide)),
+        ('kernel once, batched slices', lambda: cost_filter(cost, filter_fn, pacconv.compute_kernel(guide)[0])),
+        ]
+    def sync():
+        if device != 'cpu':
+            torch.cuda.synchronize()
+    for name, func in runs:
+        func().sum().backward()
+        sync()
+        since = time.time()
+        for _ in range(repeat):
+            func().sum().backward()
+        sync()
+        print ("[{}] {:>30s}: {:.2f} ms (forward + backward), kernel cached after backward: {}".format(
+            model_name, name, (time.time() - since) / repeat * 1000, pacconv._kernel_cache is not None))
+        pacconv.clear_kernel_cache()
+
+
+if __name__ == "__main__":
+    benchmark_cost_volume_filter(device = 'cpu')
+    benchmark_pac_kernel_reuse('ASN-PAC-PSM', H = 128, W = 256, maxdisp = 96, repeat = 1, device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_cost_volume_filter(device = 'cuda')
+        benchmark_pac_kernel_reuse('ASN-PAC-PSM')
+        benchmark_pac_kernel_reuse('ASN-PAC-GCNet')
@@ -15,7 +15,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 import numpy as np
-from .im2col import im2col_layer
+from .im2col import im2col_layer, shift_range
 import math
 from src.net_init import net_init_v0
 from src.net_init import net_init_SyncBN
@@ -314,20 +314,81 @@ class DynamicFilterLayerOneChannel(nn.Module):
         return output
 
 
+class DynamicFilterShiftFunction(torch.autograd.Function):
+    """ the dynamic filter by shift-and-accumulate:
+        for each of the k*k offsets (in the im2col order), the shifted input is multiplied
+        by the filter tap [N,1,H,W] and accumulated into the output [N,C,H,W];
+        i.e., the transient memory is O(C), instead of the O(C*k*k) of the im2col input;
+        the same filters are applied to all the C channels, e.g., to all the D slices of
+        a cost volume folded into the channels;
+        backward recomputes the shifts, and saves only the input and the filters;
+    """
+    @staticmethod
+    def forward(ctx, x, filters, filters_biases, k, d):
+        N, C, H, W = x.size()
+        p = d*(k - 1) // 2
+        out = filters_biases.expand(N, C, H, W).contiguous()
+        for i in range(k*k):
+            # the zero padding of nn.Unfold: the taps out of the image add nothing;
+            (oy, iy), (ox, ix) = shift_range(i // k * d - p, H), shift_range(i % k * d - p, W)
+            out[:, :, oy, ox].addcmul_(x[:, :, iy, ix], filters[:, i:i + 1, oy, ox])
+        ctx.save_for_backward(x, filters)
+        ctx.params = (k, d)
+        return out
+
+    @staticmethod
+    def backward(ctx, grad):
+        x, filters = ctx.saved_tensors
+        k, d = ctx.params
+        N, C, H, W = x.size()
+        p = d*(k - 1) // 2
+        grad_x = torch.zeros_like(x) if ctx.needs_input_grad[0] else None
+        grad_filters = torch.zeros_like(filters) if ctx.needs_input_grad[1] else None
+        grad_biases = torch.sum(grad, dim = 1, keepdim = True) if ctx.needs_input_grad[2] else None
+        for i in range(k*k):
+            (oy, iy), (ox, ix) = shift_range(i // k * d - p, H), shift_range(i % k * d - p, W)
+            if grad_x is not None:
+                grad_x[:, :, iy, ix].addcmul_(grad[:, :, oy, ox], filters[:, i:i + 1, oy, ox])
+            if grad_filters is not None:
+                grad_filters[:, i, oy, ox] = torch.sum(grad[:, :, oy, ox]*x[:, :, iy, ix], dim = 1)
+        return grad_x, grad_filters, grad_biases, None, None
+
+
 class DynamicFilterLayer(nn.Module):
-    def __init__(self, kernel_size = 9, dilation = 1):
+    def __init__(self, kernel_size = 9, dilation = 1, backend = 'im2col'):
+        """
+        args:
+            backend: 'im2col': unfolds the input to [N, C, k*k, H, W], i.e., k*k times its memory;
+                     'shift' : shift-and-accumulate over the k*k offsets, see DynamicFilterShiftFunction;
+        """
         super(DynamicFilterLayer, self).__init__()
         self.kernel_size = kernel_size 
+        self.dilation = dilation
         self.im2col = im2col_layer(k = self.kernel_size, d = dilation, is5D = True)
+        assert backend in ['im2col', 'shift'], "backend should be 'im2col' or 'shift'"
+        self.backend = backend
+
+    @property
+    def workspace_factor(self):
+        """ transient memory of forward(), in multiples of its input, for CostVolumeFilter """
+        if self.backend == 'im2col':
+            return self.kernel_size**2
+        return 1
 
     #####################################
     def forward(self, x_in, filters, filters_biases):
         """ 
          args:
-          x_in : input tensor, could be slice or slices of cost volume, in shape [N, C, H, W]
+          x_in : input tensor, could be slice or slices of cost volume, in shape [N, C, H, W],
+                 or the whole cost volume in [N, C, D, H, W], filtered by the same filters for all the D slices;
           filters: dynamic filters, in shape [N, k*k, H, W]
           filters_biases: used as additive biases after the filtering, in shape [N, 1, H, W];
         """
+        if x_in.dim() == 5:
+            N, C, D, H, W = x_in.size()
+            return self.forward(x_in.reshape(N, C*D, H, W), filters, filters_biases).view(N, C, D, H, W)
+        if self.backend == 'shift':
+            return DynamicFilterShiftFunction.apply(x_in, filters, filters_biases, self.kernel_size, self.dilation)
         #k = self.kernel_size
         N, F, H, W = filters.size()[:]
         #print ("[???] filters size = ", filters.size())
@@ -335,4 +396,60 @@ class DynamicFilterLayer(nn.Module):
         x_in_im2col = self.im2col(x_in) # in shape [N, C, k*k, H, W]
         #NOTE:broadcasting: [N, C, k*k, H, W] * [N,1,k*k, H, W] ==> [N, C, k*k, H, W]
         output = torch.sum(x_in_im2col * filters, axis = 2, keepdim=False) + filters_biases
-        return output
\ No newline at end of file
+        return output
+
+
+def check_dynamic_filter_shift(N = 2, C = 3, H = 7, W = 9):
+    """ 'shift' against 'im2col' (forward and backward), and torch.autograd.gradcheck of 'shift', in double """
+    torch.manual_seed(0)
+    for k, d in [(3, 1), (5, 2), (9, 1)]:
+        x = torch.randn(N, C, H, W, dtype = torch.float64, requires_grad = True)
+        filters = torch.randn(N, k*k, H, W, dtype = torch.float64, requires_grad = True)
+        biases = torch.randn(N, 1, H, W, dtype = torch.float64, requires_grad = True)
+        inputs = [x, filters, biases]
+        ref = DynamicFilterLayer(k, d, 'im2col')(*inputs)
+        shift_layer = DynamicFilterLayer(k, d, 'shift')
+        out = shift_layer(*inputs)
+        grad = torch.randn_like(ref)
+        grads_ref = torch.autograd.grad(ref, inputs, grad)
+        grads = torch.autograd.grad(out, inputs, grad)
+        assert torch.autograd.gradcheck(shift_layer, inputs), (k, d)
+        print ("[***] k = {}, d = {}: gradcheck ok, shift vs. im2col max abs diff {:.2e} (forward), {:.2e} (backward)".format(
+            k, d, (out - ref).abs().max().item(), max((a - b).abs().max().item() for a, b in zip(grads, grads_ref))))
+
+
+def benchmark_dynamic_filter(N = 1, C = 16, D = 24, H = 48, W = 96, kernel_sizes = (5, 9, 13),
+        dilation = 1, repeat = 3, device = 'cpu'):
+    """ 'im2col' vs. 'shift' backend, on the whole cost volume [N,C,D,H,W]:
+        time of forward + backward, and the peak memory (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from .cost_volume_filter import time_forward_backward
+    x = torch.randn(N, C, D, H, W, device = device, requires_grad = True)
+    for k in kernel_sizes:
+        filters = torch.randn(N, k*k, H, W, device = device).softmax(dim = 1).requires_grad_()
+        biases = torch.randn(N, 1, H, W, device = device, requires_grad = True)
+        ref = None
+        for backend in ['im2col', 'shift']:
+            dfn_layer = DynamicFilterLayer(k, dilation, backend)
+            func = lambda: dfn_layer(x, filters, biases)
+            try:
+                out = func()
+            except RuntimeError as error:
+                # e.g., out of memory;
+                print ("[{}] k = {}: failed ({})".format(backend, k, error))
+                continue
+            if ref is None:
+                ref = out.detach()
+            else:
+                assert torch.allclose(out, ref, atol = 1e-5)
+            del out
+            ms, mem = time_forward_backward(func, repeat, device)
+            print ("[{}] k = {}, cost volume {}: {:.2f} ms (forward + backward), {}".format(
+                backend, k, list(x.size()), ms, mem))
+
+
+if __name__ == "__main__":
+    check_dynamic_filter_shift()
+    benchmark_dynamic_filter(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_dynamic_filter(device = 'cuda')
@@ -10,7 +10,9 @@ import torch
 import torch
 import torch.nn as nn
 import torch.nn.functional as F
+from torch.autograd import Function
 import numpy as np
+from .mixed_precision import keep_fp32
 
 #from src.commons import *
 #from src import common_flags as common
@@ -156,15 +158,112 @@ def get_embed_mask(x_embed, k = 3, r= 1, hardness_lambda = 0.1, isL2Dist = False
 
 
 
+##############################
+""" fused embedding loss, without the im2col tensors """ 
+##############################
+def get_window_offsets(k = 3, r = 1):
+    """ the (dy, dx) of the k*k neighbors, in the order of im2col() """
+    return [((i - k//2)*r, (j - k//2)*r) for i in range(k) for j in range(k)]
+
+
+class NeighborDistFunction(Function):
+    """ im2dist() of several dilations at once, from shifted views of the zero-padded
+        embedding: only one [N, C, H, W] difference is alive at a time, and the backward
+        recomputes the differences from the embedding, instead of saving the [N, C, k*k, H, W]
+        patches of each dilation;
+    """
+    @staticmethod
+    def forward(ctx, x, dilations, k, isL2Dist):
+        N, C, H, W = x.size()
+        R = max(dilations)*(k//2)
+        x_pad = F.pad(x, (R, R, R, R))
+        # the center, at distance 0, is kept to have the layout of im2dist();
+        dist = x.new_zeros(N, len(dilations), k*k, H, W)
+        for i, r in enumerate(dilations):
+            for t, (dy, dx) in enumerate(get_window_offsets(k, r)):
+                if dy == 0 and dx == 0:
+                    continue
+                diff = x_pad[:, :, R+dy:R+dy+H, R+dx:R+dx+W] - x
+                dist[:, i, t] = diff.pow_(2).sum(dim = 1) if isL2Dist else diff.abs_().sum(dim = 1)
+        ctx.dilations, ctx.k, ctx.isL2Dist = dilations, k, isL2Dist
+        ctx.save_for_backward(x)
+        return dist
+
+    @staticmethod
+    def backward(ctx, grad_dist):
+        x, = ctx.saved_tensors
+        N, C, H, W = x.size()
+        R = max(ctx.dilations)*(ctx.k//2)
+        x_pad = F.pad(x, (R, R, R, R))
+        grad_pad = torch.zeros_like(x_pad)
+        grad_x = torch.zeros_like(x)
+        for i, r in enumerate(ctx.dilations):
+            for t, (dy, dx) in enumerate(get_window_offsets(ctx.k, r)):
+                if dy == 0 and dx == 0:
+                    continue
+                diff = x_pad[:, :, R+dy:R+dy+H, R+dx:R+dx+W] - x
+                g = grad_dist[:, i, t:t+1]
+                # d|a|/da = sign(a), 0 at 0 as abs() in autograd;
+                diff = diff.mul_(2.0*g) if ctx.isL2Dist else diff.sign_().mul_(g)
+                grad_pad[:, :, R+dy:R+dy+H, R+dx:R+dx+W] += diff
+                grad_x -= diff
+        # the gradient of the zero padding is dropped;
+        grad_x += grad_pad[:, :, R:R+H, R:R+W]
+        return grad_x, None, None, None
+
+
+def neighbor_dist(x, dilations = (1,), k = 3, isL2Dist = False):
+    """ im2dist(x, k, r, isL2Dist) for each r in dilations, in [N, len(dilations), k*k, H, W] """
+    return NeighborDistFunction.apply(x, tuple(dilations), k, isL2Dist)
+
+
+def neighbor_labels(labels, k = 3, r = 1):
+    """ the k*k neighbors of the labels [N, 1, H, W] (0 out of the image, as im2col()),
+        as a list of shifted views of the padded labels;
+    """
+    _, _, H, W = labels.size()
+    R = r*(k//2)
+    labels_pad = F.pad(labels, (R, R, R, R))
+    return [labels_pad[:, :, R+dy:R+dy+H, R+dx:R+dx+W] for dy, dx in get_window_offsets(k, r)]
+
+
+def neighbor_parity(labels, dilations = (1,), k = 3):
+    """ im2parity(labels, k, r) for each r in dilations, in [N, len(dilations), k*k, H, W], as bool """
+    return torch.stack([torch.cat([l == labels for l in neighbor_labels(labels, k, r)], dim = 1)
+        for r in dilations], dim = 1)
+
+
+def get_embed_losses_fused(x_embed, labels, alpha = 0.5, beta = 2.0, isL2Dist = False,
+        ignore_label = 255, dilations = (1, 2, 5), one_pass = True):
+    """ dist_loss(im2parity(labels, 3, r), im2dist(x_embed, 3, r), labels) for each r in dilations,
+        in [len(dilations)], without the im2col tensors; one_pass: all the dilations in one
+        NeighborDistFunction call, otherwise one call per dilation;
+    """
+    k = 3
+    with torch.set_grad_enabled(False):
+        parity = neighbor_parity(labels, dilations, k) # [N, len(dilations), k*k, H, W]
+        # NOTE: dist_loss() takes the ignored neighbors at r = 1 for all the dilations, kept as is;
+        ignore = torch.cat([l != ignore_label for l in neighbor_labels(labels, k, 1)], dim = 1).unsqueeze(1)
+    if one_pass:
+        dist = neighbor_dist(x_embed, dilations, k, isL2Dist)
+    else:
+        dist = torch.cat([neighbor_dist(x_embed, (r,), k, isL2Dist) for r in dilations], dim = 1)
+    loss = torch.where(parity, F.relu(dist - alpha), F.relu(beta - dist))*ignore
+    # the sum over the window, the mean over [N, H, W];
+    return loss.sum(dim = 2).mean(dim = (0, 2, 3))
+
+
 ##############################
 """ embedding network loss """ 
 ##############################
-def get_embed_losses(x_embed, labels, args_dict = None):
+@keep_fp32
+def get_embed_losses(x_embed, labels, args_dict = None, fused = False):
     """
     args:
        x_embed: embedding feature, [N, C, H, W], e.g., C = F = 64
        labels : segmentation labels, [N, C=1, H, W] (Note: in PyTorch is [N C H W], while in TensorFlow is [N H W C];
        args_dict : parameters 
+       fused: True to use get_embed_losses_fused(), the same losses without the im2col tensors;
     """
     if args_dict is None:
         args_dict = {
@@ -187,6 +286,12 @@ def get_embed_losses(x_embed, labels, args_dict = None):
     r2_weight = args_dict['r2_weight']
     r5_weight = args_dict['r5_weight']
 
+    if fused:
+        loss_r1, loss_r2, loss_r5 = get_embed_losses_fused(x_embed, labels, alpha, beta, isL2Dist,
+            ignore_label, dilations = (1, 2, 5))
+        loss = r1_weight * loss_r1 + r2_weight * loss_r2 + r5_weight*loss_r5
+        return loss, loss_r1, loss_r2, loss_r5
+
     """ embedding features to distance """
     # apply in2dist to the embedding;
     dist_r1 = im2dist(x_embed, k = 3, r = 1, isL2Dist = isL2Dist)
@@ -218,8 +323,10 @@ def get_embed_losses(x_embed, labels, args_dict = None):
 embedding network
 """
 class embed_net(nn.Module):
-    def __init__(self):
+    def __init__(self, lowres_fusion = False):
         super(embed_net, self).__init__()
+        # apply avgConv to each map at its own resolution, see fuse_lowres();
+        self.lowres_fusion = lowres_fusion
 
         self.relu = nn.ReLU(inplace=True)
         """ conv 1 """
@@ -278,6 +385,31 @@ class embed_net(nn.Module):
     
     #####################################
     #####################################
+    def upsample_to(self, x, H, W):
+        if self.lowres_fusion:
+            # upsampled after avgConv, in fuse_lowres();
+            return x
+        return F.interpolate(x, size = [H,W], mode='bilinear',align_corners = True)
+    
+    def fuse_lowres(self, H, W):
+        """ avgConv(torch.cat(upsampled self.fused)), without the [N, 643, H, W] concatenation:
+            the 1x1 conv and the bilinear upsampling are both linear (and the upsampling keeps
+            the constant bias), so avgConv can be split by input channels and applied to each
+            map at its own resolution, and only the 64-channel results are upsampled and summed;
+        """
+        weights = torch.split(self.avgConv.weight, [f.size(1) for f in self.fused], dim = 1)
+        per_size = {}
+        for f, w in zip(self.fused, weights):
+            y = F.conv2d(f, w)
+            size = tuple(f.size()[-2:])
+            per_size[size] = per_size[size] + y if size in per_size else y
+        out = self.avgConv.bias.view(1, -1, 1, 1)
+        for size, y in per_size.items():
+            if size != (H, W):
+                y = F.interpolate(y, size = [H,W], mode='bilinear',align_corners = True)
+            out = out + y
+        return out
+
     def forward(self, x):
         """ reset self.fused to empty """ 
         self.fused = []
@@ -296,21 +428,116 @@ class embed_net(nn.Module):
         
         """ conv 2 """
         x = self.relu(self.conv2_0(x))
-        self.fused.append(F.interpolate(x, size = [H,W], mode='bilinear',align_corners = True))
+        self.fused.append(self.upsample_to(x, H, W))
         x = self.relu(self.conv2_1(x))
-        self.fused.append(F.interpolate(x, size = [H,W], mode='bilinear',align_corners = True))
+        self.fused.append(self.upsample_to(x, H, W))
         x = self.max_pool(x)
 
         """ conv 3 """
         x = self.relu(self.conv3_0(x))
         x = self.relu(self.conv3_1(x))
         x = self.relu(self.conv3_2(x))
-        self.fused.append(F.interpolate(x, size = [H,W], mode='bilinear',align_corners = True))
+        self.fused.append(self.upsample_to(x, H, W))
         
         """ fusion, aka, weighted avg """
+        if self.lowres_fusion:
+            return self.fuse_lowres(H, W)
         x = torch.cat(self.fused, dim = 1) #[N, C, H, W]
         #print('[***] fusion shape = ', x.shape)
         """ the embedding features """
         out = self.avgConv(x)
 
         return out
+
+
+def check_embed_fusion(N = 2, H = 37, W = 61):
+    """ the low-resolution fusion against the original one, with the same weights, in double """
+    torch.manual_seed(0)
+    net = embed_net().double()
+    x = torch.rand(N, 3, H, W, dtype = torch.float64, requires_grad = True)
+    outs = []
+    for lowres_fusion in [False, True]:
+        net.lowres_fusion = lowres_fusion
+        net.zero_grad()
+        x.grad = None
+        out = net(x)
+        out.pow(2).sum().backward()
+        outs.append([out.detach(), x.grad.clone()] + [p.grad.clone() for p in net.parameters()])
+    diff = max((a - b).abs().max().item() for a, b in zip(*outs))
+    assert diff < 1e-9, diff
+    print ("[***] embed_net low-resolution fusion: max abs diff {:.2e} (output and gradients)".format(diff))
+
+
+def benchmark_embed_fusion(N = 1, H = 384, W = 1248, scales = (3, 4), repeat = 3, device = 'cpu'):
+    """ embed_net at 1/3 (GANet) and 1/4 (PSMNet, GCNet, DispNetC) of the image resolution:
+        the original fusion vs. the low-resolution one, forward + backward time, and the peak memory
+        (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from .cost_volume_filter import time_forward_backward
+    net = embed_net().to(device)
+    for scale in scales:
+        x = torch.rand(N, 3, H//scale, W//scale, device = device)
+        for lowres_fusion in [False, True]:
+            net.lowres_fusion = lowres_fusion
+            ms, mem = time_forward_backward(lambda: net(x), repeat, device)
+            print ("[1/{} of {}x{}] {:>9s} fusion: {:.2f} ms (forward + backward), {}".format(
+                scale, H, W, 'low-res' if lowres_fusion else 'full-res', ms, mem))
+
+
+def check_embed_losses_fused(N = 2, C = 16, H = 23, W = 31):
+    """ get_embed_losses(fused = True) against the im2col version: losses and embedding gradients """
+    torch.manual_seed(0)
+    labels = torch.randint(0, 4, (N, 1, H, W)).float()
+    labels[labels == 3] = 255
+    for norm in ['L1', 'L2']:
+        args_dict = {'alpha': 0.5, 'beta': 2.0, 'norm': norm, 'r1_weight': 1.0, 'r2_weight': 0.7,
+                     'r5_weight': 0.3, 'ignore_label': 255}
+        x = torch.randn(N, C, H, W, dtype = torch.float64) * (0.3 if norm == 'L1' else 0.2)
+        results = []
+        for fused, one_pass in [(False, True), (True, True), (True, False)]:
+            x_embed = x.clone().requires_grad_()
+            if fused:
+                losses = get_embed_losses_fused(x_embed, labels, 0.5, 2.0, norm == 'L2', 255, (1, 2, 5), one_pass)
+                loss = 1.0*losses[0] + 0.7*losses[1] + 0.3*losses[2]
+                losses = [loss] + list(losses)
+            else:
+                losses = list(get_embed_losses(x_embed, labels, args_dict))
+            losses[0].backward()
+            results.append(torch.stack([l.detach() for l in losses]).tolist() + [x_embed.grad])
+        for r in results[1:]:
+            diff_loss = max(abs(a - b) for a, b in zip(r[:4], results[0][:4]))
+            diff_grad = (r[4] - results[0][4]).abs().max().item()
+            assert diff_loss < 1e-10 and diff_grad < 1e-10, (diff_loss, diff_grad)
+        print ("[***] fused embedding loss ({}): losses {}, max abs diff {:.2e} (losses), {:.2e} (gradient)".format(
+            norm, ['{:.4f}'.format(l) for l in results[0][:4]], diff_loss, diff_grad))
+    x_embed = torch.randn(1, 4, 7, 9, dtype = torch.float64, requires_grad = True)
+    assert torch.autograd.gradcheck(lambda e: neighbor_dist(e, (1, 2), 3, True), (x_embed,))
+
+
+def benchmark_embed_losses(N = 1, C = 64, H = 128, W = 416, repeat = 3, device = 'cpu'):
+    """ the embedding loss at 1/3 of 384x1248 (e.g., ASN-Embed-GANet-Deep): im2col vs. fused,
+        forward + backward time, and the peak memory (CUDA) or the bytes saved by autograd (CPU);
+    """
+    from .cost_volume_filter import time_forward_backward
+    embed = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    labels = torch.randint(0, 20, (N, 1, H, W), device = device).float()
+    runs = [
+        ('im2col', lambda: get_embed_losses(embed, labels)[0]),
+        ('fused, per dilation', lambda: get_embed_losses_fused(embed, labels, one_pass = False).sum()),
+        ('fused, one pass', lambda: get_embed_losses_fused(embed, labels, one_pass = True).sum()),
+        ]
+    for name, func in runs:
+        ms, mem = time_forward_backward(func, repeat, device)
+        print ("[embedding loss, {}x{}x{}x{}] {:>19s}: {:.2f} ms (forward + backward), {}".format(
+            N, C, H, W, name, ms, mem))
+
+
+if __name__ == "__main__":
+    check_embed_losses_fused()
+    benchmark_embed_losses(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_embed_losses(device = 'cuda')
+    check_embed_fusion()
+    benchmark_embed_fusion(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_embed_fusion(device = 'cuda')
@@ -9,16 +9,19 @@
 
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from .im2col import im2col_layer
+from ..baselines.DispNet.models.dispnet import Correlation1DFunction
 
-class filtered_correlation1D(nn.Module):
+# the per-disparity loop version, kept as the reference of filtered_correlation1D;
+class filtered_correlation1D_V0(nn.Module):
     def __init__(self, maxdisp, kernel_size = 5, dilation = 2):
         """
         args:
             max_disp: disparity range
             kernel_size: e.g., 5 x 5
         """
-        super(filtered_correlation1D, self).__init__()
+        super(filtered_correlation1D_V0, self).__init__()
         self.maxdisp = maxdisp
         self.kernel_size = kernel_size
         self.dilation = dilation
@@ -84,3 +87,79 @@ class filtered_correlation1D(nn.Module):
         corr = torch.cat(corr_tensor_list, dim = 1)
         #print ("[???] corr shape: ", corr.shape)
         return corr
+
+
+class filtered_correlation1D(nn.Module):
+    def __init__(self, maxdisp, kernel_size = 5, dilation = 2, disp_chunk = 0):
+        """
+        args:
+            max_disp: disparity range
+            kernel_size: e.g., 5 x 5
+            disp_chunk: number of disparities filtered at once, to bound the transient forward
+                        memory of the k*k shifted planes; 0 for all the D disparities;
+                        NOTE: it does not reduce what autograd saves for backward, i.e., x and y
+                        (by Correlation1DFunction), the filters and the padded correlation
+                        volume [N,D,H+2p,W+2p] (the k*k taps are views of it), for any chunk;
+        """
+        super(filtered_correlation1D, self).__init__()
+        self.maxdisp = maxdisp
+        self.kernel_size = kernel_size
+        self.dilation = dilation
+        self.padding = dilation * (kernel_size - 1) // 2
+        self.disp_chunk = disp_chunk
+
+    def forward(self, x, y, filters, filters_biases):
+        """
+        the same output as filtered_correlation1D_V0, but without the loop over D:
+            1) the full correlation volume [N,D,H,W], by Correlation1DFunction (see dispnet.py);
+            2) the per-pixel dynamic filter, applied to all the D planes of each chunk at once,
+               as a sum of the k*k shifted planes weighted by the filter taps;
+        args:
+            x: left feature, in [N,C,H,W]
+            y: right feature, in [N,C,H,W]
+            filters: dynamic filters, in shape [N, k*k, H, W]
+            filters_biases: used as additive biases after the filtering, in shape [N, 1, H, W];
+        return:
+            corr: correlation map in size [N,D,H,W]
+        """
+        N, C, H, W = x.size()
+        D = self.maxdisp
+        k = self.kernel_size
+        dil = self.dilation
+        chunk = D if self.disp_chunk <= 0 else min(self.disp_chunk, D)
+        corr = Correlation1DFunction.apply(x, y, D, chunk)
+        out = []
+        for d0 in range(0, D, chunk):
+            # instead of the im2col in [N, c, k*k, H, W], accumulate the k*k shifted planes,
+            # each weighted by its filter tap in [N, 1, H, W], broadcast to the c disparities;
+            corr_pad = F.pad(corr[:, d0:d0 + chunk], [self.padding]*4)
+            out_chunk = None
+            for i in range(k):
+                for j in range(k):
+                    tap = corr_pad[:, :, i*dil:i*dil + H, j*dil:j*dil + W] * filters[:, i*k + j:i*k + j + 1]
+                    out_chunk = tap if out_chunk is None else out_chunk + tap
+            out.append(out_chunk)
+        out = out[0] if len(out) == 1 else torch.cat(out, dim = 1)
+        return out + filters_biases
+
+
+def benchmark_filtered_correlation1D(N = 2, C = 128, H = 64, W = 128, D = 48, 
+        kernel_size = 9, dilation = 1, disp_chunks = (0, 16), repeat = 3, device = 'cpu'):
+    """ compare filtered_correlation1D against the loop version filtered_correlation1D_V0 """
+    from .cost_volume_filter import time_forward_backward
+    x = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    y = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    filters = torch.randn(N, kernel_size**2, H, W, device = device, requires_grad = True)
+    biases = torch.randn(N, 1, H, W, device = device, requires_grad = True)
+    funcs = [('filtered_correlation1D_V0', filtered_correlation1D_V0(D, kernel_size, dilation))]
+    funcs += [('filtered_correlation1D(chunk={})'.format(c), filtered_correlation1D(D, kernel_size, dilation, c))
+            for c in disp_chunks]
+    for name, func in funcs:
+        ms, mem = time_forward_backward(lambda: func(x, y, filters, biases), repeat, device)
+        print ("{:>35s}: {:.2f} ms (forward + backward), {}".format(name, ms, mem))
+
+
+if __name__ == "__main__":
+    benchmark_filtered_correlation1D(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_filtered_correlation1D(device = 'cuda')
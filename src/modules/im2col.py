@@ -38,3 +38,12 @@ class im2col_layer(nn.Module):
          else:
              return self.im2col(x).view(N, C*self.k*self.k, H, W)
          
+
+
+def shift_range(o, n):
+    """ for a shift o along an axis of size n: the output and the input slices,
+        i.e., out[r] takes in[r + o], for the r with 0 <= r + o < n;
+        the shift-and-accumulate counterpart of the k*k taps of im2col_layer
+        (see bilateral.py and dfn.py);
+    """
+    return slice(max(0, -o), min(n, n - o)), slice(max(0, o), min(n, n + o))
@@ -0,0 +1,230 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: mixed_precision.py
+# @brief: opt-in mixed precision (autocast + gradient scaling) for training and inference;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+The 5-D cost volumes, the 3D convs and the im2col tensors of the filters are
+bandwidth-bound, so they gain from 16-bit activations. With
+
+    set_autocast(model, precision, device_type), precision in:
+      - 'fp32': no autocast (the default);
+      - 'fp16': float16 autocast (CUDA), with the gradient scaling of make_grad_scaler();
+      - 'bf16': bfloat16 autocast (CUDA, or CPU), the same exponent range as fp32, no scaling;
+
+the forward() of the model runs under autocast (the weights stay in fp32), and
+its floating outputs are cast back to fp32, so the losses and the metrics are
+computed in fp32. The numerically sensitive pieces run in fp32 in any case:
+    - keep_fp32(): a decorator, its tensor args are cast to fp32 and it runs
+      without autocast, e.g., the bilateral weights and their normalizer wgt_sum,
+      the embedding exponentials and losses, the disparity regressions, the
+      MyLoss / MyLoss2 losses, and the SGA / LGA of GANet (their CUDA kernels
+      and the GANet_cpu extension only accept float / double);
+    - softmax_fp32(): the softmax over the disparities, before the regressions;
+
+The swap of the model class (as in activation_checkpoint.py) keeps the
+state_dict keys, and the autocast is entered in each DataParallel replica,
+i.e., in the thread which runs it.
+
+Accuracy and time report (a PSMNet cost aggregation + regression):
+    python3.7 -m src.modules.mixed_precision
+"""
+
+import time
+import functools
+import contextlib
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+PRECISIONS = {'fp32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}
+
+_low_precision_dtypes = (torch.float16, torch.bfloat16)
+
+
+def autocast(device_type, dtype = None, enabled = True):
+    if hasattr(torch, 'autocast'):
+        # torch >= 1.10;
+        return torch.autocast(device_type, dtype = dtype, enabled = enabled)
+    # torch 1.6 - 1.9: CUDA float16 only;
+    assert device_type == 'cuda' and dtype in (None, torch.float16), \
+        "this PyTorch only has the CUDA float16 autocast"
+    return torch.cuda.amp.autocast(enabled = enabled)
+
+
+def is_autocast_enabled():
+    """ autocast on the CUDA or on the CPU """
+    try:
+        return torch.is_autocast_enabled('cuda') or torch.is_autocast_enabled('cpu')
+    except TypeError:
+        # torch < 2.4;
+        return torch.is_autocast_enabled() or getattr(torch, 'is_autocast_cpu_enabled', lambda: False)()
+
+
+@contextlib.contextmanager
+def float32_region():
+    """ disables the autocast (CUDA and CPU) in the region """
+    with contextlib.ExitStack() as stack:
+        if hasattr(torch, 'autocast'):
+            stack.enter_context(torch.autocast('cuda', enabled = False))
+            stack.enter_context(torch.autocast('cpu', enabled = False))
+        elif hasattr(torch.cuda, 'amp'):
+            stack.enter_context(torch.cuda.amp.autocast(enabled = False))
+        yield
+
+
+def to_float32(x):
+    """ the float16 / bfloat16 tensors of x (a tensor, or a tuple, list or dict of them) in fp32 """
+    if torch.is_tensor(x):
+        return x.float() if x.dtype in _low_precision_dtypes else x
+    if isinstance(x, tuple) and hasattr(x, '_fields'):
+        # namedtuple;
+        return type(x)(*[to_float32(y) for y in x])
+    if isinstance(x, (tuple, list)):
+        return type(x)(to_float32(y) for y in x)
+    if isinstance(x, dict):
+        return type(x)((k, to_float32(v)) for k, v in x.items())
+    return x
+
+
+def keep_fp32(func):
+    """ runs func in fp32: its 16-bit tensor args are cast to fp32, and the autocast is
+        disabled inside; a no-op outside of autocast, on fp32 inputs;
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_autocast_enabled() and not any(
+                torch.is_tensor(a) and a.dtype in _low_precision_dtypes for a in list(args) + list(kwargs.values())):
+            return func(*args, **kwargs)
+        with float32_region():
+            return func(*to_float32(args), **to_float32(kwargs))
+    return wrapper
+
+
+def softmax_fp32(x, dim):
+    """ F.softmax(x, dim) in fp32, e.g., over the disparities of a 16-bit cost volume """
+    return F.softmax(x.float(), dim = dim)
+
+
+class _AutocastMixin(object):
+    """ the forward() of the model under autocast, see set_autocast() """
+    def forward(self, *inputs, **kwargs):
+        with autocast(self.autocast_device_type, self.autocast_dtype):
+            outputs = super(_AutocastMixin, self).forward(*inputs, **kwargs)
+        return to_float32(outputs)
+
+
+_autocast_classes = {}
+
+def set_autocast(model, precision = 'fp32', device_type = 'cuda'):
+    """
+    args:
+        model: e.g., AttenStereoNet, or its DataParallel;
+        precision: 'fp32', 'fp16' or 'bf16';
+        device_type: 'cuda' or 'cpu', where the model runs;
+    return:
+        the autocast dtype, None for fp32;
+    """
+    assert precision in PRECISIONS, "precision should be one of {}".format(sorted(PRECISIONS))
+    if isinstance(model, nn.DataParallel):
+        model = model.module
+    cls = type(model)
+    if issubclass(cls, _AutocastMixin):
+        cls = cls.__bases__[1]
+        model.__class__ = cls
+    dtype = PRECISIONS[precision]
+    if dtype is not None:
+        if cls not in _autocast_classes:
+            _autocast_classes[cls] = type('Autocast' + cls.__name__, (_AutocastMixin, cls), {})
+        model.__class__ = _autocast_classes[cls]
+        model.autocast_dtype = dtype
+        model.autocast_device_type = device_type
+    return dtype
+
+
+def make_grad_scaler(precision, device_type = 'cuda'):
+    """ the GradScaler of the fp16 training, None otherwise (bf16 does not underflow as fp16) """
+    if precision != 'fp16':
+        return None
+    if hasattr(torch, 'amp') and hasattr(torch.amp, 'GradScaler'):
+        # torch >= 2.3;
+        return torch.amp.GradScaler(device_type)
+    assert device_type == 'cuda', "this PyTorch only has the CUDA GradScaler"
+    return torch.cuda.amp.GradScaler()
+
+
+def check_mixed_precision(N = 1, H = 96, W = 192, maxdisp = 96, precision = 'bf16', repeat = 1, device = 'cpu'):
+    """ the cost aggregation + softmax + regression of PSMNet, in fp32 and with autocast:
+        the error of the disparities, the time of forward + backward, and the dtypes of the
+        fp32 pieces under autocast;
+    """
+    from .psmnet_submodule import PSMNet
+
+    class _Stack(nn.Module):
+        def __init__(self):
+            super(_Stack, self).__init__()
+            self.psm = PSMNet(maxdisp)
+        def forward(self, cost):
+            # as the training forward() of AttenStereoNet_psm (the last output);
+            psm = self.psm
+            cost0 = psm.dres0(cost)
+            cost0 = psm.dres1(cost0) + cost0
+            out1, pre1, post1 = psm.dres2(cost0, None, None)
+            out1 = out1 + cost0
+            out2, pre2, post2 = psm.dres3(out1, pre1, post1)
+            out2 = out2 + cost0
+            out3, pre3, post3 = psm.dres4(out2, pre1, post2)
+            out3 = out3 + cost0
+            cost3 = psm.classif3(out3) + psm.classif2(out2) + psm.classif1(out1)
+            cost3 = F.interpolate(cost3, [maxdisp, H, W], mode = 'trilinear', align_corners = True)
+            prob = softmax_fp32(torch.squeeze(cost3, 1), dim = 1)
+            self.prob_dtype = prob.dtype
+            # (disparityregression of psmnet_submodule builds its disparities with .cuda();)
+            disp = torch.arange(maxdisp, dtype = prob.dtype, device = prob.device).view(1, maxdisp, 1, 1)
+            return torch.sum(prob * disp, 1)
+
+    torch.manual_seed(0)
+    model = _Stack().to(device).train()
+    cost = torch.randn(N, 64, maxdisp // 4, H // 4, W // 4, device = device)
+    disp_gt = torch.rand(N, H, W, device = device) * (maxdisp - 1)
+
+    def sync():
+        if device != 'cpu':
+            torch.cuda.synchronize()
+    results = {}
+    for p in ['fp32', precision]:
+        set_autocast(model, p, device)
+        scaler = make_grad_scaler(p, device)
+        model.zero_grad()
+        # warm-up;
+        model(cost)
+        sync()
+        since = time.time()
+        for _ in range(repeat):
+            model.zero_grad()
+            disp = model(cost)
+            loss = F.smooth_l1_loss(disp, disp_gt)
+            (scaler.scale(loss) if scaler is not None else loss).backward()
+        sync()
+        ms = (time.time() - since) / repeat * 1000
+        grads = torch.cat([q.grad.flatten() for q in model.parameters() if q.grad is not None])
+        if scaler is not None:
+            grads = grads / scaler.get_scale()
+        results[p] = (disp.detach(), grads, ms, disp.dtype, model.prob_dtype)
+    disp32, grads32, ms32 = results['fp32'][:3]
+    disp16, grads16, ms16, out_dtype, prob_dtype = results[precision]
+    epe = (disp16 - disp32).abs()
+    print ("[{}] {}: disparity vs fp32: mean abs diff {:.3e}, max {:.3e}, > 1 px {:.3f} %; grad rel diff {:.3e}".format(
+        device, precision, epe.mean().item(), epe.max().item(), (epe > 1).float().mean().item() * 100,
+        ((grads16 - grads32).norm() / grads32.norm()).item()))
+    print ("[{}] {}: output {}, softmax {}; {:.2f} ms vs {:.2f} ms (fp32), forward + backward".format(
+        device, precision, str(out_dtype).replace('torch.', ''), str(prob_dtype).replace('torch.', ''), ms16, ms32))
+
+
+if __name__ == "__main__":
+    check_mixed_precision(precision = 'bf16', device = 'cpu')
+    if torch.cuda.is_available():
+        check_mixed_precision(H = 256, W = 512, maxdisp = 192, precision = 'fp16', device = 'cuda')
+        check_mixed_precision(H = 256, W = 512, maxdisp = 192, precision = 'bf16', device = 'cuda')
@@ -11,6 +11,8 @@ __all__ = ['PacConv2d', 'PacConvTranspose2d', 'PacPool2d',
            'packernel2d', 'nd2col']
 
 import math
+import weakref
+import functools
 from numbers import Number
 from itertools import repeat
 
@@ -21,7 +23,13 @@ import torch.nn.functional as F
 from torch.autograd.function import Function, once_differentiable
 from torch.nn.parameter import Parameter
 from torch.nn.modules.utils import _pair
-from torch._thnn import type2backend
+try:
+    from torch._thnn import type2backend
+except ImportError:
+    # removed from recent PyTorch, only used by the Functions (native_impl = False);
+    type2backend = None
+from .pac_autotune import pac_autotuner
+from .mixed_precision import keep_fp32
 
 """ this is the original one in PAC paper:
 try:
@@ -93,7 +101,7 @@ def nd2col(input_nd, kernel_size, stride=1, padding=0, output_padding=0, dilatio
     out_sz = tuple([((i + 2 * p - d * (k - 1) - 1) // s + 1)
                     for (i, k, d, p, s) in zip(in_sz, kernel_size, dilation, padding, stride)])
     # Use PyINN if possible (about 15% faster) TODO confirm the speed-up
-    if n_dims == 2 and dilation == 1 and has_pyinn and torch.cuda.is_available() and use_pyinn_if_possible:
+    if n_dims == 2 and all(d == 1 for d in dilation) and has_pyinn and input_nd.is_cuda and use_pyinn_if_possible:
         # Added by CCJ:
         # NOTE: require dilation == 1 for pyinn_im2col, 
         output = P.im2col(input_nd, kernel_size, stride, padding)
@@ -104,6 +112,27 @@ def nd2col(input_nd, kernel_size, stride=1, padding=0, output_padding=0, dilatio
     return output
 
 
+def _pac_impls(dilation, has_function=True):
+    """ the implementations tried by native_impl='auto', {name: native_impl} """
+    impls = {'native': True}
+    if has_function and type2backend is not None:
+        # the Functions need torch._thnn;
+        impls['function'] = False
+    if has_pyinn and torch.cuda.is_available() and all(d == 1 for d in dilation):
+        impls['native_pyinn'] = 'pyinn'
+    return impls
+
+
+def _autotune_impl(op_name, op, args, kwargs, kernel_size, dilation, *extra, **options):
+    """ the native_impl of op(*args, **kwargs) picked by pac_autotuner for this signature,
+        see pac_autotune.py; extra: the other arguments changing the cost, in the signature;
+    """
+    impls = _pac_impls(dilation, options.get('has_function', True))
+    candidates = {name: functools.partial(op, **dict(kwargs, native_impl=impl)) for name, impl in impls.items()}
+    signature = pac_autotuner.get_signature(op_name, args[0], kernel_size, dilation, *extra)
+    return impls[pac_autotuner.select(signature, candidates, args)]
+
+
 class GaussKernel2dFn(Function):
     @staticmethod
     def forward(ctx, input, kernel_size, stride, padding, dilation, channel_wise):
@@ -387,6 +416,8 @@ class PacPool2dFn(Function):
         return grad_input, grad_kernel, None, None, None, None
 
 
+# the exponentials of the (embedding) features in fp32, under autocast;
+@keep_fp32
 def packernel2d(input, mask=None, kernel_size=0, stride=1, padding=0, output_padding=0, 
                 dilation=1, kernel_type='gaussian', smooth_kernel_type='none', 
                 smooth_kernel=None, inv_alpha=None, inv_lambda=None,
@@ -400,6 +431,17 @@ def packernel2d(input, mask=None, kernel_size=0, stride=1, padding=0, output_pad
     output_mask = False if mask is None else True
     norm = None
 
+    if native_impl == 'auto':
+        native_impl = _autotune_impl(
+            'packernel2d', packernel2d, (input, mask),
+            dict(kernel_size=kernel_size, stride=stride, padding=padding, output_padding=output_padding,
+                 dilation=dilation, kernel_type=kernel_type, smooth_kernel_type=smooth_kernel_type,
+                 smooth_kernel=smooth_kernel, inv_alpha=inv_alpha, inv_lambda=inv_lambda,
+                 channel_wise=channel_wise, normalize_kernel=normalize_kernel, transposed=transposed),
+            kernel_size, dilation, stride, padding, kernel_type, smooth_kernel_type, channel_wise,
+            normalize_kernel, transposed, mask is not None,
+            has_function=smooth_kernel_type == 'none' and kernel_type == 'gaussian')
+
     if mask is not None and mask.dtype != input.dtype:
         mask = torch.tensor(mask, dtype=input.dtype, device=input.device)
 
@@ -429,7 +471,8 @@ def packernel2d(input, mask=None, kernel_size=0, stride=1, padding=0, output_pad
     if native_impl:
         bs, k_ch, in_h, in_w = input.shape
 
-        x = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation) # tensor in 6D
+        x = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation,
+                   use_pyinn_if_possible=native_impl == 'pyinn') # tensor in 6D
         x = x.view(bs, k_ch, -1, *x.shape[-2:]).contiguous() # tensor in 5D
 
         if smooth_kernel_type == 'none':
@@ -496,15 +539,24 @@ def pacconv2d(input, kernel, weight, bias=None, stride=1, padding=0, dilation=1,
         usualy at groups = 1 for standard convolution, or 
         at groups = in_channels,  for each input channel is 
         convolved with its own set of filters, of size: floor(out_channels/ in_channels);
+    @native_impl: True (im2col + einsum), False (PacConv2dFn), or 'auto' (the fastest one
+        for this signature, see pac_autotune.py);
     """
     kernel_size = tuple(weight.shape[-2:])
     stride = _pair(stride)
     padding = _pair(padding)
     dilation = _pair(dilation)
 
+    if native_impl == 'auto':
+        native_impl = _autotune_impl(
+            'pacconv2d', pacconv2d, (input, kernel, weight, bias),
+            dict(stride=stride, padding=padding, dilation=dilation, shared_filters=shared_filters),
+            kernel_size, dilation, stride, padding, weight.size(0), shared_filters, bias is not None)
+
     if native_impl:
         # im2col on input
-        im_cols = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation)
+        im_cols = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation,
+                         use_pyinn_if_possible=native_impl == 'pyinn')
         
         # comments added by CCJ on Dec 19th, 2019:
         # torch.einsum():
@@ -548,6 +600,14 @@ def pacconv_transpose2d(input, kernel, weight, bias=None, stride=1, padding=0, o
     output_padding = _pair(output_padding)
     dilation = _pair(dilation)
 
+    if native_impl == 'auto':
+        native_impl = _autotune_impl(
+            'pacconv_transpose2d', pacconv_transpose2d, (input, kernel, weight, bias),
+            dict(stride=stride, padding=padding, output_padding=output_padding, dilation=dilation,
+                 shared_filters=shared_filters),
+            kernel_size, dilation, stride, padding, output_padding, weight.size(1), shared_filters,
+            bias is not None)
+
     if native_impl:
         ch = input.shape[1]
         w = input.new_ones((ch, 1, 1, 1))
@@ -555,7 +615,7 @@ def pacconv_transpose2d(input, kernel, weight, bias=None, stride=1, padding=0, o
         pad = [(kernel_size[i] - 1) * dilation[i] - padding[i] for i in range(2)]
         x = F.pad(x, (pad[1], pad[1] + output_padding[1], pad[0], pad[0] + output_padding[0]))
         output = pacconv2d(x, kernel, weight.permute(1, 0, 2, 3), bias, dilation=dilation,
-                           shared_filters=shared_filters, native_impl=True)
+                           shared_filters=shared_filters, native_impl=native_impl)
     else:
         output = PacConvTranspose2dFn.apply(input, kernel, weight, bias, stride, padding, output_padding, dilation,
                                             shared_filters)
@@ -569,13 +629,20 @@ def pacpool2d(input, kernel, kernel_size, stride=1, padding=0, dilation=1, nativ
     padding = _pair(padding)
     dilation = _pair(dilation)
 
+    if native_impl == 'auto':
+        native_impl = _autotune_impl(
+            'pacpool2d', pacpool2d, (input, kernel),
+            dict(kernel_size=kernel_size, stride=stride, padding=padding, dilation=dilation),
+            kernel_size, dilation, stride, padding, kernel.size(1))
+
     if native_impl:
         bs, in_ch, in_h, in_w = input.shape
         out_h = (in_h + 2 * padding[0] - dilation[0] * (kernel_size[0] - 1) - 1) // stride[0] + 1
         out_w = (in_w + 2 * padding[1] - dilation[1] * (kernel_size[1] - 1) - 1) // stride[1] + 1
 
         # im2col on input
-        im_cols = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation)
+        im_cols = nd2col(input, kernel_size, stride=stride, padding=padding, dilation=dilation,
+                         use_pyinn_if_possible=native_impl == 'pyinn')
 
         # main computation
         im_cols *= kernel
@@ -780,6 +847,9 @@ class PacConv2d(_PacConvNd):
             False, kernel_type, smooth_kernel_type, False, normalize_kernel, shared_filters, filler)
 
         self.native_impl = native_impl
+        # (weakref to the guide, its version and the grad mode, (kernel, output_mask)), 
+        # see compute_kernel_cached();
+        self._kernel_cache = None
 
     def compute_kernel(self, input_for_kernel, input_mask=None):
         return packernel2d(input_for_kernel, input_mask,
@@ -792,6 +862,32 @@ class PacConv2d(_PacConvNd):
                            channel_wise=False, normalize_kernel=self.normalize_kernel, transposed=False,
                            native_impl=self.native_impl)
 
+    def compute_kernel_cached(self, input_for_kernel, input_mask=None):
+        """ compute_kernel(), reused as long as input_for_kernel is the same tensor,
+            not modified in place since (i.e., the same version counter), 
+            under the same grad mode, and for the same parameters (in eval mode, or not trained yet);
+            e.g., for the D slices of a cost volume, filtered with the same guide;
+            opt-in (forward() calls compute_kernel()): the caller clears the cache with
+            clear_kernel_cache() once its slices are filtered, or backward() does;
+        """
+        if input_mask is not None:
+            return self.compute_kernel(input_for_kernel, input_mask)
+        key = (input_for_kernel._version, torch.is_grad_enabled(),
+               tuple(p._version for p in self.parameters()))
+        cache = self._kernel_cache
+        if cache is not None and cache[0]() is input_for_kernel and cache[1] == key:
+            return cache[2]
+        kernel = self.compute_kernel(input_for_kernel)
+        self._kernel_cache = (weakref.ref(input_for_kernel), key, kernel)
+        if kernel[0].requires_grad:
+            # backward() frees the graph of the kernel, so it cannot be reused after that;
+            kernel[0].register_hook(self.clear_kernel_cache)
+        return kernel
+
+    def clear_kernel_cache(self, grad = None):
+        """ drops the cached [N, 1, k, k, H, W] kernel (and its graph), see compute_kernel_cached() """
+        self._kernel_cache = None
+
     def forward(self, input_2d, input_for_kernel, kernel=None, mask=None):
         output_mask = None
         if kernel is None:
@@ -0,0 +1,180 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: pac_autotune.py
+# @brief: pick the fastest implementation of the PAC ops per input signature;
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+packernel2d, pacconv2d, pacconv_transpose2d and pacpool2d in pac.py each have
+two (or three) implementations:
+    - 'native': im2col (F.unfold) + einsum, differentiated by autograd;
+    - 'function': the custom autograd Functions (GaussKernel2dFn, PacConv2dFn, ...),
+      if torch._thnn is found (removed from recent PyTorch);
+    - 'native_pyinn': 'native' with the pyinn im2col (CUDA, dilation 1, if pyinn is found);
+Which one is the fastest depends on the shape and the device. With
+native_impl = 'auto', the first call with a new signature
+(op, N rounded up to a power of 2, C, H, W, kernel size, dilation, stride, padding,
+dtype, device, grad mode) times all the candidates (forward, and backward if the
+grad is enabled), and the later calls use the winner. The winners can be saved in a json file,
+so the next runs skip the timing:
+    python main_attenStereoNet.py --pac_native_imple=auto --pac_autotune_cache=pac_autotune.json ...
+"""
+
+import os
+import json
+import time
+import threading
+import torch
+
+
+class PacAutotuner(object):
+    def __init__(self, cache_path = '', repeat = 3, verbose = True):
+        """
+        args:
+            cache_path: json file of the winners, '' for no disk cache;
+            repeat: timed runs per candidate, after one warm-up run;
+        """
+        self.cache_path = cache_path
+        self.repeat = repeat
+        self.verbose = verbose
+        self.winners = {}
+        self._loaded_path = None
+        # the replicas of DataParallel run in threads;
+        self._lock = threading.Lock()
+
+    def get_signature(self, op_name, input, kernel_size, dilation, *extra):
+        N, C, H, W = input.size()
+        # bucketed, since N varies with the batch size, and with the slices per call
+        # of CostVolumeFilter('batch') (e.g., the last, smaller chunk);
+        N = 1 << (N - 1).bit_length()
+        device = input.device.type
+        if input.is_cuda:
+            # the cache file can be shared by several machines;
+            device += ':' + torch.cuda.get_device_name(input.device)
+        return '{}|{}x{}x{}x{}|k{}|d{}|{}|{}|{}|{}'.format(
+            op_name, N, C, H, W, 'x'.join(map(str, kernel_size)), 'x'.join(map(str, dilation)),
+            '|'.join('x'.join(map(str, e)) if isinstance(e, tuple) else str(e) for e in extra),
+            str(input.dtype).replace('torch.', ''), device,
+            'grad' if torch.is_grad_enabled() else 'no_grad')
+
+    def load(self):
+        if not self.cache_path or self._loaded_path == self.cache_path:
+            return
+        self._loaded_path = self.cache_path
+        if os.path.isfile(self.cache_path):
+            with open(self.cache_path) as f:
+                saved = json.load(f)
+            for signature, winner in saved.items():
+                self.winners.setdefault(signature, winner)
+            print ("[***] loaded {} PAC autotune results from {}".format(len(saved), self.cache_path))
+
+    def save(self):
+        if not self.cache_path:
+            return
+        saved = {}
+        if os.path.isfile(self.cache_path):
+            with open(self.cache_path) as f:
+                saved = json.load(f)
+        saved.update(self.winners)
+        tmp_path = self.cache_path + '.tmp{}'.format(os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(saved, f, indent = 1, sort_keys = True)
+        os.replace(tmp_path, self.cache_path)
+
+    def _time(self, func, args):
+        """ forward (and backward) time in ms, on copies of the args detached from the graph """
+        args = [a.detach().requires_grad_(a.requires_grad) if torch.is_tensor(a) else a for a in args]
+        grad_args = [a for a in args if torch.is_tensor(a) and a.requires_grad]
+        is_backward = torch.is_grad_enabled() and len(grad_args) > 0
+        def run():
+            out = func(*args)
+            out = out[0] if isinstance(out, tuple) else out
+            if is_backward:
+                torch.autograd.grad(out, grad_args, torch.ones_like(out), allow_unused = True)
+        def sync():
+            if any(a.is_cuda for a in args if torch.is_tensor(a)):
+                torch.cuda.synchronize()
+        run()
+        sync()
+        since = time.time()
+        for _ in range(self.repeat):
+            run()
+        sync()
+        return (time.time() - since) / self.repeat * 1000
+
+    def select(self, signature, candidates, args):
+        """
+        args:
+            signature: see get_signature();
+            candidates: {name: func}, func(*args) runs the op with this implementation;
+            args: the inputs of the op;
+        return:
+            the name of the fastest candidate, timed at the first call with this signature;
+        """
+        winner = self.winners.get(signature)
+        if winner in candidates:
+            return winner
+        with self._lock:
+            self.load()
+            winner = self.winners.get(signature)
+            if winner in candidates:
+                return winner
+            timings = {}
+            for name, func in candidates.items():
+                try:
+                    timings[name] = self._time(func, args)
+                except Exception as error:
+                    # e.g., out of memory;
+                    print ("[!!!] PAC autotune {}: {} failed ({}: {})".format(
+                        signature, name, type(error).__name__, error))
+            if not timings:
+                raise RuntimeError("no PAC implementation runs for {}".format(signature))
+            winner = min(timings, key = timings.get)
+            self.winners[signature] = winner
+            if self.verbose:
+                print ("[***] PAC autotune {}: {} -> {}".format(signature, ', '.join(
+                    '{} {:.2f} ms'.format(n, t) for n, t in sorted(timings.items(), key = lambda x: x[1])), winner))
+            self.save()
+        return winner
+
+
+# shared by all the PAC layers, see pac.py;
+pac_autotuner = PacAutotuner()
+
+
+def benchmark_pac_autotune(N = 1, C = 32, H = 48, W = 96, kernel_size = 5, dilation = 1, repeat = 3, device = 'cpu'):
+    """ PacConv2d (kernel + convolution, forward + backward) with each implementation, and with 'auto' """
+    from .pac import PacConv2d
+    torch.manual_seed(0)
+    pad = dilation*(kernel_size - 1)//2
+    x = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    guide = torch.randn(N, C, H, W, device = device, requires_grad = True)
+    for native_impl in [True, False, 'auto']:
+        pacconv = PacConv2d(C, C, kernel_size, padding = pad, dilation = dilation,
+                            native_impl = native_impl).to(device)
+        def run():
+            kernel = pacconv.compute_kernel(guide)[0]
+            pacconv(x, None, kernel = kernel).sum().backward()
+        def sync():
+            if device != 'cpu':
+                torch.cuda.synchronize()
+        try:
+            # warm-up, and the autotuning of 'auto';
+            run()
+        except Exception as error:
+            print ("[{}] native_impl = {}: failed ({}: {})".format(device, native_impl, type(error).__name__, error))
+            continue
+        sync()
+        since = time.time()
+        for _ in range(repeat):
+            run()
+        sync()
+        print ("[{}] native_impl = {:>5s}: {:.2f} ms (forward + backward)".format(
+            device, str(native_impl), (time.time() - since) / repeat * 1000))
+
+
+if __name__ == "__main__":
+    benchmark_pac_autotune(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_pac_autotune(device = 'cuda')
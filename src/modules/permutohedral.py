@@ -0,0 +1,260 @@
+# !/usr/bin/env python3
+# -*-coding:utf-8-*-
+# @file: permutohedral.py
+# @brief: the embedding bilateral filter on the permutohedral lattice (splat, blur, slice);
+# @version: 0.0.1
+# @creation date: 18-10-2026
+
+"""
+The brute-force bilateral filter (bilateralFilter, filter_bilateral_with_embeding,
+bilateral_embeding_im2col_pytorch) costs O(k*k) per pixel, with k = 2*int(3*sigma_s + 1) + 1.
+The permutohedral lattice [1] embeds each pixel, with its (position / sigma_s, embedding / sigma_v)
+feature of dimension d, into a lattice of simplices; the Gaussian filter is then:
+    - splat: each value is added to the d+1 vertices of its simplex, with its barycentric weights;
+    - blur:  a [1/2, 1, 1/2] blur of the lattice values along each of the d+1 lattice directions;
+    - slice: each pixel reads back the d+1 vertices of its simplex, with the same weights;
+and normalized by the same filter of a constant 1 (eq (4) in W. Harley's paper).
+The cost is O(d*d) per pixel, and does not depend on sigma_s (a larger sigma_s only means fewer
+lattice vertices), so it is for the low-dimensional guides, e.g., the embedding reduced by PCA
+(see pca_reduce()), and large spatial supports.
+
+All the steps are torch ops (the hash table is torch.unique() on the integer keys), so it runs
+on CPU or GPU, and autograd gives the gradients w.r.t. the input and (via the barycentric weights)
+w.r.t. the guide.
+
+[1] A. Adams, J. Baek and A. Davis, "Fast High-Dimensional Filtering Using the Permutohedral
+    Lattice", Eurographics 2010.
+
+Usage:
+    y = bilateral_filter_lattice(embed, x, sigma_s = 3.0, sigma_v = 0.1, guide_dims = 4)
+"""
+
+import math
+import torch
+
+
+def pca_reduce(embed, dims):
+    """
+    project the embedding of each sample onto its first dims principal components;
+    the distances in the kept subspace, hence sigma_v, keep their meaning;
+    the basis is not differentiated (an eigen-decomposition has unstable gradients),
+    but the projection is;
+
+    args:
+        embed: [N,F,H,W]
+        dims: number of the kept components, dims < F
+    return:
+        [N,dims,H,W]
+    """
+    N, F, H, W = embed.size()
+    X = embed.view(N, F, H*W)
+    X = X - X.mean(dim = 2, keepdim = True)
+    with torch.no_grad():
+        cov = torch.bmm(X, X.transpose(1, 2)) / (H*W)
+        # eigenvalues in ascending order;
+        basis = torch.linalg.eigh(cov)[1][:, :, F - dims:].flip(2)
+    return torch.bmm(basis.transpose(1, 2), X).view(N, dims, H, W)
+
+
+class PermutohedralLattice(object):
+    """ the lattice of a set of features, built once, then used to filter any number of values """
+    def __init__(self, features):
+        """
+        args:
+            features: [N,d,H,W], i.e., the positions, scaled by the inverse std. dev. of the Gaussian;
+        """
+        N, d, H, W = features.size()
+        self.size = (N, H, W)
+        self.d = d
+        P = N*H*W
+        device = features.device
+        f = features.permute(0, 2, 3, 1).reshape(P, d)
+
+        # elevate the features onto the hyperplane x_0 + ... + x_d = 0;
+        inv_std_dev = math.sqrt(2.0 / 3.0)*(d + 1)
+        scale = torch.tensor([inv_std_dev / math.sqrt((i + 1)*(i + 2)) for i in range(d)],
+            dtype = f.dtype, device = device)
+        cf = f*scale
+        # elevated[j] = sum_{i >= j} cf[i] - j*cf[j-1];
+        suffix = torch.flip(torch.cumsum(torch.flip(cf, [1]), 1), [1])
+        elevated = torch.cat([suffix, cf.new_zeros(P, 1)], 1)
+        elevated[:, 1:] -= cf*torch.arange(1, d + 1, dtype = f.dtype, device = device)
+
+        with torch.no_grad():
+            # the closest remainder-0 point, and the rank of each coordinate of the difference;
+            el = elevated.detach()
+            rem0 = torch.round(el / (d + 1))*(d + 1)
+            coord_sum = torch.round(rem0.sum(1) / (d + 1)).long()
+            diff = el - rem0
+            # rank[i] = #{j > i: diff_j > diff_i} + #{j < i: diff_j >= diff_i};
+            greater = diff.unsqueeze(1) > diff.unsqueeze(2)
+            greater_eq = diff.unsqueeze(1) >= diff.unsqueeze(2)
+            upper = torch.ones(d + 1, d + 1, dtype = torch.bool, device = device).triu(1)
+            rank = (greater & upper).sum(2) + (greater_eq & upper.t()).sum(2)
+            # back onto the hyperplane;
+            rank += coord_sum.unsqueeze(1)
+            under, over = rank < 0, rank > d
+            rank[under] += d + 1
+            rem0[under] += d + 1
+            rank[over] -= d + 1
+            rem0[over] -= d + 1
+
+        # barycentric weights [P, d+1];
+        v = (elevated - rem0) / (d + 1)
+        barycentric = v.new_zeros(P, d + 2)
+        barycentric = barycentric.scatter_add(1, d - rank, v).scatter_add(1, d - rank + 1, -v)
+        self.barycentric = torch.cat([barycentric[:, :1] + 1.0 + barycentric[:, d + 1:],
+            barycentric[:, 1:d + 1]], 1)
+
+        with torch.no_grad():
+            # the d+1 vertices of the simplex of each point, i.e., the keys [P, d+1, d],
+            # with the canonical simplex: canonical[r][i] = r if i <= d - r else r - (d+1);
+            r = torch.arange(d + 1, device = device).view(1, d + 1, 1)
+            rk = rank[:, :d].unsqueeze(1)
+            keys = rem0[:, :d].long().unsqueeze(1) + torch.where(rk <= d - r, r, r - (d + 1))
+            # and the sample index, so the whole batch is one lattice;
+            batch = torch.arange(N, device = device).repeat_interleave(H*W)
+            keys = torch.cat([batch.view(P, 1, 1).expand(P, d + 1, 1), keys], 2).view(-1, d + 1)
+
+            # the two neighbors of each vertex along each direction j: all the coordinates +1 (-1),
+            # but the j-th one -d (+d); the d-th direction has no stored coordinate;
+            step = torch.ones(d + 1, d, dtype = torch.long, device = device)
+            step[torch.arange(d), torch.arange(d)] = -d
+            step = torch.cat([torch.zeros(d + 1, 1, dtype = torch.long, device = device), step], 1)
+
+            # the hash table: the keys, and their neighbors, as one int64 code each (mixed radix),
+            # if they fit, since torch.unique() of rows is much slower than that of scalars;
+            lo = keys.min(0)[0] - d
+            span = (keys.max(0)[0] + d + 1 - lo).tolist()
+            radix = [1]
+            for n in span[:0:-1]:
+                radix.insert(0, radix[0]*n)
+            if radix[0]*span[0] < 2**62:
+                radix = torch.tensor(radix, device = device)
+                codes, offsets = torch.unique(((keys - lo)*radix).sum(1), return_inverse = True)
+                self.M = codes.size(0)
+                neighbors = codes.unsqueeze(0) + (step*radix).sum(1, keepdim = True)
+                neighbors = torch.cat([neighbors, 2*codes.unsqueeze(0) - neighbors], 0)
+                index = torch.searchsorted(codes, neighbors).clamp_(max = self.M - 1)
+                index[codes[index] != neighbors] = self.M
+            else:
+                unique_keys, offsets = torch.unique(keys, dim = 0, return_inverse = True)
+                self.M = unique_keys.size(0)
+                neighbors = torch.cat([unique_keys.unsqueeze(0) + step.unsqueeze(1),
+                                       unique_keys.unsqueeze(0) - step.unsqueeze(1)], 0).view(-1, d + 1)
+                ids, inverse = torch.unique(torch.cat([unique_keys, neighbors], 0), dim = 0, return_inverse = True)
+                vertex_of_id = torch.full((ids.size(0),), self.M, dtype = torch.long, device = device)
+                vertex_of_id[inverse[:self.M]] = torch.arange(self.M, device = device)
+                index = vertex_of_id[inverse[self.M:]]
+            self.offsets = offsets.view(P, d + 1)
+            # the vertex index of each neighbor, or M (a zero row) if it is not in the lattice;
+            self.neighbors = index.view(2, d + 1, self.M)
+
+    def filter(self, values):
+        """
+        args:
+            values: [N,C,H,W]
+        return:
+            the Gaussian filter of the values, not normalized, [N,C,H,W],
+            i.e., filter(values) / filter(ones) is the bilateral filter;
+        """
+        N, H, W = self.size
+        d, M = self.d, self.M
+        C = values.size(1)
+        P = N*H*W
+        v = values.permute(0, 2, 3, 1).reshape(P, 1, C)
+        # splat;
+        lattice = v.new_zeros(M + 1, C).index_add(0, self.offsets.view(-1),
+            (v*self.barycentric.unsqueeze(2)).view(-1, C))
+        # blur;
+        for j in range(d + 1):
+            lattice = torch.cat([lattice[:M] + 0.5*(lattice[self.neighbors[0, j]] + lattice[self.neighbors[1, j]]),
+                lattice[M:]], 0)
+        # slice;
+        out = torch.sum(lattice[self.offsets]*self.barycentric.unsqueeze(2), dim = 1)
+        return out.view(N, H, W, C).permute(0, 3, 1, 2)
+
+    def normalized_filter(self, values, reg_constant = 1e-20):
+        """ filter(values) / filter(ones), i.e., the bilateral filter of the values [N,C,H,W];
+            the normalizer is computed once per lattice;
+        """
+        if not hasattr(self, 'normalizer'):
+            N, H, W = self.size
+            ones = self.barycentric.new_ones(N, 1, H, W)
+            self.normalizer = self.filter(ones) + reg_constant
+        return self.filter(values) / self.normalizer
+
+
+def get_bilateral_features(embed, sigma_s, sigma_v, dilation = 1):
+    """ (y, x) / (sigma_s*dilation), and embed / sigma_v, in [N,2+F,H,W];
+        sigma_s*dilation, since the space gaussian of bilateralFilter is on the dilated offsets;
+    """
+    N, F, H, W = embed.size()
+    sigma = sigma_s*dilation
+    yy = torch.arange(H, dtype = embed.dtype, device = embed.device).view(1, 1, H, 1).expand(N, 1, H, W) / sigma
+    xx = torch.arange(W, dtype = embed.dtype, device = embed.device).view(1, 1, 1, W).expand(N, 1, H, W) / sigma
+    return torch.cat([yy, xx, embed / sigma_v], 1)
+
+
+def get_bilateral_lattice(embed_in, sigma_s, sigma_v, dilation = 1, guide_dims = 0):
+    """ the lattice of the embedding, to filter any number of inputs by its normalized_filter() """
+    if 0 < guide_dims < embed_in.size(1):
+        embed_in = pca_reduce(embed_in, guide_dims)
+    return PermutohedralLattice(get_bilateral_features(embed_in, sigma_s, sigma_v, dilation))
+
+
+def bilateral_filter_lattice(embed_in, x_in, sigma_s, sigma_v, dilation = 1, guide_dims = 0,
+        reg_constant = 1e-20):
+    """
+    the embedding bilateral filter on the permutohedral lattice;
+
+    Args:
+        embed_in (Tensor), embedding, in size [N,F,H,W]
+        x_in     (Tensor), input array, in size [N,C,H,W], e.g., the D slices of a cost volume folded into C;
+        sigma_s   (float), space gaussian std. dev., in (dilated) pixels;
+        sigma_v   (float), value gaussian std. dev.;
+        guide_dims  (int), if 0 < guide_dims < F, the embedding is first reduced to guide_dims
+                           components by PCA, see pca_reduce();
+
+    Returns:
+        result (Tensor), bilateral-filtered x_in, in size [N,C,H,W]
+    """
+    return get_bilateral_lattice(embed_in, sigma_s, sigma_v, dilation, guide_dims).normalized_filter(
+        x_in, reg_constant)
+
+
+def benchmark_bilateral_lattice(N = 1, F = 64, C = 32, H = 96, W = 192, guide_dims = 4,
+        sigma_s_list = (0.7, 1.7, 3.0, 5.0), sigma_v = 2.0, repeat = 2, device = 'cpu'):
+    """ inference time of the 'shift' brute-force window vs. the lattice, for growing sigma_s
+        (k = 2*int(3*sigma_s + 1) + 1), on the same PCA-reduced embedding;
+        the difference of the two is relative to that of the window output and its input;
+    """
+    import time
+    from .bilateral import bilateralFilter
+    embed = pca_reduce(torch.randn(N, F, H, W, device = device), guide_dims)
+    x = torch.randn(N, C, H, W, device = device)
+    def sync():
+        if device != 'cpu':
+            torch.cuda.synchronize()
+    def timeit(func):
+        func()
+        sync()
+        since = time.time()
+        for _ in range(repeat):
+            out = func()
+        sync()
+        return out, (time.time() - since) / repeat * 1000
+    with torch.no_grad():
+        for sigma_s in sigma_s_list:
+            bifilter = bilateralFilter(sigma_s, sigma_v, isCUDA = device != 'cpu', backend = 'shift')
+            ref, t_window = timeit(lambda: bifilter(embed, x))
+            out, t_lattice = timeit(lambda: bilateral_filter_lattice(embed, x, sigma_s, sigma_v))
+            rel_err = ((out - ref).norm() / (ref - x).norm()).item()
+            print ("sigma_s = {}, k = {:2d}: window {:.1f} ms, lattice {:.1f} ms, relative difference {:.3f}".format(
+                sigma_s, bifilter.k, t_window, t_lattice, rel_err))
+
+
+if __name__ == "__main__":
+    benchmark_bilateral_lattice(device = 'cpu')
+    if torch.cuda.is_available():
+        benchmark_bilateral_lattice(device = 'cuda')
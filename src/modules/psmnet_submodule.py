@@ -7,6 +7,7 @@ import torch.nn.functional as F
 import math
 import numpy as np
 from src.net_init import net_init_v0
+from src.modules.mixed_precision import keep_fp32
 
 class hourglass(nn.Module):
     def __init__(self, inplanes):
@@ -114,6 +115,7 @@ class disparityregression(nn.Module):
         self.disp = Variable(torch.Tensor(np.reshape(np.array(range(maxdisp)), [
                              1, maxdisp, 1, 1])).cuda(), requires_grad=False)
 
+    @keep_fp32
     def forward(self, x):
         disp = self.disp.repeat(x.size()[0], 1, x.size()[2], x.size()[3])
         out = torch.sum(x*disp, 1)
@@ -19,6 +19,7 @@ from ..baselines.GANet.libs.sync_bn.modules.sync_bn import BatchNorm2d, BatchNor
 from ..baselines.GANet.libs.GANet.modules.GANet import DisparityRegression
 #from ..baselines.GANet.libs.GANet.modules.GANet import GetCostVolume
 from ..baselines.GANet.libs.GANet.modules.GANet import LGA, LGA2, LGA3
+from .mixed_precision import keep_fp32
 
 ############################################
 """ adapted from GANet paper code """
@@ -307,6 +308,8 @@ class Disp(nn.Module):
 #        self.conv32x1 = BasicConv(32, 1, kernel_size=3)
         self.conv32x1 = nn.Conv3d(32, 1, (3, 3, 3), (1, 1, 1), (1, 1, 1), bias=False)
 
+    # the softmin (and LGA) and the regression in fp32, under autocast;
+    @keep_fp32
     def forward(self, x):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], 
                 mode='trilinear', align_corners=False)
@@ -333,6 +336,7 @@ class DispAgg(nn.Module):
         x = self.LGA2(x, g)
         return x
 
+    @keep_fp32
     def forward(self, x, lg1, lg2):
         x = F.interpolate(self.conv32x1(x), [self.maxdisp+1, x.size()[3]*3, x.size()[4]*3], mode='trilinear', 
                 align_corners=False)
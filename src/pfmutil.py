@@ -44,8 +44,8 @@ def load_py2(fname):
   #return np.flipud(np.reshape(data, shape)).astype(np.float32), scale
   return np.flipud(np.reshape(data, shape)).astype(np.float32)
 
-""" this file works well in Python2 & 3"""
-def readPFM(file): 
+""" the old struct-based reader, kept for the benchmark in __main__ """
+def readPFM_v0(file): 
     from struct import unpack
     with open(file, "rb") as f:
             # Line 1: PF=>RGB (3 channels), Pf=>Greyscale (1 channel)
@@ -82,9 +82,70 @@ def readPFM(file):
     return img
 
 
+def readPFM_header(f):
+    """ parse the PFM header from the binary file object f;
+        returns (height, width, channels, dtype, scale), and f is left at the payload;
+    """
+    header = f.readline().decode('latin-1').rstrip()
+    if header == 'PF':
+        channels = 3
+    elif header == 'Pf':
+        channels = 1
+    else:
+        raise Exception('Not a PFM file.')
+    # width and height, usually in one line;
+    dims = []
+    while len(dims) < 2:
+        line = f.readline()
+        if not line:
+            raise Exception('Malformed PFM header.')
+        dims += [int(i) for i in re.findall(r'\d+', line.decode('latin-1'))]
+    width, height = dims[0], dims[1]
+    # +ve scale means big endian, negative means little endian
+    scale = float(f.readline().decode('latin-1').rstrip())
+    if scale < 0:
+        dtype = np.dtype('<f4')
+        scale = -scale
+    else:
+        dtype = np.dtype('>f4')
+    return height, width, channels, dtype, scale
+
+
+""" this file works well in Python2 & 3"""
+def readPFM(file, mmap = False, contiguous = True):
+    """ read a PFM file as float32 in [H, W] or [H, W, 3];
+        mmap: if True, return a read-only np.memmap view (flipped to top-down, 
+              in the file's endianness), so slicing a crop only reads the rows of the crop;
+        contiguous: if False, return the flipped view, saving one copy;
+    """
+    with open(file, "rb") as f:
+        height, width, channels, dtype, _ = readPFM_header(f)
+        shape = (height, width, channels) if channels == 3 else (height, width)
+        if mmap:
+            img = np.memmap(file, dtype = dtype, mode = 'r', offset = f.tell(), shape = shape)
+            return img[::-1]
+        img = np.fromfile(f, dtype = dtype, count = height * width * channels)
+    if img.size != height * width * channels:
+        raise Exception('PFM file {} is truncated.'.format(file))
+    img = img.reshape(shape)[::-1]
+    if not dtype.isnative:
+        return img.astype(np.float32)
+    if contiguous:
+        img = np.ascontiguousarray(img)
+    return img
+
+
+def readPFM_batch(files, mmap = False, num_threads = 4):
+    """ read a list of PFM files concurrently, the file reading releases the GIL """
+    if num_threads <= 1 or len(files) <= 1:
+        return [readPFM(f, mmap) for f in files]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers = min(num_threads, len(files))) as executor:
+        return list(executor.map(lambda f: readPFM(f, mmap), files))
+
+
 """ this file works well in Python2 & 3"""
 def save(fname, image, scale=1):
-  file = open(fname, 'w') 
   color = None
  
   if image.dtype.name != 'float32':
@@ -97,19 +158,32 @@ def save(fname, image, scale=1):
   else:
     raise Exception('Image must have H x W x 3, H x W x 1 or H x W dimensions.')
  
-  file.write('PF\n' if color else 'Pf\n')
-  file.write('%d %d\n' % (image.shape[1], image.shape[0]))
- 
   endian = image.dtype.byteorder
- 
   if endian == '<' or endian == '=' and sys.byteorder == 'little':
     scale = -scale
  
-  file.write('%f\n' % scale)
- 
-  np.flipud(image).tofile(file)
+  with open(fname, 'wb') as file:
+    file.write(b'PF\n' if color else b'Pf\n')
+    file.write(b'%d %d\n' % (image.shape[1], image.shape[0]))
+    file.write(b'%f\n' % scale)
+    file.write(np.ascontiguousarray(image[::-1]).tobytes())
 
 
+def benchmark_readPFM(file, repeat = 20):
+    """ compare readPFM() with the old struct-based readPFM_v0() """
+    import time
+    results = {}
+    for name, func in [('readPFM_v0', readPFM_v0), ('readPFM', readPFM),
+                       ('readPFM(mmap)', lambda x: np.array(readPFM(x, mmap = True)))]:
+        func(file) # warm up the file cache;
+        since = time.time()
+        for _ in range(repeat):
+            img = func(file)
+        results[name] = (time.time() - since) / repeat
+        print ("{:>14s}: {:.3f} ms / file, shape {}".format(name, 1000.0*results[name], img.shape))
+    assert np.array_equal(readPFM_v0(file), readPFM(file)), "readPFM and readPFM_v0 do not match"
+    return results
+
 
 def show(img, title = None):
   if title is not None:
@@ -122,3 +196,14 @@ def show_uint8(img, title = None):
     plt.title(title, loc='center')
   imgplot = plt.imshow(img.astype(np.uint8))
   plt.show()
+
+
+if __name__ == "__main__":
+  # micro-benchmark, e.g., python3.7 -m src.pfmutil /data/ccjData/datasets/KITTI-2015/training/disp_occ_0_pfm/000000_10.pfm
+  import tempfile
+  if len(sys.argv) > 1:
+    pfm_file = sys.argv[1]
+  else:
+    pfm_file = os.path.join(tempfile.mkdtemp(), 'tmp.pfm')
+    save(pfm_file, np.random.rand(540, 960).astype(np.float32)*192.0)
+  benchmark_readPFM(pfm_file)